@@ -0,0 +1,531 @@
+"""ASGI entry point: async versions of the I/O-bound routes, Flask for the rest.
+
+Document downloads and the dashboard and document-list reads are served on
+the event loop. Their queries go through mysql.connector.aio, and file reads
+and decryption run on executors, so one process can keep thousands of these
+requests waiting on MySQL or disk. Every other route, and any request the
+async path cannot handle itself (legacy Fernet blobs, Flask-Session cookies,
+sessions due for renewal), is passed to the Flask app on a thread pool. URLs,
+authentication and JSON bodies are therefore the same in both modes.
+
+    uvicorn asgi:app --host 127.0.0.1 --port 8080 --workers 4
+"""
+import asyncio
+import contextvars
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs
+
+import mysql.connector
+from mysql.connector import aio as mysql_aio
+from werkzeug.http import parse_cookie, parse_if_range_header, parse_range_header
+
+import server
+from async_db_pool import AsyncConnectionPool
+from auth_tokens import decode_access_token
+from chunked_crypto import MAGIC, is_chunked, iter_decrypt_range, plaintext_size, read_header
+from config import DATABASE_CONFIG
+from db_pool import PoolTimeout
+from metrics import span, traced_iter
+from sqlite_session import SQLiteSessionInterface
+from worker_pool import PoolSaturated
+
+flask_app = server.app
+config = flask_app.config
+
+# Returned by a handler that leaves the request to the Flask app
+FALLBACK = object()
+_DONE = object()
+
+
+def get_io_executor():
+    """Create or retrieve the threads that blocking file and session work runs on."""
+    if not hasattr(get_io_executor, 'executor'):
+        get_io_executor.executor = ThreadPoolExecutor(config['ASGI_IO_THREADS'], thread_name_prefix='asgi-io')
+    return get_io_executor.executor
+
+def get_fallback_executor():
+    """Create or retrieve the threads that run the Flask app for the remaining routes."""
+    if not hasattr(get_fallback_executor, 'executor'):
+        get_fallback_executor.executor = ThreadPoolExecutor(config['ASGI_FALLBACK_THREADS'],
+                                                            thread_name_prefix='asgi-wsgi')
+    return get_fallback_executor.executor
+
+def get_async_db_pool():
+    """Create or retrieve the mysql.connector.aio connection pool of this process."""
+    if not hasattr(get_async_db_pool, 'pool'):
+        get_async_db_pool.pool = AsyncConnectionPool(
+            lambda: mysql_aio.connect(**DATABASE_CONFIG),
+            size=config['ASGI_DB_POOL_SIZE'],
+            max_overflow=config['ASGI_DB_POOL_MAX_OVERFLOW'],
+            timeout=config['DB_POOL_TIMEOUT'],
+            recycle=config['DB_POOL_RECYCLE'],
+            pre_ping=config['DB_POOL_PRE_PING'],
+        )
+    return get_async_db_pool.pool
+
+async def run_io(fn, *args):
+    # In a copy of the request's context, so that spans on the executor count towards its trace
+    return await asyncio.get_running_loop().run_in_executor(get_io_executor(), contextvars.copy_context().run,
+                                                            fn, *args)
+
+async def fetch(query, params=(), dictionary=False, one=False):
+    pool = get_async_db_pool()
+    with span('db_connect'):
+        connection, created_at = await pool.checkout()
+    try:
+        with span('db_query'):
+            cursor = await connection.cursor(buffered=True, dictionary=dictionary)
+            try:
+                await cursor.execute(query, params)
+                return await (cursor.fetchone() if one else cursor.fetchall())
+            finally:
+                await cursor.close()
+    finally:
+        await pool.release(connection, created_at)
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {k: v[0] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        self.headers = {}
+        for name, value in scope['headers']:
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            self.headers[name] = f"{self.headers[name]}, {value}" if name in self.headers else value
+        self.cookies = parse_cookie(self.headers.get('cookie', ''))
+        self.route = None
+
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None, content_type='application/json'):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        self.headers.setdefault('Content-Type', content_type)
+
+    async def send(self, send, disconnected):
+        headers = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in self.headers.items()]
+        if isinstance(self.body, bytes):
+            headers.append((b'content-length', str(len(self.body)).encode('latin-1')))
+            await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+        try:
+            # Started before the headers go out, so aclose() always runs the body's cleanup
+            chunk = await anext(self.body, b'')
+            await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+            while chunk and not disconnected.is_set():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await anext(self.body, b'')
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await self.body.aclose()
+
+
+def jsonify(body, status=200, headers=None):
+    # Same encoder as Flask's jsonify, so dates and key order match the WSGI routes
+    return Response(flask_app.json.dumps(body, separators=(',', ':')).encode('utf-8') + b'\n', status, headers)
+
+def saturated_response(error):
+    return jsonify({"success": False, "message": str(error)}, 503, {'Retry-After': str(error.retry_after)})
+
+
+async def current_user(request):
+    """Mirror of the bearer-then-session lookup in server.login_required.
+
+    Returns the user dict, None when not logged in, or FALLBACK when only the
+    Flask app can tell (or the session cookie needs renewing).
+    """
+    header = request.headers.get('authorization', '')
+    if header.startswith('Bearer '):
+        claims = decode_access_token(config['SECRET_KEY'], header[len('Bearer '):].strip())
+        if claims is not None:
+            revocations = server.get_revocations()
+            if revocations.refresh_due():
+                await run_io(revocations.refresh)
+            if not revocations.is_revoked(claims['user_id'], claims['iat'], claims.get('jti')):
+                return {
+                    'id': claims['user_id'],
+                    'email': claims.get('email'),
+                    'is_admin': claims.get('is_admin', False),
+                    'role': 'admin' if claims.get('is_admin') else 'user',
+                }
+
+    interface = flask_app.session_interface
+    sid = request.cookies.get(interface.get_cookie_name(flask_app))
+    if not sid:
+        return None
+    if not isinstance(interface, SQLiteSessionInterface):
+        return FALLBACK
+    entry = await run_io(interface.load, sid)
+    if entry is None:
+        return None
+    data, expires = entry
+    if expires - time.time() < flask_app.permanent_session_lifetime.total_seconds() / 2:
+        return FALLBACK
+    return data.get('user')
+
+
+ROUTES = []
+_route_labels = {}
+
+def route(pattern, admin=False):
+    """Register an async GET handler; path parameters are passed as ints."""
+    def decorator(handler):
+        ROUTES.append((re.compile(pattern + '$'), handler, admin))
+        return handler
+    return decorator
+
+async def dispatch(request):
+    if request.method != 'GET':
+        return FALLBACK
+    for pattern, handler, admin in ROUTES:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        request.route = pattern
+        user = await current_user(request)
+        if user is FALLBACK:
+            return FALLBACK
+        if admin:
+            if not user:
+                return jsonify({"success": False, "error": "Not logged in"}, 401)
+            if not user.get('is_admin'):
+                return jsonify({"success": False, "error": "Admin privileges required"}, 403)
+        elif not user:
+            return jsonify({'message': 'Unauthorized'}, 401)
+        return await handler(request, user, *(int(group) for group in match.groups()))
+    return FALLBACK
+
+def route_label(request):
+    """The Flask rule of a natively served request, so that metrics name routes the same in both modes."""
+    label = _route_labels.get(request.route)
+    if label is None:
+        rule, _ = flask_app.url_map.bind('localhost').match(request.path, 'GET', return_rule=True)
+        label = _route_labels[request.route] = rule.rule
+    return label
+
+
+def open_blob(file_path):
+    """Open a stored blob; returns ``(f, info, header)``, or None for a legacy Fernet blob.
+
+    Raises FileNotFoundError when the blob is missing.
+    """
+    try:
+        f, info = server.get_storage().open(server.storage_key(file_path))
+    except ValueError:
+        raise FileNotFoundError(file_path) from None
+    try:
+        if not is_chunked(f.read(len(MAGIC))):
+            f.close()
+            return None
+        f.seek(0)
+        return f, info, read_header(f)
+    except BaseException:
+        f.close()
+        raise
+
+def read_batch(chunks, f, limit):
+    """Pull at least ``limit`` plaintext bytes from ``chunks``, or the rest of them.
+
+    Returns ``(data, done)`` and closes ``f`` once the range is exhausted.
+    """
+    batch, size = [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            return b''.join(batch), False
+    f.close()
+    return b''.join(batch), True
+
+def close_blob(chunks, f):
+    chunks.close()
+    f.close()
+
+def requested_range(request, size, etag):
+    """Same resolution as server.requested_range, from raw headers."""
+    byte_range = parse_range_header(request.headers.get('range'))
+    if byte_range is None or byte_range.units != 'bytes' or len(byte_range.ranges) != 1:
+        return 0, size, False
+    if_range = parse_if_range_header(request.headers.get('if-range'))
+    if if_range.etag is not None and if_range.etag != etag:
+        return 0, size, False
+    resolved = byte_range.range_for_length(size)
+    if resolved is None:
+        return None
+    return resolved[0], resolved[1], True
+
+async def decrypted_chunks(f, data_key, header, blob_size, start, stop):
+    # Several chunks per executor hop: one hop per chunk costs more than the decryption
+    limit = config['CRYPTO_POOL_WINDOW'] * header.chunk_size
+    chunks = traced_iter(iter_decrypt_range(f, data_key, header, blob_size, start, stop,
+                                            **server.crypto_options()), 'crypto')
+    try:
+        done = False
+        while not done:
+            data, done = await run_io(read_batch, chunks, f, limit)
+            if data:
+                yield data
+    finally:
+        if not f.closed:
+            await run_io(close_blob, chunks, f)
+
+async def send_document(request, row):
+    """Async counterpart of the download routes' tail and server.send_decrypted_file."""
+    if not row:
+        return jsonify({"error": "Document not found", "success": False}, 404)
+    filename, file_path, key_version, wrapped_key = row
+    try:
+        blob = await run_io(open_blob, file_path)
+    except FileNotFoundError:
+        return jsonify({"error": "File not found on server", "success": False}, 404)
+    if blob is None:
+        # Legacy Fernet blobs are decrypted whole by the Flask route
+        return FALLBACK
+    f, info, header = blob
+    try:
+        server.get_crypto_pool().check_capacity()
+        data_key = server.blob_data_key(key_version, wrapped_key)
+        etag = f'{info.version}-{info.size:x}'
+        size = plaintext_size(header, info.size)
+        resolved = requested_range(request, size, etag)
+    except PoolSaturated as e:
+        await run_io(f.close)
+        return saturated_response(e)
+    except Exception as e:
+        await run_io(f.close)
+        return jsonify({"error": "Error processing file", "details": str(e), "success": False}, 500)
+    if resolved is None:
+        await run_io(f.close)
+        return Response(status=416, headers={'Content-Range': f'bytes */{size}'},
+                        content_type='text/html; charset=utf-8')
+    start, stop, is_partial = resolved
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Content-Length': str(stop - start),
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+    }
+    if is_partial:
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    return Response(decrypted_chunks(f, data_key, header, info.size, start, stop),
+                    206 if is_partial else 200, headers, content_type='application/octet-stream')
+
+@route(r'/user/document/(\d+)/download')
+async def download_document(request, current_user, doc_id):
+    try:
+        if current_user.get('is_admin'):
+            row = await fetch(server.DOCUMENT_BLOB_QUERY + " WHERE d.id = %s", (doc_id,), one=True)
+        else:
+            row = await fetch(server.DOCUMENT_BLOB_QUERY + " WHERE d.id = %s AND d.user_id = %s AND d.status = 'active'",
+                              (doc_id, current_user['id']), one=True)
+        return await send_document(request, row)
+    except Exception as e:
+        return jsonify({"error": str(e), "success": False}, 500)
+
+@route(r'/admin/document/(\d+)/download', admin=True)
+async def download_admin_document(request, current_user, doc_id):
+    try:
+        if not doc_id:
+            return jsonify({"error": "Invalid document ID", "success": False}, 400)
+        row = await fetch(server.DOCUMENT_BLOB_QUERY + " WHERE d.id = %s", (doc_id,), one=True)
+        return await send_document(request, row)
+    except Exception as e:
+        print(f"Error in download_admin_document: {e}")
+        return jsonify({"error": str(e), "success": False}, 500)
+
+async def read_counters():
+    return dict(await fetch("SELECT name, value FROM dashboard_counters"))
+
+@route(r'/get_dashboard_data')
+async def get_dashboard_data(request, current_user):
+    try:
+        counters = await read_counters()
+        recent_activities = await fetch("""
+            SELECT action, timestamp FROM activity_logs
+            ORDER BY timestamp DESC LIMIT 7
+        """)
+        activities = [{"action": action, "timestamp": timestamp.strftime('%Y-%m-%d %H:%M:%S')}
+                      for action, timestamp in recent_activities]
+        return jsonify({
+            "total_documents": counters.get('documents', 0),
+            "total_users": counters.get('users', 0),
+            "recent_activities": activities
+        })
+    except Exception as e:
+        print(f"Error getting dashboard data: {e}")
+        return jsonify({"message": "Failed to get dashboard data"}, 500)
+
+@route(r'/get-document-count')
+async def get_document_count(request, current_user):
+    try:
+        counters = await read_counters()
+        return jsonify({"success": True, "count": counters.get('documents', 0)})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}, 500)
+
+@route(r'/get_user_documents')
+async def get_user_documents(request, current_user):
+    try:
+        documents = await fetch("SELECT id, name, upload_date FROM documents WHERE user_id = %s AND status = 'active'",
+                                (current_user['id'],), dictionary=True)
+        return jsonify({"success": True, "documents": documents})
+    except Exception as e:
+        print(f"Error getting user documents: {e}")
+        return jsonify({"message": "Failed to get documents", "error": str(e)}, 500)
+
+@route(r'/get_documents')
+async def get_documents(request, current_user):
+    try:
+        query, params, limit = server.documents_page_query(request.args, current_user)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e), "message": "Invalid pagination parameters"}, 400)
+
+    try:
+        documents = await fetch(query, params, dictionary=True)
+
+        mode = server.total_mode(request.args)
+        if mode == 'none':
+            total = None
+        elif mode == 'approx' and current_user.get('is_admin'):
+            total = (await read_counters()).get('documents')
+        else:
+            total = (await fetch(*server.documents_count_query(current_user), one=True))[0]
+
+        return jsonify(server.documents_page(documents, limit, total))
+    except Exception as e:
+        print(f"Error getting documents: {e}")
+        return jsonify({"success": False, "error": str(e), "message": "Failed to get documents"}, 500)
+
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        if key in environ:
+            value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+        environ[key] = value
+    return environ
+
+async def call_flask(scope, receive, send, disconnected):
+    """Run the request through the Flask app on the fallback threads."""
+    loop = asyncio.get_running_loop()
+    executor = get_fallback_executor()
+    # Every step of the request runs in the same context, so its trace lasts until the body is sent
+    context = contextvars.copy_context()
+
+    # Request bodies (uploads) are spooled to disk past 1 MiB
+    body = SpooledTemporaryFile(max_size=1024 * 1024)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+        if message.get('body'):
+            await loop.run_in_executor(executor, body.write, message['body'])
+        more_body = message.get('more_body', False)
+    body.seek(0)
+    watcher = asyncio.ensure_future(wait_disconnect(receive, disconnected))
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    iterable = await loop.run_in_executor(executor, context.run, flask_app, wsgi_environ(scope, body), start_response)
+    try:
+        chunks = iter(iterable)
+        chunk = await loop.run_in_executor(executor, context.run, next, chunks, _DONE)
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        while chunk is not _DONE and not disconnected.is_set():
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(executor, context.run, next, chunks, _DONE)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(executor, context.run, iterable.close)
+        body.close()
+
+async def wait_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await run_io(server.warm_up)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await get_async_db_pool().dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    metrics = server.request_metrics
+    trace = metrics.start(scope['method'], scope['path']) if metrics is not None else None
+    disconnected = asyncio.Event()
+    request = Request(scope)
+    try:
+        response = await dispatch(request)
+    except (mysql.connector.Error, PoolTimeout) as e:
+        print(f"Error connecting to database: {e}")
+        response = jsonify({"message": "Database connection failed"}, 500)
+    if response is FALLBACK:
+        # Traced again by the Flask app, from the start of the request it is handed
+        return await call_flask(scope, receive, send, disconnected)
+
+    if trace is not None and request.route is not None:
+        trace.route = route_label(request)
+    watcher = asyncio.ensure_future(wait_disconnect(receive, disconnected))
+    try:
+        await response.send(send, disconnected)
+    finally:
+        watcher.cancel()
+        if trace is not None:
+            metrics.finish(trace, response.status)
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from db_pool import PoolTimeout
+
+
+class AsyncConnectionPool:
+    """asyncio counterpart of db_pool.ConnectionPool.
+
+    ``connect`` is a zero-argument coroutine function returning an async
+    DB-API style connection (e.g. ``mysql.connector.aio.connect``). Checkouts
+    wait on the event loop instead of blocking a thread. The pool belongs to
+    the event loop it is first used on.
+    """
+
+    def __init__(self, connect, size=10, max_overflow=40, timeout=30,
+                 recycle=3600, pre_ping=True, ping_after=30):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.ping_after = ping_after
+
+        self._idle = deque()    # (connection, created_at, last_used)
+        self._slots = None
+        self._in_use = 0
+        self._checkouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._failed_pings = 0
+        self._exhausted = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def _discard(self, raw):
+        try:
+            await raw.close()
+        except Exception:
+            pass
+
+    async def _is_healthy(self, created_at, last_used, raw):
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            self._recycled += 1
+            return False
+        if self.pre_ping and now - last_used > self.ping_after:
+            try:
+                await raw.ping(reconnect=False)
+            except Exception:
+                self._failed_pings += 1
+                return False
+        return True
+
+    async def checkout(self):
+        """Return ``(connection, created_at)``, waiting up to ``timeout`` seconds."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size + self.max_overflow)
+        started = time.monotonic()
+        if self._slots.locked():
+            self._exhausted += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"Connection pool exhausted ({self._in_use} connections in use)")
+
+        try:
+            raw = None
+            while self._idle:
+                candidate, created_at, last_used = self._idle.pop()
+                if await self._is_healthy(created_at, last_used, candidate):
+                    raw = candidate
+                    break
+                await self._discard(candidate)
+            if raw is None:
+                raw = await self._connect()
+                created_at = time.monotonic()
+                self._created += 1
+        except BaseException:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - started
+        self._in_use += 1
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        return raw, created_at
+
+    async def release(self, raw, created_at):
+        """Return a connection to the pool, rolling back any open transaction."""
+        self._in_use -= 1
+        try:
+            try:
+                await raw.rollback()
+            except Exception:
+                await self._discard(raw)
+                return
+            if len(self._idle) < self.size:
+                self._idle.append((raw, created_at, time.monotonic()))
+            else:
+                await self._discard(raw)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        raw, created_at = await self.checkout()
+        try:
+            yield raw
+        finally:
+            await self.release(raw, created_at)
+
+    async def dispose(self):
+        """Close every idle connection."""
+        idle, self._idle = self._idle, deque()
+        for raw, _, _ in idle:
+            await self._discard(raw)
+
+    def stats(self):
+        open_connections = self._in_use + len(self._idle)
+        return {
+            'size': self.size,
+            'max_overflow': self.max_overflow,
+            'open': open_connections,
+            'idle': len(self._idle),
+            'in_use': self._in_use,
+            'checkouts': self._checkouts,
+            'created': self._created,
+            'recycled': self._recycled,
+            'failed_pings': self._failed_pings,
+            'exhausted': self._exhausted,
+            'wait_seconds_total': round(self._wait_total, 6),
+            'wait_seconds_max': round(self._wait_max, 6),
+        }
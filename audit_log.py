@@ -0,0 +1,198 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+INSERT_QUERY = "INSERT INTO activity_logs (user_id, action, timestamp) VALUES (%s, %s, %s)"
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AuditLogWriter:
+    """Collects activity_logs rows in memory and writes them in multi-row batches.
+
+    A background thread flushes whenever ``batch_size`` rows are waiting or
+    ``flush_interval`` seconds have passed. Batches that cannot be written
+    (database down, queue full) are appended to a local JSON-lines spill
+    file and replayed after the next successful flush.
+    """
+
+    def __init__(self, connect, batch_size=200, flush_interval=0.5,
+                 max_queue=10000, spill_path='activity_logs.spill'):
+        self._connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+
+        self._enqueued = 0
+        self._written = 0
+        self._batches = 0
+        self._spilled = 0
+        self._replayed = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, user_id, action, timestamp=None):
+        self._ensure_started()
+        row = (user_id, action, timestamp or datetime.now())
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._spill([row])
+            return
+        self._enqueued += 1
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._flush(self._collect())
+        # Drain what arrived before close()
+        while not self._queue.empty():
+            self._flush(self._collect(block=False))
+
+    def _collect(self, block=True):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        connection = self._connect()
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(INSERT_QUERY, rows)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self._write(batch)
+        except Exception as e:
+            print(f"Error writing activity logs, spilling {len(batch)} row(s): {e}")
+            self._spill(batch)
+            return
+        elapsed = time.perf_counter() - started
+        self._written += len(batch)
+        self._batches += 1
+        self._last_flush_seconds = elapsed
+        self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+        self._replay_spill()
+
+    def _spill(self, rows):
+        lines = ''.join(
+            json.dumps([user_id, action, timestamp.strftime(TIMESTAMP_FORMAT)]) + '\n'
+            for user_id, action, timestamp in rows
+        )
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._spilled += len(rows)
+
+    def _claim_spill(self):
+        """Move the spill file (and any left by crashed workers) aside for replay.
+
+        Claiming is a rename, so each spilled row is replayed by one worker only.
+        """
+        paths = []
+        pid = os.getpid()
+        for i, path in enumerate([self.spill_path] + self._orphaned_replays(), start=1):
+            replay_path = f'{self.spill_path}.{pid}-{i}.replay'
+            try:
+                os.replace(path, replay_path)
+            except FileNotFoundError:
+                continue  # nothing spilled, or another worker picked it up
+            paths.append(replay_path)
+        return paths
+
+    def _orphaned_replays(self):
+        orphans = []
+        for path in glob.glob(glob.escape(self.spill_path) + '.*.replay'):
+            owner = path[len(self.spill_path) + 1:].split('-', 1)[0]
+            if owner.isdigit() and int(owner) != os.getpid() and not _pid_alive(int(owner)):
+                orphans.append(path)
+        return orphans
+
+    def _replay_spill(self):
+        if not os.path.exists(self.spill_path) and not self._orphaned_replays():
+            return
+        for replay_path in self._claim_spill():
+            self._replay_file(replay_path)
+
+    def _replay_file(self, replay_path):
+        with open(replay_path, encoding='utf-8') as f:
+            rows = [(user_id, action, datetime.strptime(timestamp, TIMESTAMP_FORMAT))
+                    for user_id, action, timestamp in map(json.loads, f)]
+        done = 0
+        try:
+            while done < len(rows):
+                batch = rows[done:done + self.batch_size]
+                self._write(batch)
+                done += len(batch)
+                self._replayed += len(batch)
+        except Exception as e:
+            print(f"Error replaying spilled activity logs: {e}")
+            self._spill(rows[done:])
+            self._spilled -= len(rows) - done  # already counted when first spilled
+        os.remove(replay_path)
+
+    def close(self, timeout=10):
+        """Flush everything still queued and stop the writer thread."""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'enqueued': self._enqueued,
+            'written': self._written,
+            'batches': self._batches,
+            'spilled': self._spilled,
+            'replayed': self._replayed,
+            'last_flush_seconds': round(self._last_flush_seconds, 6),
+            'max_flush_seconds': round(self._max_flush_seconds, 6),
+        }
@@ -0,0 +1,127 @@
+"""Access and refresh tokens for clients that authenticate without a session.
+
+Access tokens are short-lived HS256 JWTs checked entirely in memory. A user's
+tokens can be revoked before they expire by recording a revocation time for
+the user: any access token issued at or before it is rejected. A single
+access token, on logout, is revoked by its ``jti`` until it expires. Refresh
+tokens are opaque random strings, stored only as SHA-256 hashes, and
+single-use; the ``fam`` claim of an access token names the refresh token
+family of the login it came from.
+"""
+import hashlib
+import secrets
+import threading
+import time
+
+import jwt
+
+ALGORITHM = 'HS256'
+
+
+def mint_access_token(secret, user, lifetime, family_id=None):
+    """Return a signed access token for ``user`` (a session-style user dict)."""
+    now = int(time.time())
+    payload = {
+        'typ': 'access',
+        'jti': secrets.token_urlsafe(16),
+        'user_id': user['id'],
+        'email': user['email'],
+        'is_admin': bool(user['is_admin']),
+        'iat': now,
+        'exp': now + lifetime,
+    }
+    if family_id is not None:
+        payload['fam'] = family_id
+    return jwt.encode(payload, secret, algorithm=ALGORITHM)
+
+
+def decode_access_token(secret, token):
+    """Return the claims of a valid, unexpired access token, or None."""
+    try:
+        claims = jwt.decode(token, secret, algorithms=[ALGORITHM],
+                            options={'require': ['exp', 'iat', 'user_id']})
+    except jwt.InvalidTokenError:
+        return None
+    return claims if claims.get('typ') == 'access' else None
+
+
+def new_refresh_token():
+    """Return ``(token, token_hash)``; only the hash is ever stored."""
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+
+def hash_refresh_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class RevocationList:
+    """Per-user token revocation times and revoked token ids, kept in memory.
+
+    ``load(since)`` returns ``(user_id, revoked_at)`` pairs recorded at or
+    after ``since`` (epoch seconds), and ``load_tokens(now)`` the
+    ``(jti, expires_at)`` pairs of revoked tokens that have not expired yet.
+    They are called at most once every ``refresh_interval`` seconds, so
+    revocations made by other processes take effect within that interval.
+    Revocations older than the access-token lifetime can be forgotten, since
+    every token they affect has expired.
+    """
+
+    def __init__(self, load, token_lifetime, refresh_interval=5, load_tokens=None):
+        self._load = load
+        self._load_tokens = load_tokens
+        self.token_lifetime = token_lifetime
+        self.refresh_interval = refresh_interval
+        self._revoked = {}
+        self._revoked_tokens = {}
+        self._loaded_at = None
+        self._refreshing = threading.Lock()
+
+    def revoke(self, user_id, revoked_at=None):
+        """Record a revocation made by this process."""
+        revoked_at = int(time.time()) if revoked_at is None else revoked_at
+        self._revoked[user_id] = max(revoked_at, self._revoked.get(user_id, 0))
+
+    def revoke_token(self, jti, expires_at):
+        """Record a single token revoked by this process."""
+        self._revoked_tokens[jti] = expires_at
+
+    def is_revoked(self, user_id, issued_at, jti=None):
+        if self.refresh_due():
+            self.refresh()
+        if jti is not None and jti in self._revoked_tokens:
+            return True
+        revoked_at = self._revoked.get(user_id)
+        return revoked_at is not None and issued_at <= revoked_at
+
+    def refresh_due(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval
+
+    def refresh(self):
+        """Reload the list, unless another thread is already doing so."""
+        # One thread refreshes; the others keep using the current list
+        if not self._refreshing.acquire(blocking=False):
+            return
+        try:
+            since = int(time.time()) - self.token_lifetime
+            revoked = {user_id: revoked_at for user_id, revoked_at in self._load(since)}
+            for user_id, revoked_at in self._revoked.items():
+                if revoked_at >= since:
+                    revoked[user_id] = max(revoked_at, revoked.get(user_id, 0))
+            self._revoked = revoked
+            if self._load_tokens is not None:
+                now = int(time.time())
+                tokens = dict(self._load_tokens(now))
+                for jti, expires_at in self._revoked_tokens.items():
+                    if expires_at >= now:
+                        tokens[jti] = expires_at
+                self._revoked_tokens = tokens
+        except Exception as e:
+            print(f"Error refreshing token revocations: {e}")
+        finally:
+            self._loaded_at = time.monotonic()
+            self._refreshing.release()
+
+    def stats(self):
+        return {'revoked_users': len(self._revoked), 'revoked_tokens': len(self._revoked_tokens),
+                'refresh_interval': self.refresh_interval}
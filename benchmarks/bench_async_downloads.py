@@ -0,0 +1,124 @@
+"""Many concurrent document downloads against a running server (WSGI or ASGI mode).
+
+Opens ``--concurrency`` connections at once and downloads ``--path`` over
+each ``--rounds`` times, then reports throughput, latency percentiles and
+failures. Run it against ``python serve.py`` and ``uvicorn asgi:app`` with
+the same number of processes to compare the two modes. ``--server-pid``
+adds the CPU time and memory the server process tree used, which is
+the fairer comparison when client and server share the same cores.
+
+    python benchmarks/bench_async_downloads.py --base-url http://127.0.0.1:8080 \\
+        --email admin@example.com --password secret --role admin \\
+        --path /user/document/1/download --concurrency 1000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+try:
+    import psutil
+except ImportError:  # optional: only needed for --server-pid
+    psutil = None
+
+
+async def download(client, path, latencies, statuses):
+    t0 = time.perf_counter()
+    try:
+        received = 0
+        async with client.stream('GET', path) as response:
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+        statuses[response.status_code] += 1
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - t0)
+        return received
+    except httpx.HTTPError as e:
+        statuses[type(e).__name__] += 1
+        return 0
+
+
+def server_usage(pid):
+    """CPU seconds used so far and current RSS of ``pid`` and its children."""
+    processes = [psutil.Process(pid)]
+    processes += processes[0].children(recursive=True)
+    cpu = rss = 0
+    for process in processes:
+        try:
+            times = process.cpu_times()
+            cpu += times.user + times.system
+            rss += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return cpu, rss
+
+
+async def run(args, headers):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout, pool=None)
+    latencies, statuses = [], Counter()
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        received = 0
+        for _ in range(args.rounds):
+            results = await asyncio.gather(*(download(client, args.path, latencies, statuses)
+                                             for _ in range(args.concurrency)))
+            received += sum(results)
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, received, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--path', required=True, help='download URL the user may read')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--role', default='user', choices=['user', 'admin'])
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--server-pid', type=int, help='report CPU time and RSS of this server process tree')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+    if args.server_pid and psutil is None:
+        parser.error('--server-pid needs the psutil package')
+
+    response = httpx.post(args.base_url + '/login', timeout=60,
+                          json={'email': args.email, 'password': args.password, 'role': args.role})
+    response.raise_for_status()
+    headers = {'Authorization': f"Bearer {response.json()['token']}"}
+
+    cpu_before = server_usage(args.server_pid)[0] if args.server_pid else None
+    latencies, statuses, received, elapsed = asyncio.run(run(args, headers))
+    latencies.sort()
+    results = {
+        'concurrency': args.concurrency,
+        'downloads': len(latencies),
+        'downloads_per_second': round(len(latencies) / elapsed, 1),
+        'mb_per_second': round(received / elapsed / (1024 * 1024), 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'p99_ms': round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 1) if latencies else None,
+        'statuses': {str(k): v for k, v in statuses.items()},
+    }
+    if args.server_pid:
+        cpu_after, rss = server_usage(args.server_pid)
+        results['server_cpu_ms_per_download'] = round((cpu_after - cpu_before) * 1000 / max(len(latencies), 1), 2)
+        results['server_rss_mb'] = round(rss / (1024 * 1024), 1)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"concurrency={args.concurrency}: {results['downloads_per_second']} downloads/s "
+          f"({results['mb_per_second']} MB/s), p50 {results['p50_ms']} ms, p99 {results['p99_ms']} ms, "
+          f"statuses {results['statuses']}")
+    if args.server_pid:
+        print(f"server: {results['server_cpu_ms_per_download']} ms CPU per download, "
+              f"{results['server_rss_mb']} MB RSS")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Upload a folder's worth of files one request at a time and as one batch.
+
+Sends ``--files`` random files of ``--size`` bytes to a running server, first
+one ``/upload_document`` request after another (as the dashboards used to),
+then as one ``/upload_documents`` request, then as one ZIP ``archive``. Every
+file is unique, so nothing is deduplicated.
+
+    python benchmarks/bench_batch_upload.py --base-url http://127.0.0.1:8080 \\
+        --email user@example.com --password secret --files 50 --size 200000
+"""
+import argparse
+import io
+import json
+import os
+import time
+import zipfile
+
+import httpx
+
+
+def random_files(count, size):
+    return [(f'report-{i}-{os.urandom(4).hex()}.pdf', os.urandom(size)) for i in range(count)]
+
+
+def one_by_one(client, files):
+    for name, data in files:
+        client.post('/upload_document', files={'file': (name, data)}).raise_for_status()
+
+
+def batch(client, files):
+    response = client.post('/upload_documents', files=[('files', (name, data)) for name, data in files])
+    response.raise_for_status()
+    assert response.json()['uploaded'] == len(files), response.text
+
+
+def archive(client, files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for name, data in files:
+            zf.writestr(name, data)
+    response = client.post('/upload_documents', files={'archive': ('reports.zip', buffer.getvalue())})
+    response.raise_for_status()
+    assert response.json()['uploaded'] == len(files), response.text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--role', default='user', choices=['user', 'admin'])
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--size', type=int, default=200_000)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    response = httpx.post(args.base_url + '/login', timeout=60,
+                          json={'email': args.email, 'password': args.password, 'role': args.role})
+    response.raise_for_status()
+    headers = {'Authorization': f"Bearer {response.json()['token']}"}
+
+    results = {'files': args.files, 'size': args.size}
+    with httpx.Client(base_url=args.base_url, headers=headers, timeout=600) as client:
+        for label, upload in (('one_by_one', one_by_one), ('batch', batch), ('zip', archive)):
+            files = random_files(args.files, args.size)
+            started = time.perf_counter()
+            upload(client, files)
+            elapsed = time.perf_counter() - started
+            results[label] = {'seconds': round(elapsed, 3), 'files_per_second': round(args.files / elapsed, 1)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for label in ('one_by_one', 'batch', 'zip'):
+        print(f"{label:>10}: {results[label]['seconds']:.3f}s, {results[label]['files_per_second']} files/s")
+
+
+if __name__ == '__main__':
+    main()
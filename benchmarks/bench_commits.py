@@ -0,0 +1,178 @@
+"""Commits per request and latency of the mutation routes, before and after the unit of work.
+
+Replays the statement sequence of upload_document, delete_document and
+register as they were written before (one commit for the data change plus
+one per activity row) and as they are now (data change, counter and
+activity rows in a single transaction).
+
+By default it runs against a throw-away SQLite database with
+``synchronous=FULL``, so every commit pays an fsync like an InnoDB redo-log
+flush. ``--backend mysql`` runs the same sequences on scratch tables in the
+database from config.DATABASE_CONFIG.
+
+    python benchmarks/bench_commits.py --requests 2000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SCHEMA = [
+    "CREATE TABLE bench_documents (id INTEGER PRIMARY KEY {auto}, name VARCHAR(255), user_id INT)",
+    "CREATE TABLE bench_users (id INTEGER PRIMARY KEY {auto}, email VARCHAR(255))",
+    "CREATE TABLE bench_activity_logs (id INTEGER PRIMARY KEY {auto}, user_id INT,"
+    " action VARCHAR(255), timestamp DATETIME)",
+    "CREATE TABLE bench_counters (name VARCHAR(32) PRIMARY KEY, value BIGINT)",
+]
+
+
+def connect(backend):
+    if backend == 'sqlite':
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection, '?', 'AUTOINCREMENT'
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import mysql.connector
+    from config import DATABASE_CONFIG
+    connection = mysql.connector.connect(**DATABASE_CONFIG)
+    cursor = connection.cursor()
+    for table in ('bench_documents', 'bench_users', 'bench_activity_logs', 'bench_counters'):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    return connection, '%s', 'AUTO_INCREMENT'
+
+
+def scenarios(p):
+    log = f"INSERT INTO bench_activity_logs (user_id, action, timestamp) VALUES ({p}, {p}, {p})"
+    bump = f"UPDATE bench_counters SET value = value + {p} WHERE name = {p}"
+    add_doc = f"INSERT INTO bench_documents (name, user_id) VALUES ({p}, {p})"
+    add_user = f"INSERT INTO bench_users (email) VALUES ({p})"
+    del_doc = f"DELETE FROM bench_documents WHERE id = {p}"
+
+    def before_upload(conn, cur, i):
+        cur.execute(add_doc, (f'doc{i}.pdf', 1))
+        conn.commit()
+        cur.execute(log, (1, 'Uploaded a document', datetime.now()))
+        conn.commit()
+
+    def after_upload(conn, cur, i):
+        cur.execute(add_doc, (f'doc{i}.pdf', 1))
+        cur.execute(bump, (1, 'documents'))
+        cur.executemany(log, [(1, 'Uploaded a document', datetime.now())])
+        conn.commit()
+
+    def before_delete(conn, cur, i):
+        cur.execute(del_doc, (i,))
+        conn.commit()
+        cur.execute(log, (1, f'Deleted document with ID {i}', datetime.now()))
+        conn.commit()
+
+    def after_delete(conn, cur, i):
+        cur.execute(del_doc, (i,))
+        cur.execute(bump, (-1, 'documents'))
+        cur.executemany(log, [(1, f'Deleted document with ID {i}', datetime.now())])
+        conn.commit()
+
+    def before_register(conn, cur, i):
+        cur.execute(add_user, (f'user{i}@example.com',))
+        conn.commit()
+        cur.execute(log, (i, f'Registered new user with email user{i}@example.com', datetime.now()))
+        conn.commit()
+        cur.execute(log, (i, f'Promoted user with email user{i}@example.com to admin', datetime.now()))
+        conn.commit()
+
+    def after_register(conn, cur, i):
+        cur.execute(add_user, (f'user{i}@example.com',))
+        cur.execute(bump, (1, 'users'))
+        cur.executemany(log, [
+            (i, f'Registered new user with email user{i}@example.com', datetime.now()),
+            (i, f'Promoted user with email user{i}@example.com to admin', datetime.now()),
+        ])
+        conn.commit()
+
+    return [
+        ('upload', before_upload, after_upload),
+        ('delete', before_delete, after_delete),
+        ('register', before_register, after_register),
+    ]
+
+
+class CountingConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+        self.connection.commit()
+
+
+def run(connection, fn, requests, offset):
+    counting = CountingConnection(connection)
+    cursor = connection.cursor()
+    latencies = []
+    started = time.perf_counter()
+    for i in range(offset, offset + requests):
+        t0 = time.perf_counter()
+        fn(counting, cursor, i)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'commits_per_request': counting.commits / requests,
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        'requests_per_second': round(requests / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    connection, p, auto = connect(args.backend)
+    cursor = connection.cursor()
+    for statement in SCHEMA:
+        cursor.execute(statement.format(auto=auto))
+    cursor.execute(f"INSERT INTO bench_counters VALUES ({p}, 0)", ('documents',))
+    cursor.execute(f"INSERT INTO bench_counters VALUES ({p}, 0)", ('users',))
+    connection.commit()
+
+    results = {}
+    for name, before, after in scenarios(p):
+        # Deletes need rows to remove: seed ids for both passes
+        if name == 'delete':
+            cursor.executemany(f"INSERT INTO bench_documents (id, name, user_id) VALUES ({p}, {p}, {p})",
+                               [(10 ** 7 + i, 'seed', 1) for i in range(2 * args.requests)])
+            connection.commit()
+            offsets = (10 ** 7, 10 ** 7 + args.requests)
+        else:
+            offsets = (0, args.requests)
+        results[name] = {
+            'before': run(connection, before, args.requests, offsets[0]),
+            'after': run(connection, after, args.requests, offsets[1]),
+        }
+
+    if args.json:
+        print(json.dumps({'backend': args.backend, 'requests': args.requests, 'results': results}, indent=2))
+        return
+    print(f"backend={args.backend} requests={args.requests}")
+    print(f"{'route':<10} {'variant':<7} {'commits/req':>11} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>9}")
+    for name, variants in results.items():
+        for variant, r in variants.items():
+            print(f"{name:<10} {variant:<7} {r['commits_per_request']:>11.1f} {r['p50_ms']:>8.3f} "
+                  f"{r['p99_ms']:>8.3f} {r['requests_per_second']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Compression ratio and MB/s cost of compress-before-encrypt on the documents in uploads/.
+
+Every stored document is decrypted with the key in encryption.key and then
+re-encrypted in memory with each available codec. For each file and codec it
+reports the stored size relative to the plaintext and the end-to-end
+encrypt and decrypt throughput. It also shows which codec the upload
+heuristic would have picked.
+
+    python benchmarks/bench_compression.py
+    python benchmarks/bench_compression.py --dir /path/to/plain/files --plain
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+from chunked_crypto import derive_chunk_key, encrypt_stream, iter_decrypt, iter_plaintext  # noqa: E402
+from compression import CODEC_NAMES, CODEC_NONE, available, choose_codec, resolve_codec  # noqa: E402
+
+
+def load_documents(directory, plain):
+    fernet_key = None if plain else open(os.path.join(ROOT, 'encryption.key'), 'rb').read()
+    documents = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.endswith(('.part', '.decrypted')):
+                continue
+            with open(os.path.join(root, name), 'rb') as f:
+                if plain:
+                    data = f.read()
+                else:
+                    data = b''.join(iter_plaintext(f, derive_chunk_key(fernet_key), Fernet(fernet_key)))
+            documents.append((name, data))
+    return documents
+
+
+def measure(data, key, codec, level, repeat):
+    best_enc = best_dec = float('inf')
+    for _ in range(repeat):
+        out = io.BytesIO()
+        t0 = time.perf_counter()
+        encrypt_stream(io.BytesIO(data), out, key, codec=codec, level=level)
+        t1 = time.perf_counter()
+        for _ in iter_decrypt(io.BytesIO(out.getvalue()), key):
+            pass
+        t2 = time.perf_counter()
+        best_enc, best_dec = min(best_enc, t1 - t0), min(best_dec, t2 - t1)
+    mb = len(data) / 1e6
+    return {
+        'stored_bytes': len(out.getvalue()),
+        'ratio': round(len(out.getvalue()) / len(data), 3) if data else 1.0,
+        'encrypt_mb_s': round(mb / best_enc, 1),
+        'decrypt_mb_s': round(mb / best_dec, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'uploads'))
+    parser.add_argument('--plain', action='store_true', help='files in --dir are not encrypted')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6],
+                        help='zlib levels to try (zstd uses 3 and 19)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    key = os.urandom(32)
+    variants = [('none', CODEC_NONE, None)]
+    variants += [(f'zlib-{level}', CODEC_NAMES['zlib'], level) for level in args.levels]
+    if available(CODEC_NAMES['zstd']):
+        variants += [(f'zstd-{level}', CODEC_NAMES['zstd'], level) for level in (3, 19)]
+
+    results = []
+    totals = {name: [0, 0] for name, _, _ in variants}
+    for name, data in load_documents(args.dir, args.plain):
+        chosen = choose_codec(name, io.BytesIO(data), resolve_codec('auto'))
+        row = {'file': name, 'bytes': len(data),
+               'heuristic': next(n for n, c in CODEC_NAMES.items() if c == chosen), 'codecs': {}}
+        for variant, codec, level in variants:
+            row['codecs'][variant] = measure(data, key, codec, level, args.repeat)
+            totals[variant][0] += len(data)
+            totals[variant][1] += row['codecs'][variant]['stored_bytes']
+        results.append(row)
+
+    if args.json:
+        print(json.dumps({'results': results, 'totals': totals}, indent=2))
+        return
+    print(f"{'file':<24} {'codec':<8} {'plain':>10} {'stored':>10} {'ratio':>6} {'enc MB/s':>9} "
+          f"{'dec MB/s':>9}  heuristic")
+    for row in results:
+        for variant, r in row['codecs'].items():
+            print(f"{row['file'][:24]:<24} {variant:<8} {row['bytes']:>10} {r['stored_bytes']:>10} "
+                  f"{r['ratio']:>6.3f} {r['encrypt_mb_s']:>9.1f} {r['decrypt_mb_s']:>9.1f}  {row['heuristic']}")
+    print()
+    for variant, (plain, stored) in totals.items():
+        if plain:
+            print(f"total {variant:<8} {plain:>10} -> {stored:>10} ({stored / plain:.3f})")
+
+
+if __name__ == '__main__':
+    main()
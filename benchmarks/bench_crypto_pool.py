@@ -0,0 +1,73 @@
+"""Single-file encrypt/decrypt throughput of the chunked format on the crypto worker pool.
+
+Encrypts and decrypts one in-memory file inline and on thread and process
+pools of growing size, so you can see how throughput scales with cores on
+the machine it runs on.
+
+    python benchmarks/bench_crypto_pool.py --size-mb 256 --workers 1 2 4 8
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunked_crypto import encrypt_stream, iter_decrypt, run_inline  # noqa: E402
+from worker_pool import BoundedExecutor  # noqa: E402
+
+
+def measure(data, key, chunk_size, submit, window, repeat):
+    best_enc = best_dec = float('inf')
+    for _ in range(repeat):
+        out = io.BytesIO()
+        t0 = time.perf_counter()
+        encrypt_stream(io.BytesIO(data), out, key, chunk_size, submit=submit, window=window)
+        t1 = time.perf_counter()
+        for _ in iter_decrypt(io.BytesIO(out.getvalue()), key, submit=submit, window=window):
+            pass
+        t2 = time.perf_counter()
+        best_enc, best_dec = min(best_enc, t1 - t0), min(best_dec, t2 - t1)
+    mb = len(data) / 1e6
+    return {'encrypt_mb_s': round(mb / best_enc, 1), 'decrypt_mb_s': round(mb / best_dec, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--chunk-kb', type=int, default=64)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--window', type=int, default=8, help='chunks in flight per file')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    data = os.urandom(args.size_mb * 1024 * 1024)
+    key = os.urandom(32)
+    chunk_size = args.chunk_kb * 1024
+
+    results = [dict(kind='inline', workers=0, **measure(data, key, chunk_size, run_inline, 1, args.repeat))]
+    for kind in ('thread', 'process'):
+        for workers in sorted(set(args.workers)):
+            pool = BoundedExecutor('bench', max_workers=workers, max_queue=args.window, kind=kind)
+            try:
+                submit = lambda fn, *a: pool.submit(fn, *a, wait=True)  # noqa: E731
+                results.append(dict(kind=kind, workers=workers,
+                                    **measure(data, key, chunk_size, submit, args.window, args.repeat)))
+            finally:
+                pool.shutdown()
+
+    if args.json:
+        print(json.dumps({'cpus': os.cpu_count(), 'size_mb': args.size_mb, 'chunk_kb': args.chunk_kb,
+                          'results': results}, indent=2))
+        return
+    print(f"cpus={os.cpu_count()} size={args.size_mb} MiB chunk={args.chunk_kb} KiB window={args.window}")
+    print(f"{'kind':<8} {'workers':>7} {'encrypt MB/s':>13} {'decrypt MB/s':>13}")
+    for r in results:
+        print(f"{r['kind']:<8} {r['workers']:>7} {r['encrypt_mb_s']:>13.1f} {r['decrypt_mb_s']:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Overhead of the request metrics (metrics.py), with METRICS_ENABLED on and off.
+
+Measures, without a database:
+
+- ``span``: cost of one ``with span(...)`` outside a traced request (what
+  every span costs with metrics disabled) and inside one
+- ``middleware``: µs per request added by MetricsMiddleware and recording
+  the request's histograms, around a WSGI app that does nothing
+- ``decrypt``: MB/s of streaming a ``--size`` MiB blob through
+  iter_decrypt_range, plain and with its reads and chunks traced as a
+  download does
+- ``requests``: µs per request through the Flask app (test client) for a
+  JSON route and a static file, in fresh processes with DMS_METRICS=0 and 1
+  (best of ``--rounds``)
+
+    python benchmarks/bench_instrumentation.py
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chunked_crypto import encrypt_stream, iter_decrypt_range, plaintext_size, read_header  # noqa: E402
+from metrics import MetricsMiddleware, RequestMetrics, span, traced_file, traced_iter  # noqa: E402
+
+KEY = b'k' * 32
+ROUTES = [('POST', '/logout'), ('GET', '/')]
+
+
+def time_spans(n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        with span('crypto'):
+            pass
+    disabled = time.perf_counter() - t0
+
+    metrics = RequestMetrics((1,))
+    trace = metrics.start('GET', '/')
+    t0 = time.perf_counter()
+    for _ in range(n):
+        with span('crypto'):
+            pass
+    enabled = time.perf_counter() - t0
+    metrics.finish(trace, 200)
+    return {'disabled_ns': round(disabled / n * 1e9), 'enabled_ns': round(enabled / n * 1e9)}
+
+
+def empty_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'']
+
+
+def time_middleware(n, rounds):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}
+    traced_app = MetricsMiddleware(empty_app, RequestMetrics((0.01, 0.1, 1)))
+    results = {}
+    for name, app in (('plain', empty_app), ('traced', traced_app)):
+        best = float('inf')
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                body = app(environ, lambda status, headers, exc_info=None: None)
+                for _ in body:
+                    pass
+                if hasattr(body, 'close'):
+                    body.close()
+            best = min(best, time.perf_counter() - t0)
+        results[name] = best / n * 1e6
+    return {'added_us': round(results['traced'] - results['plain'], 2)}
+
+
+def decrypt(blob, traced):
+    f = io.BytesIO(blob)
+    if traced:
+        f = traced_file(f)
+    header = read_header(f)
+    size = plaintext_size(header, len(blob))
+    chunks = iter_decrypt_range(f, KEY, header, len(blob), 0, size)
+    if traced:
+        chunks = traced_iter(chunks, 'crypto')
+    t0 = time.perf_counter()
+    for _ in chunks:
+        pass
+    return size / 1e6 / (time.perf_counter() - t0)
+
+
+def time_decrypt(size, rounds):
+    out = io.BytesIO()
+    encrypt_stream(io.BytesIO(os.urandom(size)), out, KEY)
+    blob = out.getvalue()
+    metrics = RequestMetrics((1,))
+    results = {'plain_mb_per_second': 0.0, 'traced_mb_per_second': 0.0}
+    for _ in range(rounds):
+        results['plain_mb_per_second'] = max(results['plain_mb_per_second'], decrypt(blob, False))
+        trace = metrics.start('GET', '/')
+        results['traced_mb_per_second'] = max(results['traced_mb_per_second'], decrypt(blob, True))
+        metrics.finish(trace, 200)
+    return {name: round(value, 1) for name, value in results.items()}
+
+
+def child(n, rounds):
+    """Run inside a fresh process, with DMS_METRICS set by the parent."""
+    import server
+    client = server.app.test_client()
+    results = {}
+    for method, path in ROUTES:
+        for _ in range(min(n, 500)):
+            client.open(path, method=method).close()
+        best = float('inf')
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                client.open(path, method=method).close()
+            best = min(best, time.perf_counter() - t0)
+        results[f'{method} {path}'] = round(best / n * 1e6, 1)
+    print(json.dumps(results))
+
+
+def time_requests(n, rounds):
+    results = {}
+    for enabled in ('0', '1'):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--requests', str(n),
+                                 '--rounds', str(rounds)],
+                                cwd=ROOT, env={**os.environ, 'DMS_METRICS': enabled, 'PYTHONPATH': ROOT},
+                                check=True, capture_output=True, text=True).stdout
+        results['enabled' if enabled == '1' else 'disabled'] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spans', type=int, default=1_000_000)
+    parser.add_argument('--size', type=int, default=64, help='blob size in MiB for the decrypt pass')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=5000, help='requests per round')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.requests, args.rounds)
+        return
+
+    results = {
+        'span': time_spans(args.spans),
+        'middleware': time_middleware(args.requests, args.rounds),
+        'decrypt': time_decrypt(args.size * 1024 * 1024, args.rounds),
+        'requests_us': time_requests(args.requests, args.rounds),
+        'cpus': os.cpu_count(),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"span: {results['span']['disabled_ns']} ns disabled, {results['span']['enabled_ns']} ns in a traced request")
+    print(f"middleware: {results['middleware']['added_us']} µs added per request")
+    print(f"decrypt {args.size} MiB: {results['decrypt']['plain_mb_per_second']} MB/s plain, "
+          f"{results['decrypt']['traced_mb_per_second']} MB/s traced")
+    for route in results['requests_us']['disabled']:
+        print(f"{route}: {results['requests_us']['disabled'][route]} µs/request disabled, "
+              f"{results['requests_us']['enabled'][route]} µs/request enabled")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Throughput of the integrity scanner over a large local corpus of encrypted blobs.
+
+Builds (or reuses) ``--files`` chunked blobs of ``--size`` plaintext bytes
+under ``--dir``, laid out like the content-addressed store, then times:
+
+- ``walk``: listing and stat-ing every object, which is all an incremental
+  scan does for objects that have not changed (database time not included)
+- ``verify``: authenticating every blob on process pools of each
+  ``--workers`` size, as `flask scan-integrity --full` does
+- ``decrypt``: decrypting every blob on one worker, for comparison
+
+    python benchmarks/bench_integrity_scan.py --dir /var/tmp/dms-scan --files 1000000 --workers 1 2 4 8
+
+The corpus is left in place for later runs. Numbers are with a warm page cache
+unless caches are dropped between runs.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_store import blob_key  # noqa: E402
+from chunked_crypto import encrypt_stream, iter_decrypt  # noqa: E402
+from integrity import STATUS_OK, check_object, init_worker  # noqa: E402
+from storage import LocalStorage  # noqa: E402
+
+KEY = b'k' * 32
+FERNET_KEY = b'a' * 43 + b'='
+_storage = None
+
+
+def build(args):
+    root, start, stop, size = args
+    storage = LocalStorage(root)
+    for i in range(start, stop):
+        key = blob_key(f'{i:064x}', 2)
+        if not os.path.exists(storage.path(key)):
+            with storage.writer(key) as f:
+                encrypt_stream(io.BytesIO(os.urandom(size)), f, KEY)
+    return stop - start
+
+
+def decrypt_object(key):
+    f, _ = _storage.open(key)
+    with f:
+        for _ in iter_decrypt(f, KEY):
+            pass
+    return key
+
+
+def init_decrypt(root):
+    global _storage
+    _storage = LocalStorage(root)
+
+
+def pool(workers, initializer, initargs):
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=initializer, initargs=initargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', required=True, help='corpus directory (created if missing)')
+    parser.add_argument('--files', type=int, default=1_000_000)
+    parser.add_argument('--size', type=int, default=4096, help='plaintext bytes per blob')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--skip-decrypt', action='store_true')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    storage = LocalStorage(args.dir)
+    started = time.perf_counter()
+    step = 10_000
+    ranges = [(args.dir, i, min(i + step, args.files), args.size) for i in range(0, args.files, step)]
+    with pool(max(args.workers), None, ()) as builders:
+        built = sum(builders.map(build, ranges))
+    print(f"corpus: {built} blobs ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    results = {'files': args.files, 'size': args.size, 'cpus': os.cpu_count()}
+    t0 = time.perf_counter()
+    objects = list(storage.objects())
+    elapsed = time.perf_counter() - t0
+    keys = [key for key, _ in objects]
+    total_bytes = sum(info.size for _, info in objects)
+    results['walk'] = {'seconds': round(elapsed, 2), 'objects_per_second': round(len(keys) / elapsed)}
+
+    results['verify'] = {}
+    for workers in args.workers:
+        with pool(workers, init_worker, (storage, KEY, FERNET_KEY)) as verifiers:
+            t0 = time.perf_counter()
+            failed = sum(status != STATUS_OK for _, status, _ in verifiers.map(check_object, keys, chunksize=256))
+            elapsed = time.perf_counter() - t0
+        results['verify'][workers] = {'seconds': round(elapsed, 2), 'objects_per_second': round(len(keys) / elapsed),
+                                      'mb_per_second': round(total_bytes / 1e6 / elapsed, 1), 'failed': failed}
+
+    if not args.skip_decrypt:
+        with pool(1, init_decrypt, (args.dir,)) as decrypters:
+            t0 = time.perf_counter()
+            for _ in decrypters.map(decrypt_object, keys, chunksize=256):
+                pass
+            elapsed = time.perf_counter() - t0
+        results['decrypt'] = {'seconds': round(elapsed, 2), 'objects_per_second': round(len(keys) / elapsed),
+                              'mb_per_second': round(total_bytes / 1e6 / elapsed, 1)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"walk: {results['walk']['objects_per_second']} objects/s ({results['walk']['seconds']}s)")
+    for workers, row in results['verify'].items():
+        print(f"verify, {workers} worker(s): {row['objects_per_second']} objects/s, {row['mb_per_second']} MB/s "
+              f"({row['seconds']}s, {row['failed']} failed)")
+    if 'decrypt' in results:
+        row = results['decrypt']
+        print(f"decrypt, 1 worker: {row['objects_per_second']} objects/s, {row['mb_per_second']} MB/s "
+              f"({row['seconds']}s)")
+
+
+if __name__ == '__main__':
+    main()
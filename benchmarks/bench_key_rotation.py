@@ -0,0 +1,54 @@
+"""Cost of re-wrapping data keys during `flask rewrap-data-keys`, without the database.
+
+Wraps ``--keys`` random data keys under master key version 1, then times
+unwrapping each under version 1 and wrapping it under version 2, as the
+rotation does per row. It also times building the parameters of one batch
+UPDATE per ``--batch`` keys. The database round trips (one SELECT and one
+UPDATE per batch) come on top.
+
+    python benchmarks/bench_key_rotation.py --keys 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envelope import MasterKeyring, create_first_master_key, new_data_key  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=1_000_000)
+    parser.add_argument('--batch', type=int, default=1000, help='rows per UPDATE, as KEY_ROTATION_BATCH')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        create_first_master_key(directory)
+        keyring = MasterKeyring(directory)
+        rows = [(f'{i:064x}', *keyring.wrap(new_data_key())) for i in range(args.keys)]
+        current = keyring.add()
+
+        t0 = time.perf_counter()
+        for start in range(0, len(rows), args.batch):
+            params = []
+            for digest, key_version, wrapped_key in rows[start:start + args.batch]:
+                _, new_wrapped = keyring.wrap(keyring.unwrap(key_version, wrapped_key), current)
+                params += [digest, new_wrapped, key_version]
+        elapsed = time.perf_counter() - t0
+
+    results = {'keys': args.keys, 'batch': args.batch, 'seconds': round(elapsed, 2),
+               'keys_per_second': round(args.keys / elapsed), 'cpus': os.cpu_count()}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"re-wrapped {args.keys} data keys in {results['seconds']}s "
+          f"({results['keys_per_second']} keys/s, {args.keys // args.batch or 1} batches)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Requests per second and latency of a running server under concurrent load.
+
+Point it at the development server (``python server.py``) and at
+``python serve.py`` in turn to compare them. ``--email``/``--password`` log
+in first and send the access token with every request.
+
+    python benchmarks/bench_serve.py --base-url http://127.0.0.1:8080 --path /get_admin_name \\
+        --email admin@example.com --password secret --role admin --concurrency 32 --seconds 20
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+
+def client_loop(base_url, path, headers, stop, latencies, statuses):
+    with httpx.Client(base_url=base_url, headers=headers, timeout=60) as client:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                response = client.get(path)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            elapsed = time.perf_counter() - t0
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                latencies.append(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--path', default='/get_admin_name')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--role', default='admin', choices=['user', 'admin'])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    headers = {}
+    if args.email:
+        response = httpx.post(args.base_url + '/login', timeout=60,
+                              json={'email': args.email, 'password': args.password, 'role': args.role})
+        response.raise_for_status()
+        headers['Authorization'] = f"Bearer {response.json()['token']}"
+
+    stop = threading.Event()
+    latencies, statuses = [], Counter()
+    threads = [threading.Thread(target=client_loop, args=(args.base_url, args.path, headers, stop, latencies, statuses))
+               for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    results = {
+        'concurrency': args.concurrency,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        'p99_ms': round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 2) if latencies else None,
+        'statuses': {str(k): v for k, v in statuses.items()},
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.base_url}{args.path} concurrency={args.concurrency}: {results['requests_per_second']} req/s, "
+          f"p50 {results['p50_ms']} ms, p99 {results['p99_ms']} ms, statuses {results['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Per-request session load/save cost: Flask-Session filesystem backend vs sqlite_session.
+
+Creates ``--sessions`` logged-in sessions in each backend, then replays
+requests for random session ids. Only the session interface's
+open_session/save_session calls are timed. Two workloads are run:
+
+- ``read``: the session is only read (every authenticated request).
+- ``write``: the session is modified (login-like).
+
+    python benchmarks/bench_sessions.py --sessions 5000 --requests 20000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request  # noqa: E402
+from flask_session.filesystem import FileSystemSessionInterface  # noqa: E402
+
+from sqlite_session import SQLiteSessionInterface  # noqa: E402
+
+USER = {'id': 1, 'email': 'user@example.com', 'role': 'user', 'is_admin': False}
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='bench', SESSION_PERMANENT=False, PERMANENT_SESSION_LIFETIME=3600)
+    return app
+
+
+def backends(workdir, sessions):
+    app = make_app()
+    yield 'filesystem', app, FileSystemSessionInterface(
+        app, permanent=False, cache_dir=os.path.join(workdir, 'flask_session'),
+        threshold=sessions * 2)
+    app = make_app()
+    yield 'sqlite', app, SQLiteSessionInterface(os.path.join(workdir, 'sessions.sqlite3'),
+                                                sweep_interval=0, permanent=False)
+
+
+def round_trip(app, interface, sid, modify):
+    headers = {'Cookie': f'session={sid}'} if sid else {}
+    with app.test_request_context(headers=headers):
+        t0 = time.perf_counter()
+        session = interface.open_session(app, request)
+        user = session.get('user')
+        if modify or user is None:
+            session['user'] = dict(USER, seen=time.time())
+        response = app.response_class()
+        interface.save_session(app, session, response)
+        elapsed = time.perf_counter() - t0
+    cookie = response.headers.get('Set-Cookie')
+    return elapsed, cookie.split(';', 1)[0].split('=', 1)[1] if cookie else sid
+
+
+def run(app, interface, sids, requests, modify):
+    latencies = []
+    for _ in range(requests):
+        elapsed, _ = round_trip(app, interface, random.choice(sids), modify)
+        latencies.append(elapsed)
+    latencies.sort()
+    return {
+        'p50_us': round(statistics.median(latencies) * 1e6, 1),
+        'p99_us': round(latencies[int(len(latencies) * 0.99) - 1] * 1e6, 1),
+        'ops_per_second': round(len(latencies) / sum(latencies), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    results = {}
+    try:
+        for name, app, interface in backends(workdir, args.sessions):
+            sids = [round_trip(app, interface, None, True)[1] for _ in range(args.sessions)]
+            results[name] = {
+                'read': run(app, interface, sids, args.requests, modify=False),
+                'write': run(app, interface, sids, args.requests, modify=True),
+            }
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.json:
+        print(json.dumps({'sessions': args.sessions, 'requests': args.requests, 'results': results}, indent=2))
+        return
+    print(f"sessions={args.sessions} requests={args.requests}")
+    print(f"{'backend':<11} {'workload':<8} {'p50 us':>8} {'p99 us':>9} {'ops/s':>10}")
+    for name, workloads in results.items():
+        for workload, r in workloads.items():
+            print(f"{name:<11} {workload:<8} {r['p50_us']:>8.1f} {r['p99_us']:>9.1f} {r['ops_per_second']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
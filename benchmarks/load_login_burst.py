@@ -0,0 +1,124 @@
+"""Download latency of a running server before and during a burst of concurrent logins.
+
+Logs in once to get a bearer token, then downloads one document in a loop:
+first on its own (baseline), then while ``--logins`` logins are fired from
+``--concurrency`` threads. With password hashing on its own capped pool the
+download latency should stay close to the baseline; excess logins are
+answered with 503 + Retry-After instead of piling up.
+
+    python benchmarks/load_login_burst.py --base-url http://127.0.0.1:8080 \\
+        --email admin@example.com --password secret --role admin \\
+        --download /user/document/1/download --logins 200 --concurrency 50
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+
+def summarize(latencies):
+    if not latencies:
+        return {'requests': 0}
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p99_ms': round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 1),
+        'max_ms': round(latencies[-1] * 1000, 1),
+    }
+
+
+def download_loop(client, path, token, stop, latencies, errors):
+    headers = {'Authorization': f'Bearer {token}'}
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        response = client.get(path, headers=headers)
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - t0)
+        else:
+            errors[response.status_code] += 1
+
+
+def measure_downloads(base_url, path, token, seconds, during=None):
+    stop = threading.Event()
+    latencies, errors = [], Counter()
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        thread = threading.Thread(target=download_loop, args=(client, path, token, stop, latencies, errors))
+        thread.start()
+        started = time.perf_counter()
+        extra = during() if during else None
+        remaining = seconds - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+        stop.set()
+        thread.join()
+    return summarize(latencies), dict(errors), extra
+
+
+def login_burst(base_url, credentials, logins, concurrency):
+    statuses = Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def one(_):
+        with httpx.Client(base_url=base_url, timeout=120) as client:
+            t0 = time.perf_counter()
+            response = client.post('/login', json=credentials)
+            elapsed = time.perf_counter() - t0
+        with lock:
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(logins)))
+    elapsed = time.perf_counter() - started
+    return {'statuses': dict(statuses), 'seconds': round(elapsed, 2),
+            'logins_per_second': round(statuses[200] / elapsed, 1), 'latency': summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--role', default='user', choices=['user', 'admin'])
+    parser.add_argument('--download', required=True, help='path of a document download the user may read')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--baseline-seconds', type=float, default=5)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    credentials = {'email': args.email, 'password': args.password, 'role': args.role}
+    with httpx.Client(base_url=args.base_url, timeout=60) as client:
+        response = client.post('/login', json=credentials)
+        response.raise_for_status()
+        token = response.json()['token']
+
+    baseline, baseline_errors, _ = measure_downloads(args.base_url, args.download, token, args.baseline_seconds)
+    burst, burst_errors, logins = measure_downloads(
+        args.base_url, args.download, token, 0,
+        during=lambda: login_burst(args.base_url, credentials, args.logins, args.concurrency))
+
+    results = {'baseline': baseline, 'during_burst': burst, 'logins': logins,
+               'download_errors': {'baseline': baseline_errors, 'during_burst': burst_errors}}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"downloads   {'requests':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, r in (('baseline', baseline), ('burst', burst)):
+        print(f"{name:<11} {r['requests']:>8} {r.get('p50_ms', 0):>8.1f} {r.get('p99_ms', 0):>8.1f} "
+              f"{r.get('max_ms', 0):>8.1f}")
+    print(f"logins: {logins['statuses']} in {logins['seconds']}s ({logins['logins_per_second']}/s), "
+          f"p50 {logins['latency'].get('p50_ms')} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,594 @@
+"""End-to-end load test: seed a scratch database, boot the app and drive its endpoints.
+
+1. setup: recreate the MySQL/MariaDB database ``--database`` (never the
+   application's own) from ``migrations/*.sql``
+2. seed: ``--users`` users, ``--documents`` documents between ``--min-size``
+   and ``--max-size`` (log-uniform, so most are small) and ``--activity``
+   activity log rows, encrypted into ``--upload-folder``
+3. boot: ``serve.py`` (or ``uvicorn asgi:app`` with ``--mode asgi``) pointed at
+   them through ``DMS_DATABASE`` and ``DMS_UPLOAD_FOLDER``
+4. drive: login, upload, download, list, search and dashboard, each on its
+   own for ``--duration`` seconds and then all mixed by ``--mix`` weights,
+   from ``--concurrency`` clients
+5. report: requests/s, p50/p99 latency, errors and peak server RSS per
+   endpoint as JSON (``--output``). ``--baseline`` compares against an
+   earlier result and exits 1 if anything regressed by more than ``--tolerance``.
+
+    python benchmarks/load_suite.py --users 1000 --documents 2000 --max-size 1G \\
+        --activity 1000000 --output results.json --baseline baseline.json
+
+``--base-url`` skips steps 1-3 and drives an already running server; give
+it ``--email``/``--password`` of an admin and ``--server-pid`` for RSS.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+try:
+    import psutil
+except ImportError:  # optional: only needed for peak RSS
+    psutil = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENDPOINTS = ('login', 'upload', 'download', 'list', 'search', 'dashboard')
+DEFAULT_MIX = 'login=1,upload=1,download=4,list=4,search=2,dashboard=4'
+BENCH_PASSWORD = 'bench-password'
+ADMIN_EMAIL = 'admin@bench.local'
+EXTENSIONS = ('.pdf', '.docx', '.png', '.zip', '.txt', '.csv', '.json')
+TEXT_EXTENSIONS = ('.txt', '.csv', '.json')
+TEXT_MAX_SIZE = 64 << 20    # larger "text" documents would take long to generate
+WORDS = ('quarterly', 'report', 'invoice', 'contract', 'policy', 'draft', 'final', 'budget',
+         'review', 'meeting', 'notes', 'summary', 'customer', 'account', 'payment', 'project')
+ACTIONS = ('logged in as user', 'logged in as admin', 'Uploaded a document', 'Deleted document {n}',
+           'Deleted document with ID {n}', 'Registered new user with email user{n}@bench.local',
+           'Admin deleted document {n}', 'Activated user with ID {n}')
+SEARCH_TERMS = ('uploaded', 'deleted document', 'logged in', 'registered', 'admin')
+BATCH_SIZE = 10000
+
+
+def parse_size(text):
+    """'512', '64K', '16M', '1G' -> bytes."""
+    text = text.strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_mix(text):
+    weights = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r} (expected one of {', '.join(ENDPOINTS)})")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class SyntheticFile:
+    """Seekable, repeatable file-like content of ``size`` bytes generated a block at a time."""
+
+    BLOCK = 1 << 20
+
+    def __init__(self, size, seed, text=False):
+        self.size = size
+        self.seed = seed
+        self.text = text
+        self._pos = 0
+        self._cached = (None, b'')
+
+    def _block(self, index):
+        if self._cached[0] != index:
+            rng = random.Random(self.seed * 1_000_003 + index)
+            length = min(self.BLOCK, self.size - index * self.BLOCK)
+            if self.text:
+                data = ' '.join(rng.choices(WORDS, k=length // 6 + 1)).encode()[:length]
+            else:
+                data = rng.randbytes(length)
+            self._cached = (index, data)
+        return self._cached[1]
+
+    def read(self, n=-1):
+        end = self.size if n is None or n < 0 else min(self.size, self._pos + n)
+        parts = []
+        while self._pos < end:
+            index, offset = divmod(self._pos, self.BLOCK)
+            part = self._block(index)[offset:offset + end - self._pos]
+            parts.append(part)
+            self._pos += len(part)
+        return b''.join(parts)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def log_uniform(rng, low, high):
+    return int(math.exp(rng.uniform(math.log(low), math.log(high))))
+
+
+def sql_statements(path):
+    """The statements of a migration file, without comments."""
+    with open(path) as f:
+        lines = [line for line in f if not line.lstrip().startswith('--')]
+    return [statement.strip() for statement in ''.join(lines).split(';') if statement.strip()]
+
+
+def database_config(args):
+    from config import DATABASE_CONFIG
+    return dict(DATABASE_CONFIG, database=args.database)
+
+
+def create_database(args):
+    """Drop and recreate the scratch database and apply every migration."""
+    import mysql.connector
+    config = database_config(args)
+    server_config = {k: v for k, v in config.items() if k != 'database'}
+    connection = mysql.connector.connect(**server_config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+        cursor.execute(f"CREATE DATABASE `{args.database}`")
+        cursor.execute(f"USE `{args.database}`")
+        for path in sorted(glob.glob(os.path.join(ROOT, 'migrations', '*.sql'))):
+            for statement in sql_statements(path):
+                cursor.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def drop_database(args):
+    import mysql.connector
+    config = database_config(args)
+    connection = mysql.connector.connect(**{k: v for k, v in config.items() if k != 'database'})
+    try:
+        connection.cursor().execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+    finally:
+        connection.close()
+
+
+def insert_batches(connection, query, rows):
+    cursor = connection.cursor()
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(query, rows[start:start + BATCH_SIZE])
+        connection.commit()
+
+
+def seed(args):
+    """Fill the scratch database and upload folder; return what was created."""
+    import mysql.connector
+    import server  # picks up DMS_DATABASE / DMS_UPLOAD_FOLDER from the environment
+    from blob_store import content_hash
+    from envelope import create_first_master_key, new_data_key
+    from passwords import hash_password
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    # As `flask init-master-key` would; the servers booted below (from ROOT) refuse to start without a key
+    server.app.config['MASTER_KEY_DIR'] = os.path.join(ROOT, server.app.config['MASTER_KEY_DIR'])
+    create_first_master_key(server.app.config['MASTER_KEY_DIR'])
+    connection = mysql.connector.connect(**database_config(args))
+    try:
+        # One hash for everybody: hashing a million passwords would dominate the setup
+        password = hash_password(BENCH_PASSWORD, *server.password_hash_options())
+        users = [(ADMIN_EMAIL, password, 'admin', True, True)]
+        users += [(f'user{i}@bench.local', password, 'user', True, False) for i in range(1, args.users)]
+        insert_batches(connection, """
+            INSERT INTO users (email, password, role, is_active, is_admin) VALUES (%s, %s, %s, %s, %s)
+        """, users)
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM users ORDER BY id")
+        user_ids = [row[0] for row in cursor.fetchall()]
+
+        now = datetime.now()
+        blobs, documents, total_bytes = {}, [], 0
+        for i in range(args.documents):
+            size = log_uniform(rng, args.min_size, args.max_size)
+            extension = rng.choice(EXTENSIONS)
+            name = f'bench-{i}{extension}'
+            src = SyntheticFile(size, args.seed * 1_000_003 + i, text=extension in TEXT_EXTENSIONS and size <= TEXT_MAX_SIZE)
+            digest, _ = content_hash(src, server.get_hash_key())
+            key = server.content_key(digest)
+            if digest not in blobs:
+                data_key = new_data_key()
+                key_version, wrapped_key = server.get_keyring().wrap(data_key)
+                src.seek(0)
+                server.store_encrypted(src, key, server.upload_codec(name, src), data_key)
+                blobs[digest] = (size, key_version, wrapped_key)
+            uploaded = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            documents.append((name, key, uploaded, rng.choice(user_ids), 'active', digest))
+            total_bytes += size
+            if (i + 1) % 100 == 0:
+                print(f"  {i + 1}/{args.documents} documents, {total_bytes / (1 << 20):.0f} MiB", flush=True)
+        insert_batches(connection, """
+            INSERT INTO blobs (content_hash, size, ref_count, key_version, wrapped_key) VALUES (%s, %s, 0, %s, %s)
+        """, [(digest, *blob) for digest, blob in blobs.items()])
+        insert_batches(connection, """
+            INSERT INTO documents (name, file_path, upload_date, user_id, status, content_hash)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, documents)
+
+        for start in range(0, args.activity, BATCH_SIZE):
+            rows = [(rng.choice(user_ids), rng.choice(ACTIONS).format(n=rng.randrange(1, 100000)),
+                     now - timedelta(seconds=rng.randrange(365 * 24 * 3600)))
+                    for _ in range(min(BATCH_SIZE, args.activity - start))]
+            connection.cursor().executemany(
+                "INSERT INTO activity_logs (user_id, action, timestamp) VALUES (%s, %s, %s)", rows)
+            connection.commit()
+    finally:
+        connection.close()
+
+    # Dashboard counters and blob reference counts, the same way an operator would fix them
+    result = server.app.test_cli_runner().invoke(args=['recount'])
+    if result.exit_code != 0:
+        raise RuntimeError(f"recount failed: {result.output}")
+    return {
+        'users': len(users),
+        'documents': len(documents),
+        'document_bytes': total_bytes,
+        'blobs': len(blobs),
+        'activity_rows': args.activity,
+        'seed_seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def boot(args):
+    """Start the server in a child process and wait until it answers."""
+    if args.mode == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', args.host, '--port', str(args.port),
+                   '--log-level', 'warning']
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'serve.py'), '--host', args.host, '--port', str(args.port)]
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+    process = subprocess.Popen(command, cwd=ROOT, env=os.environ.copy())
+    base_url = f'http://{args.host}:{args.port}'
+    deadline = time.monotonic() + args.boot_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            httpx.get(base_url + '/', timeout=1)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"server did not answer within {args.boot_timeout}s")
+
+
+def server_rss(pid):
+    """Current RSS in bytes of ``pid`` and its children."""
+    processes = [psutil.Process(pid)]
+    processes += processes[0].children(recursive=True)
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss
+
+
+class RSSSampler(threading.Thread):
+    """Track the peak RSS of the server process tree, ten times a second."""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.1):
+            try:
+                self.peak = max(self.peak, server_rss(self.pid))
+            except psutil.NoSuchProcess:
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return round(self.peak / (1 << 20), 1)
+
+
+class Workload:
+    """The requests each endpoint sends, against a set of known documents and users."""
+
+    def __init__(self, args, base_url, email, password):
+        self.args = args
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            self.token = self.login(client, email, password, 'admin')
+        self.document_ids = self.discover_documents()
+        if not self.document_ids:
+            raise RuntimeError("no documents to download; seed some first")
+        # Uploads start from shared random data; a per-request prefix makes every blob new
+        self.upload_data = random.Random(args.seed).randbytes(args.upload_size)
+
+    def login(self, client, email, password, role):
+        response = client.post('/login', json={'email': email, 'password': password, 'role': role})
+        response.raise_for_status()
+        return response.json()['token']
+
+    def discover_documents(self):
+        ids, cursor = [], None
+        with httpx.Client(base_url=self.base_url, headers=self.headers(), timeout=60) as client:
+            while len(ids) < self.args.max_documents:
+                params = {'limit': 100, 'total': 'none'}
+                if cursor:
+                    params['cursor'] = cursor
+                page = client.get('/get_documents', params=params).json()
+                ids += [doc['id'] for doc in page.get('documents', [])]
+                cursor = page.get('next_cursor')
+                if not cursor:
+                    break
+        return ids
+
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def request(self, name, client, rng):
+        """Send one ``name`` request; return the response status."""
+        if name == 'login':
+            if self.args.base_url or self.args.users < 2 or rng.random() < 0.1:
+                body = {'email': self.email, 'password': self.password, 'role': 'admin'}
+            else:
+                body = {'email': f'user{rng.randrange(1, self.args.users)}@bench.local',
+                        'password': BENCH_PASSWORD, 'role': 'user'}
+            return client.post('/login', json=body).status_code
+        if name == 'upload':
+            data = os.urandom(16) + self.upload_data
+            files = {'file': (f'load-{rng.randrange(1 << 30)}.bin', data, 'application/octet-stream')}
+            return client.post('/upload_document', files=files).status_code
+        if name == 'download':
+            path = f'/user/document/{rng.choice(self.document_ids)}/download'
+            with client.stream('GET', path) as response:
+                for _ in response.iter_bytes():
+                    pass
+            return response.status_code
+        if name == 'list':
+            return client.get('/get_documents', params={'limit': 20}).status_code
+        if name == 'search':
+            body = {'query': rng.choice(SEARCH_TERMS), 'limit': 50}
+            return client.post('/get_activity_logs', json=body).status_code
+        return client.get('/get_dashboard_data').status_code
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(int(len(sorted_values) * fraction) - 1, 0)]
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not str(status).startswith('2'))
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+def run_phase(workload, weights, args, server_pid):
+    """Drive the weighted endpoints from ``--concurrency`` clients for ``--duration`` seconds."""
+    names, cumulative = list(weights), list(weights.values())
+    latencies = {name: [] for name in names}
+    statuses = {name: Counter() for name in names}
+    stop = threading.Event()
+
+    def client_loop(index):
+        rng = random.Random(args.seed * 7919 + index)
+        with httpx.Client(base_url=workload.base_url, headers=workload.headers(), timeout=args.timeout) as client:
+            while not stop.is_set():
+                name = rng.choices(names, cumulative)[0]
+                t0 = time.perf_counter()
+                try:
+                    status = workload.request(name, client, rng)
+                except httpx.HTTPError as e:
+                    statuses[name][type(e).__name__] += 1
+                    continue
+                elapsed = time.perf_counter() - t0
+                statuses[name][status] += 1
+                if 200 <= status < 300:
+                    latencies[name].append(elapsed)
+
+    sampler = RSSSampler(server_pid) if server_pid and psutil else None
+    if sampler:
+        sampler.start()
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    peak_rss = sampler.stop() if sampler else None
+
+    results = {name: summarize(latencies[name], statuses[name], elapsed) for name in names}
+    for result in results.values():
+        result['peak_rss_mb'] = peak_rss
+    return results, peak_rss
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of ``results`` against ``baseline`` beyond ``tolerance`` (a fraction)."""
+    regressions = []
+    sections = [('endpoints', results['endpoints'], baseline.get('endpoints', {})),
+                ('mixed', results['mixed']['endpoints'], baseline.get('mixed', {}).get('endpoints', {}))]
+    for section, current, previous in sections:
+        for name, now in current.items():
+            before = previous.get(name)
+            if not before:
+                continue
+            label = f"{section}.{name}"
+            if before['requests_per_second'] and now['requests_per_second'] < before['requests_per_second'] * (1 - tolerance):
+                regressions.append(f"{label}: {now['requests_per_second']} req/s, was {before['requests_per_second']}")
+            for key in ('p50_ms', 'p99_ms', 'peak_rss_mb'):
+                if before.get(key) and now.get(key) and now[key] > before[key] * (1 + tolerance):
+                    regressions.append(f"{label}: {key} {now[key]}, was {before[key]}")
+            error_rate = now['errors'] / max(now['requests'] + now['errors'], 1)
+            before_rate = before['errors'] / max(before['requests'] + before['errors'], 1)
+            if error_rate > before_rate + 0.01:
+                regressions.append(f"{label}: error rate {error_rate:.1%}, was {before_rate:.1%}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results):
+    print(f"{'phase':<10} {'endpoint':<10} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'peak RSS MB':>12}")
+    rows = [('isolated', name, r) for name, r in results['endpoints'].items()]
+    rows += [('mixed', name, r) for name, r in results['mixed']['endpoints'].items()]
+    for phase, name, r in rows:
+        print(f"{phase:<10} {name:<10} {r['requests_per_second']:>8} {str(r['p50_ms']):>9} {str(r['p99_ms']):>9} "
+              f"{r['errors']:>7} {str(r['peak_rss_mb']):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='dms_bench', help='scratch database, dropped and recreated')
+    parser.add_argument('--upload-folder', default=os.path.join(tempfile.gettempdir(), 'dms-bench-uploads'))
+    parser.add_argument('--reuse', action='store_true', help='keep the database and files of an earlier --keep run')
+    parser.add_argument('--keep', action='store_true', help='do not drop the scratch database afterwards')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--documents', type=int, default=500)
+    parser.add_argument('--min-size', type=parse_size, default='1K')
+    parser.add_argument('--max-size', type=parse_size, default='64M', help='up to 1G')
+    parser.add_argument('--activity', type=int, default=100000, help='activity log rows')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--workers', type=int, help='server processes (default: the server default)')
+    parser.add_argument('--boot-timeout', type=float, default=60)
+    parser.add_argument('--base-url', help='drive this running server instead of booting one')
+    parser.add_argument('--server-pid', type=int, help='with --base-url: process tree to measure RSS of')
+    parser.add_argument('--email', default=ADMIN_EMAIL, help='admin account used by the clients')
+    parser.add_argument('--password', default=BENCH_PASSWORD)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20, help='seconds per phase')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--upload-size', type=parse_size, default='256K')
+    parser.add_argument('--max-documents', type=int, default=10000, help='documents the downloads pick from')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help=f'mixed-phase weights ({DEFAULT_MIX})')
+    parser.add_argument('--only', type=parse_mix, help='isolated phases to run (default: all endpoints)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='earlier --output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed regression (fraction)')
+    args = parser.parse_args()
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+    if not 0 < args.min_size <= args.max_size:
+        parser.error('--min-size must be positive and at most --max-size')
+    if psutil is None:
+        print("psutil is not installed: peak RSS will not be reported")
+
+    dataset = None
+    process = None
+    if args.base_url:
+        base_url, server_pid = args.base_url, args.server_pid
+    else:
+        from config import DATABASE_CONFIG
+        if args.database == DATABASE_CONFIG['database']:
+            parser.error(f"--database {args.database} is the application's database; pick a scratch one")
+        os.environ['DMS_DATABASE'] = args.database
+        os.environ['DMS_UPLOAD_FOLDER'] = args.upload_folder
+        if not args.reuse:
+            print(f"creating database {args.database}")
+            create_database(args)
+            print(f"seeding {args.users} users, {args.documents} documents, {args.activity} activity rows")
+            dataset = seed(args)
+            print(f"seeded in {dataset['seed_seconds']}s")
+        process, base_url = boot(args)
+        server_pid = process.pid
+
+    try:
+        workload = Workload(args, base_url, args.email, args.password)
+        results = {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+                'mode': 'external' if args.base_url else args.mode,
+                'workers': args.workers,
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'upload_size': args.upload_size,
+                'documents_known': len(workload.document_ids),
+                'dataset': dataset,
+            },
+            'endpoints': {},
+        }
+        for name in (args.only or ENDPOINTS):
+            print(f"running {name} for {args.duration}s")
+            phase, _ = run_phase(workload, {name: 1}, args, server_pid)
+            results['endpoints'][name] = phase[name]
+        print(f"running mixed load for {args.duration}s")
+        phase, peak_rss = run_phase(workload, args.mix, args, server_pid)
+        results['mixed'] = {
+            'weights': args.mix,
+            'requests_per_second': round(sum(r['requests_per_second'] for r in phase.values()), 1),
+            'peak_rss_mb': peak_rss,
+            'endpoints': phase,
+        }
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=60)
+        if not args.base_url and not (args.keep or args.reuse):
+            drop_database(args)
+            shutil.rmtree(os.path.join(args.upload_folder, 'blobs'), ignore_errors=True)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Content-addressed layout for encrypted document blobs.
+
+A blob is named after a keyed hash (HMAC-SHA256) of its plaintext, so the
+same file uploaded twice maps to the same blob, while the name reveals
+nothing about the content to anyone without the key. Blobs are spread over
+nested two-hex-digit prefixes of the storage key::
+
+    blobs/ab/cd/abcd...ef
+
+Reference counts live in the ``blobs`` table; this module only deals with
+names.
+"""
+import base64
+import hashlib
+import hmac
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+READ_SIZE = 1024 * 1024
+BLOB_PREFIX = 'blobs'
+
+
+def derive_hash_key(fernet_key):
+    """Derive the HMAC key for content hashes from the Fernet master key."""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'dms content hash v1',
+    ).derive(base64.urlsafe_b64decode(fernet_key))
+
+
+def content_hash(fp, key):
+    """Hash the rest of ``fp``; return ``(hex digest, bytes read)``."""
+    mac = hmac.new(key, digestmod=hashlib.sha256)
+    size = 0
+    while True:
+        block = fp.read(READ_SIZE)
+        if not block:
+            return mac.hexdigest(), size
+        mac.update(block)
+        size += len(block)
+
+
+def blob_key(digest, depth=2):
+    """Return the storage key of the blob named ``digest``."""
+    shards = [digest[2 * i:2 * i + 2] for i in range(depth)]
+    return '/'.join([BLOB_PREFIX, *shards, digest])
@@ -0,0 +1,346 @@
+"""Chunked, authenticated on-disk format for encrypted documents.
+
+Layout of a chunked blob::
+
+    header  = MAGIC (4) | version (1) | chunk_size (4, big endian) | nonce prefix (8)
+              [version 2: | codec (1) | plaintext size (8, big endian)]
+    chunk_i = AES-GCM(payload[i*chunk_size:(i+1)*chunk_size]) | tag (16)
+
+The payload is the plaintext, or in version 2 the plaintext compressed with
+``codec`` (see compression.py). Every chunk except the last holds exactly
+``chunk_size`` bytes of payload. The nonce of chunk ``i`` is the per-file
+random prefix followed by ``i``, and the last chunk is sealed with a
+different associated-data byte, so chunks cannot be reordered, dropped or
+truncated without failing authentication. Version 2 also binds the codec
+into the associated data.
+
+Blobs written before this format are plain Fernet tokens; they never start
+with ``MAGIC`` and are still decrypted as a whole.
+"""
+import base64
+import os
+import struct
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+from cryptography.exceptions import InvalidSignature, InvalidTag
+from cryptography.fernet import InvalidToken
+from cryptography.hazmat.primitives import hashes, hmac
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from compression import CODEC_NONE, CompressingReader, available, decompressor
+
+MAGIC = b'DMSC'
+VERSION = 2
+HEADER = struct.Struct('>4sBI8s')
+HEADER_V2_EXTRA = struct.Struct('>BQ')
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_LAST = b'\x01'
+_NOT_LAST = b'\x00'
+
+# size is the header length in bytes; content_length is the plaintext size
+# recorded by version 2 (None for version 1)
+ChunkedHeader = namedtuple('ChunkedHeader', 'version chunk_size nonce_prefix size codec content_length')
+
+
+class CorruptBlobError(Exception):
+    """Raised when an encrypted blob fails to parse or authenticate."""
+
+
+def derive_chunk_key(fernet_key):
+    """Derive the AES-256-GCM key for chunked blobs from the Fernet master key."""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'dms chunked blob v1',
+    ).derive(base64.urlsafe_b64decode(fernet_key))
+
+
+def _nonce(prefix, index):
+    return prefix + struct.pack('>I', index)
+
+
+def _associated_data(header, last, content_length=None):
+    if header.version == 1:
+        return _LAST if last else _NOT_LAST
+    # Version 2 authenticates the codec, and the plaintext size on the last chunk
+    if last:
+        return _LAST + bytes([header.codec]) + struct.pack('>Q', content_length)
+    return _NOT_LAST + bytes([header.codec])
+
+
+def seal_chunk(key, nonce, chunk, associated_data):
+    """Encrypt one chunk. Top-level so it can run in a process pool."""
+    return AESGCM(key).encrypt(nonce, chunk, associated_data)
+
+
+def open_chunk(key, nonce, record, associated_data, index):
+    """Decrypt and authenticate one chunk. Top-level so it can run in a process pool."""
+    try:
+        return AESGCM(key).decrypt(nonce, record, associated_data)
+    except InvalidTag:
+        raise CorruptBlobError(f"Chunk {index} failed authentication")
+
+
+def run_inline(fn, *args):
+    """Default ``submit``: run ``fn`` right away and wrap the outcome in a Future."""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _ordered(futures, window):
+    """Resolve ``futures`` in order, keeping at most ``window`` of them in flight."""
+    pending = deque()
+    try:
+        for future in futures:
+            pending.append(future)
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _pack_header(header):
+    raw = HEADER.pack(MAGIC, header.version, header.chunk_size, header.nonce_prefix)
+    return raw + HEADER_V2_EXTRA.pack(header.codec, header.content_length or 0)
+
+
+def encrypt_stream(src, dst, key, chunk_size=DEFAULT_CHUNK_SIZE, submit=run_inline, window=1,
+                   codec=CODEC_NONE, level=None):
+    """Encrypt the readable ``src`` into the writable, seekable ``dst`` chunk by chunk.
+
+    The plaintext is compressed with ``codec`` first. Chunks are sealed with
+    ``submit(seal_chunk, ...)``, which may hand them to a worker pool; up to
+    ``window`` chunks are in flight at a time and are written in order.
+    Returns the number of plaintext bytes read from ``src``.
+    """
+    start = dst.tell()
+    header = ChunkedHeader(VERSION, chunk_size, os.urandom(8),
+                           HEADER.size + HEADER_V2_EXTRA.size, codec, 0)
+    dst.write(_pack_header(header))
+    reader = src if codec == CODEC_NONE else CompressingReader(src, codec, level)
+    total = 0
+
+    def sealed():
+        nonlocal total
+        index = 0
+        chunk = reader.read(chunk_size)
+        while True:
+            following = reader.read(chunk_size) if len(chunk) == chunk_size else b''
+            last = not following
+            total += len(chunk)
+            if last and codec != CODEC_NONE:
+                total = reader.raw_bytes
+            yield submit(seal_chunk, key, _nonce(header.nonce_prefix, index), chunk,
+                         _associated_data(header, last, total))
+            if last:
+                return
+            chunk = following
+            index += 1
+
+    for record in _ordered(sealed(), window):
+        dst.write(record)
+
+    # The plaintext size is only known now
+    end = dst.tell()
+    dst.seek(start)
+    dst.write(_pack_header(header._replace(content_length=total)))
+    dst.seek(end)
+    return total
+
+
+def is_chunked(prefix):
+    """Tell whether the leading bytes of a blob belong to the chunked format."""
+    return prefix[:len(MAGIC)] == MAGIC
+
+
+def read_header(fp):
+    """Parse the header at the current position of ``fp``."""
+    raw = fp.read(HEADER.size)
+    if len(raw) != HEADER.size:
+        raise CorruptBlobError("Truncated header")
+    magic, version, chunk_size, prefix = HEADER.unpack(raw)
+    if magic != MAGIC or version not in (1, 2) or chunk_size <= 0:
+        raise CorruptBlobError("Unsupported blob header")
+    if version == 1:
+        return ChunkedHeader(version, chunk_size, prefix, HEADER.size, CODEC_NONE, None)
+
+    extra = fp.read(HEADER_V2_EXTRA.size)
+    if len(extra) != HEADER_V2_EXTRA.size:
+        raise CorruptBlobError("Truncated header")
+    codec, content_length = HEADER_V2_EXTRA.unpack(extra)
+    if not available(codec):
+        raise CorruptBlobError(f"Unsupported compression codec {codec}")
+    return ChunkedHeader(version, chunk_size, prefix, HEADER.size + HEADER_V2_EXTRA.size,
+                         codec, content_length)
+
+
+def plaintext_size(header, blob_size):
+    """Return the plaintext length of a chunked blob, given its size on disk."""
+    if header.codec != CODEC_NONE:
+        return header.content_length
+    record_size = header.chunk_size + TAG_SIZE
+    full, rest = divmod(blob_size - header.size, record_size)
+    if rest == 0 and full > 0:
+        return full * header.chunk_size
+    if rest < TAG_SIZE:
+        raise CorruptBlobError("Truncated chunk")
+    return full * header.chunk_size + rest - TAG_SIZE
+
+
+def iter_decrypt_range(fp, key, header, blob_size, start, stop, submit=run_inline, window=1):
+    """Yield plaintext bytes ``start`` to ``stop`` (exclusive) of a chunked blob.
+
+    For uncompressed blobs only the chunks covering the range are read and
+    decrypted, so ``fp`` must be seekable. Compressed blobs are decoded from
+    the start. ``submit`` and ``window`` work as in encrypt_stream.
+    """
+    if start >= stop:
+        return
+    if header.codec != CODEC_NONE:
+        fp.seek(header.size)
+        offset = 0
+        for plain in iter_decrypt(fp, key, header, submit, window):
+            if offset + len(plain) > start:
+                yield plain[max(start - offset, 0):stop - offset]
+            offset += len(plain)
+            if offset >= stop:
+                return
+        return
+
+    chunk_size = header.chunk_size
+    record_size = chunk_size + TAG_SIZE
+    last_index = -(-(blob_size - header.size) // record_size) - 1
+    content_length = plaintext_size(header, blob_size)
+    first, last = start // chunk_size, (stop - 1) // chunk_size
+
+    def opened():
+        fp.seek(header.size + first * record_size)
+        for index in range(first, last + 1):
+            record = fp.read(record_size)
+            yield submit(open_chunk, key, _nonce(header.nonce_prefix, index), record,
+                         _associated_data(header, index == last_index, content_length), index)
+
+    for index, plain in enumerate(_ordered(opened(), window), start=first):
+        offset = index * chunk_size
+        yield plain[max(start - offset, 0):stop - offset]
+
+
+def iter_decrypt(fp, key, header=None, submit=run_inline, window=1):
+    """Yield the plaintext of a chunked blob a chunk at a time, decompressing if needed."""
+    if header is None:
+        header = read_header(fp)
+    record_size = header.chunk_size + TAG_SIZE
+
+    def opened():
+        index = 0
+        record = fp.read(record_size)
+        while True:
+            if len(record) < TAG_SIZE:
+                raise CorruptBlobError("Truncated chunk")
+            following = fp.read(record_size) if len(record) == record_size else b''
+            last = not following
+            yield submit(open_chunk, key, _nonce(header.nonce_prefix, index), record,
+                         _associated_data(header, last, header.content_length), index)
+            if last:
+                return
+            record = following
+            index += 1
+
+    if header.codec == CODEC_NONE:
+        yield from _ordered(opened(), window)
+        return
+
+    decoder = decompressor(header.codec)
+    produced = 0
+    try:
+        for payload in _ordered(opened(), window):
+            plain = decoder.decompress(payload)
+            produced += len(plain)
+            if plain:
+                yield plain
+    except CorruptBlobError:
+        raise
+    except Exception as e:
+        raise CorruptBlobError(f"Failed to decompress: {e}")
+    if produced != header.content_length:
+        raise CorruptBlobError("Decompressed size does not match the header")
+
+
+def verify_chunks(fp, key, header=None):
+    """Authenticate every chunk of a chunked blob without keeping any plaintext.
+
+    GCM has no tag-only check, so each chunk is decrypted with one reused
+    AESGCM context and dropped right away: at most one chunk of plaintext
+    exists at a time, and compressed payloads are never decompressed.
+    Returns the number of chunks; raises CorruptBlobError at the first
+    chunk that fails.
+    """
+    if header is None:
+        header = read_header(fp)
+    record_size = header.chunk_size + TAG_SIZE
+    aead = AESGCM(key)
+    record = fp.read(record_size)
+    index = 0
+    while True:
+        if len(record) < TAG_SIZE:
+            raise CorruptBlobError("Truncated chunk")
+        following = fp.read(record_size) if len(record) == record_size else b''
+        last = not following
+        try:
+            aead.decrypt(_nonce(header.nonce_prefix, index), record,
+                         _associated_data(header, last, header.content_length))
+        except InvalidTag:
+            raise CorruptBlobError(f"Chunk {index} failed authentication")
+        if last:
+            return index + 1
+        record = following
+        index += 1
+
+
+def verify_fernet(token, fernet_key):
+    """Check the HMAC of a legacy Fernet token without decrypting it."""
+    try:
+        data = base64.urlsafe_b64decode(token)
+    except ValueError:
+        raise CorruptBlobError("Invalid or corrupted encrypted data")
+    # version (1) | timestamp (8) | IV (16) | ciphertext (16n) | HMAC (32)
+    if len(data) < 73 or data[0] != 0x80:
+        raise CorruptBlobError("Invalid or corrupted encrypted data")
+    signature = hmac.HMAC(base64.urlsafe_b64decode(fernet_key)[:16], hashes.SHA256())
+    signature.update(data[:-32])
+    try:
+        signature.verify(data[-32:])
+    except InvalidSignature:
+        raise CorruptBlobError("Invalid or corrupted encrypted data")
+
+
+def open_fernet(fernet, token):
+    """Decrypt a legacy Fernet token. Top-level so it can run in a process pool."""
+    try:
+        return fernet.decrypt(token)
+    except InvalidToken:
+        raise CorruptBlobError("Invalid or corrupted encrypted data")
+
+
+def iter_plaintext(fp, key, fernet, submit=run_inline, window=1):
+    """Yield the plaintext of any stored blob, detecting its format from the header."""
+    prefix = fp.read(len(MAGIC))
+    if is_chunked(prefix):
+        fp.seek(-len(prefix), os.SEEK_CUR)
+        yield from iter_decrypt(fp, key, submit=submit, window=window)
+        return
+
+    # Legacy Fernet token: it can only be authenticated as a whole.
+    yield submit(open_fernet, fernet, prefix + fp.read()).result()
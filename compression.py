@@ -0,0 +1,145 @@
+"""Optional compression applied to document plaintext before it is encrypted.
+
+Ciphertext does not compress, so this is the only place it can happen. zlib
+is always available; zstd is used when the optional ``zstandard`` package is
+installed. The codec is recorded in the blob header as one byte.
+"""
+import io
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+CODEC_NAMES = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+# Formats that are already compressed (or are ZIP containers, like Office files)
+COMPRESSED_EXTENSIONS = frozenset("""
+    .7z .avif .bz2 .docx .epub .flac .gif .gz .heic .jar .jpeg .jpg .m4a .mkv .mov .mp3 .mp4
+    .odp .ods .odt .ogg .png .pptx .rar .tgz .webm .webp .xlsx .xz .zip .zst
+""".split())
+
+SAMPLE_SIZE = 16 * 1024
+SAMPLES = 4
+
+
+def available(codec):
+    return codec in (CODEC_NONE, CODEC_ZLIB) or (codec == CODEC_ZSTD and zstandard is not None)
+
+
+def resolve_codec(name):
+    """Map a COMPRESSION setting ('auto', 'zstd', 'zlib' or 'none') to a codec id."""
+    if name == 'auto':
+        return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+    codec = CODEC_NAMES.get(name)
+    if codec is None:
+        raise ValueError(f"Unknown compression codec: {name}")
+    if not available(codec):
+        raise ValueError(f"Compression codec {name} needs the zstandard package")
+    return codec
+
+
+def choose_codec(filename, fp, codec, min_saving=0.1):
+    """Pick the codec for one upload, falling back to CODEC_NONE when it would not pay off.
+
+    Known compressed formats are skipped by extension. Anything else is skipped
+    when a fast zlib pass over SAMPLES evenly spaced windows of the file saves
+    less than ``min_saving``; documents such as PDFs mix incompressible and
+    highly compressible sections, so the first bytes alone are misleading.
+    ``fp`` must be seekable and is left where it was.
+    """
+    if codec == CODEC_NONE or os.path.splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS:
+        return CODEC_NONE
+    position = fp.tell()
+    size = fp.seek(0, os.SEEK_END) - position
+    sampled = compressed = 0
+    for i in range(SAMPLES):
+        fp.seek(position + max(size - SAMPLE_SIZE, 0) * i // max(SAMPLES - 1, 1))
+        sample = fp.read(SAMPLE_SIZE)
+        sampled += len(sample)
+        compressed += len(zlib.compress(sample, 1))
+    fp.seek(position)
+    if not sampled or compressed > sampled * (1 - min_saving):
+        return CODEC_NONE
+    return codec
+
+
+def choose_codec_from_prefix(filename, src, codec, min_saving=0.1):
+    """Pick the codec for a reader that is expensive to seek, such as a ZIP member.
+
+    Samples only the first ``SAMPLES * SAMPLE_SIZE`` bytes, read once. Returns
+    ``(codec, reader)``; read the file from ``reader``, which replays them.
+    """
+    if codec == CODEC_NONE or os.path.splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS:
+        return CODEC_NONE, src
+    prefix = src.read(SAMPLES * SAMPLE_SIZE)
+    return choose_codec(filename, io.BytesIO(prefix), codec, min_saving), PrefixedReader(prefix, src)
+
+
+class PrefixedReader:
+    """File-like reader returning ``prefix`` and then the rest of ``src``."""
+
+    def __init__(self, prefix, src):
+        self._prefix = memoryview(prefix)
+        self._src = src
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._src.read(size)
+        if size is None or size < 0:
+            data = bytes(self._prefix) + self._src.read()
+        else:
+            data = bytes(self._prefix[:size])
+            if len(data) < size:
+                data += self._src.read(size - len(data))
+        self._prefix = self._prefix[len(data):]
+        return data
+
+
+def compressor(codec, level=None):
+    """Return an object with ``compress(data)`` and ``flush()``."""
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(6 if level is None else level)
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    raise ValueError(f"Unsupported codec {codec}")
+
+
+def decompressor(codec):
+    """Return an object with ``decompress(data)``."""
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj()
+    if codec == CODEC_ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unsupported codec {codec}")
+
+
+class CompressingReader:
+    """File-like view of ``src`` compressed on the fly; ``raw_bytes`` counts what was read."""
+
+    def __init__(self, src, codec, level=None, read_size=256 * 1024):
+        self._src = src
+        self._compressor = compressor(codec, level)
+        self._read_size = read_size
+        self._buffer = bytearray()
+        self._eof = False
+        self.raw_bytes = 0
+
+    def read(self, size):
+        while len(self._buffer) < size and not self._eof:
+            block = self._src.read(self._read_size)
+            if block:
+                self.raw_bytes += len(block)
+                self._buffer += self._compressor.compress(block)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
@@ -2,19 +2,141 @@ import os
 import base64
 
 SECRET_KEY = 'your-secret-key'  # Replace with a secure secret key
-SESSION_TYPE = 'filesystem'
+SESSION_TYPE = 'sqlite'  # sqlite_session.py; any Flask-Session type (e.g. 'filesystem') also works
 SESSION_PERMANENT = False
 SESSION_COOKIE_SECURE = True
 SESSION_COOKIE_HTTPONLY = True
 PERMANENT_SESSION_LIFETIME = 3600
+SESSION_SQLITE_PATH = 'sessions.sqlite3'
+SESSION_CACHE_SIZE = 10000      # sessions kept in memory per worker process
+SESSION_SWEEP_INTERVAL = 300    # seconds between deletions of expired sessions
+
+# Bearer tokens for API clients (Authorization: Bearer <token>)
+ACCESS_TOKEN_LIFETIME = 900                 # seconds an access token is valid
+REFRESH_TOKEN_LIFETIME = 14 * 24 * 3600     # seconds a refresh token is valid
+TOKEN_REVOCATION_REFRESH = 5                # seconds between reloads of the revocation list
+
+# Password hashing. Hashes made with another scheme or cost are upgraded on the user's next login.
+PASSWORD_HASH_SCHEME = 'bcrypt'     # or 'argon2'
+BCRYPT_ROUNDS = 12
+ARGON2_PARAMS = {'time_cost': 3, 'memory_cost': 64 * 1024, 'parallelism': 1}
+PASSWORD_HASH_POOL_KIND = 'thread'  # bcrypt and argon2 release the GIL while hashing
+PASSWORD_HASH_WORKERS = None        # hashes running at once; defaults to half the CPUs (at least 1)
+PASSWORD_HASH_QUEUE = 32            # logins allowed to wait before the rest get a 503
+PASSWORD_HASH_RETRY_AFTER = 1
 
 DATABASE_CONFIG = {
     'host': 'localhost',
     'user': 'root',
     'password': 'venom',
-    'database': 'dms'
+    # DMS_DATABASE points the app at another schema (benchmarks/load_suite.py uses a scratch one)
+    'database': os.environ.get('DMS_DATABASE', 'dms')
 }
 
+# Database connection pool
+DB_POOL_SIZE = 5            # idle connections kept open per worker process
+DB_POOL_MAX_OVERFLOW = 10   # extra connections allowed under load, closed on release
+DB_POOL_TIMEOUT = 10        # seconds to wait for a free connection
+DB_POOL_RECYCLE = 1800      # reopen connections older than this many seconds
+DB_POOL_PRE_PING = True     # ping connections idle for a while before handing them out
+
+# Largest page size accepted by the paginated list endpoints
+MAX_PAGE_SIZE = 100
+
+# Activity log search
+ACTIVITY_LOG_PAGE_SIZE = 100        # rows per page when the client does not ask for a limit
+ACTIVITY_LOG_MAX_PAGE_SIZE = 1000
+FULLTEXT_MIN_TOKEN_SIZE = 3         # innodb_ft_min_token_size of the database server
+
+# Batched activity_logs writer
+AUDIT_LOG_BATCH_SIZE = 200                      # rows per multi-row INSERT
+AUDIT_LOG_FLUSH_INTERVAL = 0.5                  # seconds before a partial batch is written
+AUDIT_LOG_MAX_QUEUE = 10000                     # queued rows before new ones go to the spill file
+AUDIT_LOG_SPILL_FILE = 'activity_logs.spill'    # replayed once the database is reachable again
+
+# Live activity feed (Server-Sent Events)
+ACTIVITY_STREAM_HISTORY = 1000          # recent events kept for clients resuming with Last-Event-ID
+ACTIVITY_STREAM_BUFFER = 256            # pending events per subscriber before it is told to reset
+ACTIVITY_STREAM_KEEPALIVE = 15          # seconds between keep-alive comments
+ACTIVITY_STREAM_POLL_INTERVAL = 1       # seconds between each process's polls of activity_logs for new rows
+ACTIVITY_STREAM_GAP_TIMEOUT = 10        # seconds a skipped id is polled for before it is taken for a rollback
+
+# Uploads are encrypted in authenticated chunks of this many plaintext bytes
+ENCRYPTION_CHUNK_SIZE = 64 * 1024
+
+# Compression applied before encryption: 'auto' (zstd if the zstandard package is
+# installed, else zlib), 'zstd', 'zlib' or 'none'
+COMPRESSION = 'auto'
+COMPRESSION_LEVEL = None        # codec default (zlib 6, zstd 3)
+COMPRESSION_MIN_SAVING = 0.1    # store uncompressed unless a sample of the file shrinks by this much
+
+# Content-addressed blobs live under blobs/ in storage, this many two-hex-digit directories deep
+BLOB_SHARD_DEPTH = 2
+BLOB_GC_GRACE = 3600            # seconds gc-blobs leaves a new, still unreferenced blob alone
+
+# Envelope encryption: each blob has a data key wrapped by a versioned master key
+MASTER_KEY_DIR = 'master_keys'  # holds <version>.key files; create version 1 with `flask init-master-key`
+DATA_KEY_CACHE_SIZE = 10000     # unwrapped data keys kept in memory per process
+DATA_KEY_CACHE_TTL = 300        # seconds an unwrapped data key may stay cached
+KEY_ROTATION_BATCH = 1000       # data keys re-wrapped per statement by rewrap-data-keys
+
+# Document storage: 'local' (files under UPLOAD_FOLDER) or 's3' (any S3-compatible store; needs boto3)
+STORAGE_BACKEND = 'local'
+S3_BUCKET = None
+S3_PREFIX = ''                  # keys are stored under this prefix in the bucket
+S3_ENDPOINT_URL = None          # e.g. 'http://127.0.0.1:9000' for MinIO; None for AWS
+S3_REGION = None
+S3_ACCESS_KEY_ID = None         # None uses boto3's usual credential chain (environment, profile, role)
+S3_SECRET_ACCESS_KEY = None
+S3_PART_SIZE = 8 * 1024 * 1024  # multipart upload part size (at least 5 MiB)
+S3_MAX_CONNECTIONS = 50
+
+# Worker pool that runs encryption and decryption off the request thread
+CRYPTO_POOL_KIND = 'thread'     # 'thread', or 'process' to sidestep the GIL at the cost of copying chunks
+CRYPTO_POOL_WORKERS = None      # defaults to the number of CPUs
+CRYPTO_POOL_QUEUE = 64          # jobs allowed to wait for a worker before requests get a 503
+CRYPTO_POOL_WINDOW = 8          # chunks of a single file in flight at once
+CRYPTO_POOL_RETRY_AFTER = 2     # seconds sent in Retry-After when the pool is saturated
+
+# Batch uploads (/upload_documents): files are hashed and encrypted this many at a time per process
+UPLOAD_POOL_WORKERS = 4
+UPLOAD_POOL_QUEUE = 256             # files allowed to wait before new batches get a 503
+UPLOAD_BATCH_MAX_FILES = 200
+UPLOAD_BATCH_MAX_BYTES = 2 * 1024 ** 3  # total uncompressed size of a ZIP batch
+
+# Bulk downloads (/export_documents): documents per ZIP archive
+EXPORT_MAX_DOCUMENTS = 5000
+
+# Integrity scans (flask scan-integrity)
+INTEGRITY_SCAN_WORKERS = os.cpu_count() or 1   # verifier processes
+INTEGRITY_SCAN_BATCH = 1000                     # objects looked up and recorded per query
+
+# Production server (serve.py): prefork workers sharing one listening socket
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8080
+SERVE_WORKERS = None            # defaults to the number of CPUs
+SERVE_THREADS = 64              # requests handled at once per worker
+SERVE_BACKLOG = 1024            # connections queued by the kernel while every worker is busy
+SERVE_TIMEOUT = 30              # seconds an idle keep-alive connection is kept open
+SERVE_GRACEFUL_TIMEOUT = 30     # seconds a stopping worker gets to finish its requests
+SERVE_BOOT_TIMEOUT = 60         # seconds a new worker gets to import the app and warm up
+SERVE_ACCESS_LOG = False        # log every request to stderr like the development server
+SERVE_REUSE_PORT = False        # each worker binds its own SO_REUSEPORT socket instead
+SERVE_PRELOAD = False           # import the app once in the master; reloads then keep the old code
+
+# Async serving mode (asgi.py, run under uvicorn)
+ASGI_DB_POOL_SIZE = 10          # idle mysql.connector.aio connections kept per process
+ASGI_DB_POOL_MAX_OVERFLOW = 90  # extra connections opened under load, closed on release
+ASGI_IO_THREADS = 32            # threads for file reads, decryption and session lookups
+ASGI_FALLBACK_THREADS = 32      # threads running the Flask app for routes without an async version
+
+# Request metrics (GET /metrics) and sampled request logs; DMS_METRICS=0 turns both off
+METRICS_ENABLED = os.environ.get('DMS_METRICS', '1') != '0'
+# Bearer token a scraper must present to GET /metrics, which answers 404 while this is unset
+METRICS_TOKEN = os.environ.get('DMS_METRICS_TOKEN')
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+REQUEST_LOG_SAMPLE_RATE = 0.01  # fraction of requests logged to stderr as one JSON line each
+
 # Generate a URL-safe base64-encoded Fernet key
 def generate_key():
     key = os.urandom(32)
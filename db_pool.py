@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the pool timeout."""
+
+
+class _PoolEntry:
+    """A driver connection kept by the pool, with its age and last use."""
+
+    def __init__(self, raw, created_at):
+        self.raw = raw
+        self.created_at = created_at
+        self.last_used = time.monotonic()
+
+
+class PooledConnection:
+    """Proxy for one checkout of a driver connection; close() returns it to the pool.
+
+    Every checkout gets a new proxy, so closing a proxy again after its
+    connection went to another checkout does nothing.
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def __getattr__(self, name):
+        if self._entry is None:
+            raise AttributeError(f"{name}: connection was returned to the pool")
+        return getattr(self._entry.raw, name)
+
+    @property
+    def raw(self):
+        return self._entry.raw if self._entry is not None else None
+
+    @property
+    def checked_out(self):
+        return self._entry is not None
+
+    def close(self):
+        """Hand the connection back to the pool (safe to call more than once)."""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry)
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections.
+
+    ``connect`` is any zero-argument callable returning a DB-API style
+    connection, so the pool can be pointed at MySQL/MariaDB or at a stand-in
+    in tests. Up to ``size`` idle connections are kept; ``max_overflow``
+    extra connections may be opened under load and are closed on release.
+    """
+
+    def __init__(self, connect, size=5, max_overflow=10, timeout=30,
+                 recycle=3600, pre_ping=True, ping_after=30):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.ping_after = ping_after
+
+        self._idle = deque()
+        self._total = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+        self._in_use = 0
+        self._checkouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._failed_pings = 0
+        self._exhausted = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _check_pid(self):
+        # Connections must never be shared across a fork(); a child starts
+        # with an empty pool and lets the parent's sockets be.
+        if self._pid != os.getpid():
+            self._idle = deque()
+            self._total = 0
+            self._in_use = 0
+            self._cond = threading.Condition()
+            self._pid = os.getpid()
+
+    def _open(self):
+        raw = self._connect()
+        self._created += 1
+        return _PoolEntry(raw, time.monotonic())
+
+    def _discard(self, entry):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, entry):
+        now = time.monotonic()
+        if self.recycle and now - entry.created_at > self.recycle:
+            self._recycled += 1
+            return False
+        if self.pre_ping and now - entry.last_used > self.ping_after:
+            try:
+                entry.raw.ping(reconnect=False)
+            except Exception:
+                self._failed_pings += 1
+                return False
+        return True
+
+    def checkout(self):
+        """Return a healthy connection, waiting up to ``timeout`` seconds."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        counted_exhausted = False
+        with self._cond:
+            self._check_pid()
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._total < self.size + self.max_overflow:
+                    self._total += 1
+                    conn = None
+                    break
+                if not counted_exhausted:
+                    self._exhausted += 1
+                    counted_exhausted = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"Connection pool exhausted ({self._total} connections in use)")
+                self._cond.wait(remaining)
+
+        # Health checks and connects happen outside the lock.
+        if conn is not None and not self._is_healthy(conn):
+            self._discard(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify()
+                raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return the pool entry ``conn`` to the pool, rolling back any open transaction.
+
+        Called by PooledConnection.close().
+        """
+        conn.last_used = time.monotonic()
+        healthy = True
+        try:
+            conn.raw.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            if healthy and len(self._idle) < self.size:
+                self._idle.append(conn)
+                conn = None
+            else:
+                self._total -= 1
+            self._cond.notify()
+        if conn is not None:
+            self._discard(conn)
+
+    def dispose(self):
+        """Close every idle connection."""
+        with self._cond:
+            idle, self._idle = self._idle, deque()
+            self._total -= len(idle)
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._total,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'checkouts': self._checkouts,
+                'created': self._created,
+                'recycled': self._recycled,
+                'failed_pings': self._failed_pings,
+                'exhausted': self._exhausted,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_max': round(self._wait_max, 6),
+            }
@@ -0,0 +1,185 @@
+"""Envelope encryption: every blob has its own data key, wrapped by a versioned master key.
+
+A blob is encrypted with a random 256-bit data key. The ``blobs`` table
+keeps that key sealed with AES-GCM under a master key (``wrapped_key``, 60
+bytes) next to the master key's version (``key_version``). Rotating the
+master key re-wraps these small keys; no blob is read or rewritten.
+
+Master keys are files named ``<version>.key`` (URL-safe base64) in one
+directory, and the highest version wraps new data keys. The first key is
+created once, explicitly (``create_first_master_key``), and then copied to
+every node. Blobs stored before
+envelope encryption have no wrapped key and use the key derived from
+ENCRYPTION_KEY.
+"""
+import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+DATA_KEY_SIZE = 32
+NONCE_SIZE = 12
+WRAPPED_KEY_SIZE = NONCE_SIZE + DATA_KEY_SIZE + 16
+
+
+class KeyUnwrapError(Exception):
+    """Raised when a wrapped data key cannot be opened with the master keys on hand."""
+
+
+class NoMasterKeyError(Exception):
+    """Raised when the master key directory holds no key yet."""
+
+
+def new_data_key():
+    return os.urandom(DATA_KEY_SIZE)
+
+
+def _associated_data(version):
+    return b'dms data key v%d' % version
+
+
+def _key_versions(directory):
+    if not os.path.isdir(directory):
+        return []
+    return [int(stem) for stem, ext in map(os.path.splitext, os.listdir(directory))
+            if ext == '.key' and stem.isdigit()]
+
+
+def _write_key(directory, version):
+    """Write master key `version`, unless some process already has. Returns whether it was new."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    path = os.path.join(directory, f'{version}.key')
+    # Written in full under a temporary name, then linked, so readers never see a partial key
+    temp_path = f'{path}.{os.urandom(4).hex()}.tmp'
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(base64.urlsafe_b64encode(os.urandom(32)))
+        os.link(temp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(temp_path)
+
+
+def create_first_master_key(directory):
+    """Create master key version 1 in `directory` unless it already holds keys. Returns whether it did."""
+    if _key_versions(directory):
+        return False
+    return _write_key(directory, 1)
+
+
+class MasterKeyring:
+    """Master keys by version, read from ``directory``.
+
+    Raises NoMasterKeyError when the directory has no key: a process that
+    made its own would wrap data keys that no other worker or node can open.
+    A version this process has not seen yet (added by another node or
+    process) is picked up on demand.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._keys = {}
+        self.load()
+        if not self._keys:
+            raise NoMasterKeyError(f"No master key in {os.path.abspath(directory)}; create one with "
+                                   f"`flask --app server init-master-key` and copy it to every node")
+
+    def load(self):
+        keys = {}
+        for version in _key_versions(self.directory):
+            with open(os.path.join(self.directory, f'{version}.key'), 'rb') as f:
+                keys[version] = base64.urlsafe_b64decode(f.read().strip())
+        self._keys = keys
+
+    @property
+    def current_version(self):
+        return max(self._keys)
+
+    def versions(self):
+        return sorted(self._keys)
+
+    def add(self):
+        """Create the next master key version, which then wraps all new data keys."""
+        version = self.current_version + 1
+        while not _write_key(self.directory, version):
+            self.load()
+            version = self.current_version + 1
+        self.load()
+        return version
+
+    def _key(self, version):
+        if version not in self._keys:
+            self.load()
+        try:
+            return self._keys[version]
+        except KeyError:
+            raise KeyUnwrapError(f"Unknown master key version {version}") from None
+
+    def wrap(self, data_key, version=None):
+        """Seal `data_key` under master key `version` (the current one by default).
+
+        Returns ``(version, wrapped_key)``.
+        """
+        if version is None:
+            version = self.current_version
+        nonce = os.urandom(NONCE_SIZE)
+        return version, nonce + AESGCM(self._key(version)).encrypt(nonce, data_key, _associated_data(version))
+
+    def unwrap(self, version, wrapped_key):
+        wrapped_key = bytes(wrapped_key)
+        try:
+            return AESGCM(self._key(version)).decrypt(wrapped_key[:NONCE_SIZE], wrapped_key[NONCE_SIZE:],
+                                                      _associated_data(version))
+        except InvalidTag:
+            raise KeyUnwrapError(f"Data key does not open with master key version {version}") from None
+
+
+class DataKeyCache:
+    """Unwrapped data keys, kept for at most ``ttl`` seconds each.
+
+    Beyond ``max_size`` keys the least recently used are evicted. Bounding
+    both limits how many plaintext keys sit in memory and for how long.
+    """
+
+    def __init__(self, keyring, max_size=10000, ttl=300):
+        self.keyring = keyring
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, version, wrapped_key):
+        cache_key = (version, bytes(wrapped_key))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+        data_key = self.keyring.unwrap(version, wrapped_key)
+        with self._lock:
+            self.misses += 1
+            self._entries[cache_key] = (data_key, now + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return data_key
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
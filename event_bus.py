@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class Subscription:
+    """A subscriber's bounded buffer of pending events."""
+
+    def __init__(self, buffer_size, after=0):
+        self._events = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        # Set when the subscriber can no longer be brought up to date with
+        # deltas (its buffer overflowed or its resume point is gone) and
+        # should reload the full state instead.
+        self.needs_reset = False
+        # Events up to this id already reached the client through another process
+        self.after = after
+        # Set when the process is stopping: the stream should end, and the client reconnect elsewhere
+        self.closed = False
+
+    def push(self, event):
+        if event['seq'] <= self.after:
+            return
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self.needs_reset = True
+            self._events.append(event)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def wait(self, timeout):
+        """Block up to `timeout` seconds or until closed; return (events, needs_reset)."""
+        with self._cond:
+            if not self._events and not self.needs_reset and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            reset, self.needs_reset = self.needs_reset, False
+        return events, reset
+
+
+class EventBus:
+    """In-process publish/subscribe bus with a replay window for resuming clients.
+
+    Events carry the id of the row they describe, which is the same in every
+    process, so a client may resume with ``Last-Event-ID`` on any worker. A
+    client resuming from before the replay window (or from an id that is not
+    a row id) is told to reset rather than silently missing events.
+    """
+
+    def __init__(self, history=1000, buffer_size=256):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._buffer_size = buffer_size
+        self._seq = 0
+        self._closed = False
+
+    def publish(self, seq, event_type, data, notify=True):
+        """Publish event `seq`; with notify=False it is only kept for replay."""
+        event = {'id': str(seq), 'seq': seq, 'type': event_type, 'data': data}
+        with self._lock:
+            self._seq = max(self._seq, seq)
+            self._history.append(event)
+            subscribers = list(self._subscribers) if notify else []
+        for subscription in subscribers:
+            subscription.push(event)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber, replaying anything it missed after `last_event_id`."""
+        subscription = Subscription(self._buffer_size)
+        with self._lock:
+            if last_event_id:
+                seq = int(last_event_id) if last_event_id.isdigit() else -1
+                # Events filled into a gap late leave the history slightly out of order
+                oldest = min((event['seq'] for event in self._history), default=None)
+                if oldest is None or seq < oldest - 1:
+                    subscription.needs_reset = True
+                else:
+                    for event in self._history:
+                        if event['seq'] > seq:
+                            subscription.push(event)
+                    if seq > self._seq:
+                        # Resumed from a process that was further ahead: skip what the client has
+                        subscription.after = seq
+            if self._closed:
+                subscription.close()
+            self._subscribers.add(subscription)
+        return subscription
+
+    def close(self):
+        """Close every subscription, now and from now on, so that their streams end."""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.close()
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'last_seq': self._seq}
+
+
+class TablePoller:
+    """Publishes the rows every process appends to a shared table to an EventBus.
+
+    `fetch(after, missing, limit)` returns up to `limit` ``(id, event_type,
+    data)`` rows with an id above `after` or in `missing`, in id order, and
+    `recent(limit)` the newest `limit` rows, which seed the replay window.
+    Ids are handed out when a row is inserted but show up only once its
+    transaction commits, so an id skipped below the newest one is looked for
+    again for `gap_timeout` seconds before it is taken for a rollback.
+    """
+
+    def __init__(self, bus, fetch, recent, interval=1.0, gap_timeout=10.0, history=1000, batch_size=500):
+        self.bus = bus
+        self._fetch = fetch
+        self._recent = recent
+        self.interval = interval
+        self.gap_timeout = gap_timeout
+        self.history = history
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_id = None
+        self._missing = {}      # id -> monotonic time it was first missed
+
+        self._polls = 0
+        self._published = 0
+        self._gaps_filled = 0
+
+    def ensure_started(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._last_id = None
+            self._missing = {}
+            self._seed()
+            threading.Thread(target=self._run, name='table-poller', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _seed(self):
+        try:
+            rows = self._recent(self.history)
+        except Exception as e:
+            print(f"Error loading recent events: {e}")
+            return
+        for row_id, event_type, data in sorted(rows, key=lambda row: row[0]):
+            self.bus.publish(row_id, event_type, data, notify=False)
+        self._last_id = max((row[0] for row in rows), default=0)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self._last_id is None:
+                    self._seed()
+                else:
+                    self.poll()
+            except Exception as e:
+                print(f"Error polling for new events: {e}")
+
+    def poll(self):
+        """Publish the rows committed since the last poll; returns how many."""
+        self._polls += 1
+        now = time.monotonic()
+        self._missing = {row_id: since for row_id, since in self._missing.items()
+                         if now - since < self.gap_timeout}
+        published = 0
+        while True:
+            rows = self._fetch(self._last_id, sorted(self._missing), self.batch_size)
+            for row_id, event_type, data in rows:
+                if row_id in self._missing:
+                    del self._missing[row_id]
+                    self._gaps_filled += 1
+                elif row_id > self._last_id:
+                    # Bounded, as a large jump is more likely an auto-increment gap than open transactions
+                    for skipped in range(self._last_id + 1, row_id)[:self.batch_size - len(self._missing)]:
+                        self._missing[skipped] = now
+                    self._last_id = row_id
+                else:
+                    continue
+                self.bus.publish(row_id, event_type, data)
+                published += 1
+            if len(rows) < self.batch_size:
+                break
+        self._published += published
+        return published
+
+    def stats(self):
+        return {'polls': self._polls, 'published': self._published, 'gaps_filled': self._gaps_filled,
+                'waiting_for': len(self._missing), 'last_id': self._last_id}
@@ -114,7 +114,27 @@ document.addEventListener('DOMContentLoaded', () => {
     getAllUsers();
 });
 
-async function getActivityLogs(searchTerm = '') {
+// The server pages activity logs by cursor: cursors[n] fetches page n (newest first)
+const logPaging = { cursors: [null], page: 0, params: {} };
+
+function logSearchParams() {
+    const params = { search_term: document.getElementById('logSearch').value.trim() };
+    const userId = document.getElementById('logUserId').value;
+    const since = document.getElementById('logSince').value;
+    const until = document.getElementById('logUntil').value;
+    if (userId) params.user_id = Number(userId);
+    if (since) params.since = since;
+    if (until) params.until = until;
+    return params;
+}
+
+async function getActivityLogs(page = 0) {
+    if (page === 0) {
+        // A new search starts over; later pages keep its filters
+        logPaging.cursors = [null];
+        logPaging.params = logSearchParams();
+    }
+    const cursor = logPaging.cursors[page];
     try {
         const response = await fetch('/get_activity_logs', {
             method: 'POST',
@@ -122,15 +142,20 @@ async function getActivityLogs(searchTerm = '') {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${localStorage.getItem('token')}`, // Include token if required
             },
-            body: JSON.stringify({ search_term: searchTerm }),
+            body: JSON.stringify(cursor ? { ...logPaging.params, cursor } : logPaging.params),
         });
 
         const data = await response.json();
         if (data.success) {
+            logPaging.page = page;
+            logPaging.cursors = logPaging.cursors.slice(0, page + 1);
+            logPaging.cursors.push(data.next_cursor);
             renderActivityLogs(data.logs);
+            updateLogPager();
+            filterLogs(document.getElementById('logSearch').value, document.getElementById('logTypeFilter').value);
         } else {
             console.error('Failed to load activity logs:', data.message);
-            alert('Failed to load activity logs.');
+            alert(data.message || 'Failed to load activity logs.');
         }
     } catch (error) {
         console.error('Error loading activity logs:', error);
@@ -138,6 +163,14 @@ async function getActivityLogs(searchTerm = '') {
     }
 }
 
+function updateLogPager() {
+    const hasMore = Boolean(logPaging.cursors[logPaging.page + 1]);
+    document.getElementById('prevLogPage').disabled = logPaging.page === 0;
+    document.getElementById('nextLogPage').disabled = !hasMore;
+    document.getElementById('currentLogPage').textContent =
+        `Page ${logPaging.page + 1}${hasMore ? ' (more available)' : ''}`;
+}
+
 function renderActivityLogs(logs) {
     const logsTableBody = document.getElementById('logsTable').querySelector('tbody');
     logsTableBody.innerHTML = ''; // Clear existing logs
@@ -207,34 +240,43 @@ async function uploadDocument() {
         return;
     }
 
-    const file = fileInput.files[0];
-    if (!file) {
+    const files = Array.from(fileInput.files);
+    if (files.length === 0) {
         alert('Please select a file to upload.');
         return;
     }
 
+    // The whole selection goes up in one request; a single .zip is unpacked by the server
     const formData = new FormData();
-    formData.append('file', file);
+    if (files.length === 1 && files[0].name.toLowerCase().endsWith('.zip')) {
+        formData.append('archive', files[0]);
+    } else {
+        files.forEach(file => formData.append('files', file));
+    }
 
     try {
-        const response = await fetch('/upload_document', {
+        const response = await fetch('/upload_documents', {
             method: 'POST',
             body: formData
         });
 
+        const data = await response.json();
         if (response.ok) {
-            alert('Document uploaded successfully!');
+            const failed = data.results.filter(result => !result.success);
+            if (failed.length > 0) {
+                alert(`${data.message}. Not uploaded: ${failed.map(result => `${result.filename} (${result.message})`).join(', ')}`);
+            } else {
+                alert(data.uploaded === 1 ? 'Document uploaded successfully!' : `${data.uploaded} documents uploaded successfully!`);
+            }
             fileInput.value = ''; // Clear file input
             getAllDocuments(); // Refresh the document table
         } else {
-            // Handle non-JSON response (e.g., display a user-friendly error message)
-            const text = await response.text(); // Read the response as text
-            console.error('Error uploading document:', text);
-            alert('Failed to upload document. Please check server logs for details.');
+            console.error('Error uploading documents:', data);
+            alert(data.message || 'Failed to upload documents.');
         }
     } catch (error) {
-        console.error('Error uploading document:', error);
-        alert('An error occurred while uploading the document.');
+        console.error('Error uploading documents:', error);
+        alert('An error occurred while uploading the documents.');
     }
 }
 
@@ -642,12 +684,13 @@ async function fetchAndRenderRecentActivity() {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${localStorage.getItem('token')}`, // Include token if required
             },
-            body: JSON.stringify({ search_term: '' }),
+            body: JSON.stringify({ search_term: '', limit: 7 }),
         });
 
         const data = await response.json();
         if (data.success) {
-            renderRecentActivity(data.logs);
+            recentActivityLogs = data.logs;
+            renderRecentActivity(recentActivityLogs);
         } else {
             console.error('Failed to fetch recent activity:', data.error);
         }
@@ -657,10 +700,82 @@ async function fetchAndRenderRecentActivity() {
     }
 }
 
-// Call fetchAndRenderRecentActivity periodically to update the recent activities
-setInterval(fetchAndRenderRecentActivity, 5000); // Update every 5 seconds
+// Keep the recent activities up to date from the server's live activity feed.
+// Browsers without EventSource fall back to polling every 5 seconds.
+let recentActivityLogs = [];
+
+// The totals are reloaded at most once per DASHBOARD_REFRESH_DELAY, however many events arrive,
+// and not at all while the tab is hidden.
+const DASHBOARD_REFRESH_DELAY = 5000;
+let dashboardRefreshTimer = null;
+let dashboardRefreshPending = false;
+
+function scheduleDashboardRefresh() {
+    if (document.hidden) {
+        dashboardRefreshPending = true;
+        return;
+    }
+    if (dashboardRefreshTimer === null) {
+        dashboardRefreshTimer = setTimeout(() => {
+            dashboardRefreshTimer = null;
+            fetchDashboardData();
+        }, DASHBOARD_REFRESH_DELAY);
+    }
+}
+
+document.addEventListener('visibilitychange', () => {
+    if (!document.hidden && dashboardRefreshPending) {
+        dashboardRefreshPending = false;
+        scheduleDashboardRefresh();
+    }
+});
+
+function subscribeToActivityFeed() {
+    if (!window.EventSource) {
+        setInterval(fetchAndRenderRecentActivity, 5000);
+        return;
+    }
+
+    // EventSource reconnects on its own and resumes with Last-Event-ID
+    const source = new EventSource('/admin/activity/stream');
+    source.addEventListener('activity', (event) => {
+        recentActivityLogs = [JSON.parse(event.data), ...recentActivityLogs].slice(0, 7);
+        renderRecentActivity(recentActivityLogs);
+        scheduleDashboardRefresh();
+    });
+    // Sent when the server cannot replay what we missed: reload the full state
+    source.addEventListener('reset', () => {
+        fetchAndRenderRecentActivity();
+        scheduleDashboardRefresh();
+    });
+}
+
+async function logout(event) {
+    event.preventDefault();
+    try {
+        // Revokes the token server-side as well as ending the session
+        await fetch('/logout', {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${localStorage.getItem('token')}`,
+            },
+        });
+    } catch (error) {
+        console.error('Error logging out:', error);
+    }
+    localStorage.removeItem('token');
+    localStorage.removeItem('userRole');
+    window.location.href = '/';
+}
+
+subscribeToActivityFeed();
 
 document.addEventListener('DOMContentLoaded', async function() {
+    const logoutLink = document.getElementById('logoutLink');
+    if (logoutLink) {
+        logoutLink.addEventListener('click', logout);
+    }
+
     // Ensure all elements exist before accessing them
     const contentSections = document.querySelectorAll('.content-section');
     const navLinks = document.querySelectorAll('.top-nav ul li a');
@@ -744,8 +859,23 @@ function setupEventListeners() {
     }
     if (getLogsBtn) {
         getLogsBtn.addEventListener('click', () => {
-            getActivityLogs(logSearchInput.value);
+            getActivityLogs(0);
+        });
+    }
+    const prevLogPage = document.getElementById('prevLogPage');
+    const nextLogPage = document.getElementById('nextLogPage');
+    if (prevLogPage && nextLogPage) {
+        prevLogPage.addEventListener('click', () => {
+            if (logPaging.page > 0) {
+                getActivityLogs(logPaging.page - 1);
+            }
+        });
+        nextLogPage.addEventListener('click', () => {
+            if (logPaging.cursors[logPaging.page + 1]) {
+                getActivityLogs(logPaging.page + 1);
+            }
         });
+        updateLogPager();
     }
 
     // Users table
@@ -30,6 +30,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const profileImage = document.getElementById('profileImage');
     const profileDropdown = document.getElementById('profileDropdown');
     const logoutLink = document.getElementById('logoutLink');
+    if (logoutLink) {
+        logoutLink.addEventListener('click', logout);
+    }
 
     if (profileImage) {
         profileImage.onerror = function() {
@@ -75,6 +78,24 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+async function logout(event) {
+    event.preventDefault();
+    try {
+        // Revokes the token server-side as well as ending the session
+        await fetch('/logout', {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${localStorage.getItem('token')}`,
+            },
+        });
+    } catch (error) {
+        console.error('Error logging out:', error);
+    }
+    localStorage.removeItem('token');
+    localStorage.removeItem('userRole');
+    window.location.href = '/';
+}
+
 async function getUserDocuments() {
     try {
         const response = await fetch('/get_user_documents', {
@@ -171,17 +192,22 @@ async function uploadDocument() {
         return;
     }
 
-    const file = fileInput.files[0];
-    if (!file) {
+    const files = Array.from(fileInput.files);
+    if (files.length === 0) {
         alert('Please select a file to upload.');
         return;
     }
 
+    // The whole selection goes up in one request; a single .zip is unpacked by the server
     const formData = new FormData();
-    formData.append('file', file);
+    if (files.length === 1 && files[0].name.toLowerCase().endsWith('.zip')) {
+        formData.append('archive', files[0]);
+    } else {
+        files.forEach(file => formData.append('files', file));
+    }
 
     try {
-        const response = await fetch('/upload_document', {  // Changed from '/upload_user_document' to '/upload_document'
+        const response = await fetch('/upload_documents', {
             method: 'POST',
             body: formData,
             headers: {
@@ -189,18 +215,23 @@ async function uploadDocument() {
             }
         });
 
+        const data = await response.json();
         if (response.ok) {
-            alert('Document uploaded successfully!');
+            const failed = data.results.filter(result => !result.success);
+            if (failed.length > 0) {
+                alert(`${data.message}. Not uploaded: ${failed.map(result => `${result.filename} (${result.message})`).join(', ')}`);
+            } else {
+                alert(data.uploaded === 1 ? 'Document uploaded successfully!' : `${data.uploaded} documents uploaded successfully!`);
+            }
             fileInput.value = ''; // Clear file input
             getUserDocuments(); // Refresh the document table
         } else {
-            const errorData = await response.json();
-            console.error('Error uploading document:', errorData);
-            alert(errorData.message || 'Failed to upload document.');
+            console.error('Error uploading documents:', data);
+            alert(data.message || 'Failed to upload documents.');
         }
     } catch (error) {
-        console.error('Error uploading document:', error);
-        alert('An error occurred while uploading the document.');
+        console.error('Error uploading documents:', error);
+        alert('An error occurred while uploading the documents.');
     }
 }
 
@@ -0,0 +1,46 @@
+"""Integrity checks for stored blobs, run on a process pool by `flask scan-integrity`.
+
+Each check reads a blob once and authenticates it: every AES-GCM chunk tag
+of a chunked blob, or the HMAC of a legacy Fernet token. No plaintext is
+kept beyond the chunk being checked. Worker processes get the storage
+backend and the legacy keys once, through ``init_worker``, and then receive
+storage keys with each blob's data key.
+"""
+from chunked_crypto import MAGIC, CorruptBlobError, is_chunked, verify_chunks, verify_fernet
+
+STATUS_OK = 'ok'
+STATUS_CORRUPT = 'corrupt'
+STATUS_ERROR = 'error'          # could not be read, for example a storage timeout
+
+_worker = {}
+
+
+def init_worker(storage, chunk_key, fernet_key):
+    _worker['storage'] = storage
+    _worker['chunk_key'] = chunk_key
+    _worker['fernet_key'] = fernet_key
+
+
+def check_object(key, data_key=None):
+    """Authenticate one stored blob, encrypted under `data_key` (by default the legacy chunk key).
+
+    Returns ``(key, status, detail)``, with status None if the blob was
+    deleted while the scan was running.
+    """
+    try:
+        f, _ = _worker['storage'].open(key)
+    except FileNotFoundError:
+        return key, None, None
+    try:
+        with f:
+            prefix = f.read(len(MAGIC))
+            if is_chunked(prefix):
+                f.seek(0)
+                verify_chunks(f, data_key or _worker['chunk_key'])
+            else:
+                verify_fernet(prefix + f.read(), _worker['fernet_key'])
+    except CorruptBlobError as e:
+        return key, STATUS_CORRUPT, str(e)
+    except Exception as e:
+        return key, STATUS_ERROR, f'{type(e).__name__}: {e}'[:255]
+    return key, STATUS_OK, None
@@ -0,0 +1,373 @@
+"""Request metrics: per-route latency, time per span, Prometheus export and sampled request logs.
+
+A request's trace is held in a context variable from the moment the WSGI
+app (or the ASGI router) receives it until its response body has been
+sent. Spans add their time to the current trace, less the time of spans
+nested inside them. A ``crypto`` span around an encryption therefore does
+not also count the storage writes it makes.
+
+Nothing here runs unless the app installs it (METRICS_ENABLED). Outside a
+traced request ``span()`` returns a shared no-op context manager, and the
+wrappers below hand back the object they were given.
+"""
+import contextvars
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from werkzeug.wsgi import ClosingIterator
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+_current = contextvars.ContextVar('dms_request_trace', default=None)
+_clock = time.perf_counter
+_DONE = object()
+
+
+class Trace:
+    """Timings of one request."""
+
+    __slots__ = ('method', 'path', 'route', 'started', 'spans', 'active')
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.route = UNMATCHED_ROUTE
+        self.started = _clock()
+        self.spans = {}         # name -> [seconds, calls]
+        self.active = None      # innermost open _Span
+
+
+class _Span:
+    # Entered once per chunk or query of a traced request, so kept to plain attribute access
+    __slots__ = ('trace', 'name', 'parent', 'nested', 'started')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        trace = self.trace
+        self.parent = trace.active
+        trace.active = self
+        self.nested = 0.0
+        self.started = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = _clock() - self.started
+        trace = self.trace
+        parent = self.parent
+        trace.active = parent
+        if parent is not None:
+            parent.nested += elapsed
+        totals = trace.spans.get(self.name)
+        if totals is None:
+            trace.spans[self.name] = [elapsed - self.nested, 1]
+        else:
+            totals[0] += elapsed - self.nested
+            totals[1] += 1
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NOOP = _NoSpan()
+
+
+def current_trace():
+    return _current.get()
+
+def span(name):
+    """Context manager timing a block as span `name` of the current request."""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+def traced_iter(iterable, name):
+    """Time each step of `iterable` (a lazily decrypted blob, say) as span `name`.
+
+    The time the consumer spends between steps, such as sending a chunk to
+    the client, is not counted.
+    """
+    trace = _current.get()
+    if trace is None:
+        return iterable
+    return _traced_iter(trace, iter(iterable), name)
+
+def _traced_iter(trace, iterator, name):
+    try:
+        while True:
+            with _Span(trace, name):
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+
+class TracedFile:
+    """File proxy timing reads as ``disk_read`` and writes as ``disk_write`` spans."""
+
+    def __init__(self, raw, trace):
+        self._raw = raw
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._raw.__exit__(*exc_info)
+
+    def read(self, *args):
+        with _Span(self._trace, 'disk_read'):
+            return self._raw.read(*args)
+
+    def readinto(self, buffer):
+        with _Span(self._trace, 'disk_read'):
+            return self._raw.readinto(buffer)
+
+    def write(self, data):
+        with _Span(self._trace, 'disk_write'):
+            return self._raw.write(data)
+
+
+def traced_file(f):
+    trace = _current.get()
+    if trace is None:
+        return f
+    return TracedFile(f, trace)
+
+
+class TracedStorage:
+    """Storage backend proxy whose files are timed while a request is traced."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def __getstate__(self):
+        return {'storage': self.storage}
+
+    def __setstate__(self, state):
+        self.storage = state['storage']
+
+    def open(self, key):
+        f, info = self.storage.open(key)
+        return traced_file(f), info
+
+    @contextmanager
+    def writer(self, key):
+        # Opening and committing the object (rename, S3 multipart completion) count as writes too
+        writer = self.storage.writer(key)
+        with span('disk_write'):
+            f = writer.__enter__()
+        try:
+            yield traced_file(f)
+        except BaseException as e:
+            if not writer.__exit__(type(e), e, e.__traceback__):
+                raise
+        else:
+            with span('disk_write'):
+                writer.__exit__(None, None, None)
+
+
+class TracedCursor:
+    """DB-API cursor proxy timing statements and fetches as ``db_query`` spans."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._raw.__exit__(*exc_info)
+
+    def execute(self, *args, **kwargs):
+        with span('db_query'):
+            return self._raw.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with span('db_query'):
+            return self._raw.executemany(*args, **kwargs)
+
+    def fetchone(self):
+        with span('db_query'):
+            return self._raw.fetchone()
+
+    def fetchmany(self, *args, **kwargs):
+        with span('db_query'):
+            return self._raw.fetchmany(*args, **kwargs)
+
+    def fetchall(self):
+        with span('db_query'):
+            return self._raw.fetchall()
+
+
+class TracedConnection:
+    """Driver connection proxy whose cursors, commits and rollbacks are timed as ``db_query``."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._raw.cursor(*args, **kwargs))
+
+    def commit(self):
+        with span('db_query'):
+            self._raw.commit()
+
+    def rollback(self):
+        with span('db_query'):
+            self._raw.rollback()
+
+
+def traced_connect(connect):
+    """Wrap a connection factory so that its connections are traced."""
+    return lambda: TracedConnection(connect())
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with encoding and decoding timed as ``json`` spans."""
+
+    def dumps(self, obj, **kwargs):
+        with span('json'):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with span('json'):
+            return super().loads(s, **kwargs)
+
+
+class RequestMetrics:
+    """Prometheus histograms of request latency and span time, and the sampled request log.
+
+    Under several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+    directory before starting them; ``exposition()`` then aggregates every
+    worker's values.
+    """
+
+    def __init__(self, buckets, log_sample_rate=0.0, logger=None):
+        self.registry = CollectorRegistry()
+        self.request_seconds = Histogram(
+            'dms_request_duration_seconds', 'Request latency, until the response body has been sent.',
+            ['method', 'route', 'status'], buckets=buckets, registry=self.registry)
+        self.span_seconds = Histogram(
+            'dms_request_span_seconds', 'Time one request spent in each kind of span.',
+            ['route', 'span'], buckets=buckets, registry=self.registry)
+        self.span_calls = Counter(
+            'dms_request_span_calls', 'Spans entered, such as queries run, per route.',
+            ['route', 'span'], registry=self.registry)
+        self.uploads = Counter(
+            'dms_uploads', 'Files uploaded, by whether their content was already stored.',
+            ['deduplicated'], registry=self.registry)
+        # labels() validates and locks on every call; the children never change once created
+        self._request_series = {}
+        self._span_series = {}
+        self.log_sample_rate = log_sample_rate
+        self.logger = logger
+
+    def start(self, method, path):
+        trace = Trace(method, path)
+        _current.set(trace)
+        return trace
+
+    def finish(self, trace, status):
+        elapsed = _clock() - trace.started
+        if _current.get() is trace:
+            _current.set(None)
+        key = (trace.method, trace.route, status)
+        series = self._request_series.get(key)
+        if series is None:
+            series = self._request_series[key] = self.request_seconds.labels(trace.method, trace.route, str(status))
+        series.observe(elapsed)
+        for name, (seconds, calls) in trace.spans.items():
+            key = (trace.route, name)
+            series = self._span_series.get(key)
+            if series is None:
+                series = self._span_series[key] = (self.span_seconds.labels(trace.route, name),
+                                                   self.span_calls.labels(trace.route, name))
+            series[0].observe(seconds)
+            series[1].inc(calls)
+        if self.logger is not None and random.random() < self.log_sample_rate:
+            self.logger.info(json.dumps({
+                'ts': datetime.now().isoformat(timespec='milliseconds'),
+                'method': trace.method,
+                'route': trace.route,
+                'path': trace.path,
+                'status': status,
+                'duration_ms': round(elapsed * 1000, 3),
+                'spans': {name: {'ms': round(seconds * 1000, 3), 'calls': calls}
+                          for name, (seconds, calls) in trace.spans.items()},
+            }))
+
+    def count_upload(self, deduplicated):
+        self.uploads.labels('true' if deduplicated else 'false').inc()
+
+    def exposition(self):
+        """Return the metrics in the Prometheus text format, with their content type."""
+        registry = self.registry
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """WSGI middleware tracing each request until its response has been sent.
+
+    The app labels the trace with its matched route (see ``Trace.route``).
+    """
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        trace = self.metrics.start(environ['REQUEST_METHOD'], environ.get('PATH_INFO', ''))
+        status = []
+
+        def traced_start_response(status_line, headers, exc_info=None):
+            status[:] = [int(status_line.split(' ', 1)[0])]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            iterable = self.wsgi_app(environ, traced_start_response)
+        except BaseException:
+            self.metrics.finish(trace, 500)
+            raise
+        return ClosingIterator(iterable, lambda: self.metrics.finish(trace, status[0] if status else 500))
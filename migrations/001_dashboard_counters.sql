@@ -0,0 +1,18 @@
+-- Maintained row counts for the admin dashboard, so polling it does not
+-- scan the documents and users tables. Routes adjust these rows in the
+-- same transaction as the insert/delete they count.
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    name VARCHAR(32) NOT NULL PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO dashboard_counters (name, value)
+SELECT 'documents', COUNT(*) FROM documents
+ON DUPLICATE KEY UPDATE value = VALUES(value);
+
+INSERT INTO dashboard_counters (name, value)
+SELECT 'users', COUNT(*) FROM users
+ON DUPLICATE KEY UPDATE value = VALUES(value);
+
+-- Serves "latest N activities" without sorting the whole table.
+CREATE INDEX idx_activity_logs_timestamp ON activity_logs (timestamp);
@@ -0,0 +1,6 @@
+-- Keyset pagination for /get_documents walks documents newest first on
+-- (upload_date, id) within status (and user_id for regular users). These
+-- indexes let both the page query and the per-user COUNT(*) use a range scan
+-- instead of sorting or skipping OFFSET rows.
+CREATE INDEX idx_documents_status_user_date ON documents (status, user_id, upload_date, id);
+CREATE INDEX idx_documents_status_date ON documents (status, upload_date, id);
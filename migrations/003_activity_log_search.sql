@@ -0,0 +1,4 @@
+-- Activity log search: full-text matching on the action text, exact user
+-- filtering with time ranges, and newest-first paging on the primary key.
+ALTER TABLE activity_logs ADD FULLTEXT INDEX ft_activity_logs_action (action);
+CREATE INDEX idx_activity_logs_user_time ON activity_logs (user_id, timestamp);
@@ -0,0 +1,14 @@
+-- Content-addressed blob store: one row per encrypted blob, named by a keyed
+-- hash of its plaintext and shared by every document with that content.
+-- Documents uploaded before this migration keep content_hash NULL and their
+-- own file under uploads/.
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash CHAR(64) NOT NULL PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_blobs_ref_count (ref_count)
+);
+
+ALTER TABLE documents ADD COLUMN content_hash CHAR(64) NULL;
+CREATE INDEX idx_documents_content_hash ON documents (content_hash);
@@ -0,0 +1,20 @@
+-- Bearer tokens: per-user revocation times (epoch seconds) checked against
+-- the access token's iat, and single-use refresh tokens stored as SHA-256
+-- hashes. family_id ties rotated tokens together so reuse of an old one can
+-- revoke the whole chain.
+CREATE TABLE IF NOT EXISTS token_revocations (
+    user_id INT NOT NULL PRIMARY KEY,
+    revoked_at BIGINT NOT NULL,
+    INDEX idx_token_revocations_revoked_at (revoked_at)
+);
+
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    token_hash CHAR(64) NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    family_id CHAR(32) NOT NULL,
+    expires_at DATETIME NOT NULL,
+    used_at DATETIME NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_refresh_tokens_user (user_id),
+    INDEX idx_refresh_tokens_family (family_id)
+);
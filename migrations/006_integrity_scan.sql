@@ -0,0 +1,18 @@
+-- Results of `flask scan-integrity`, one row per stored object. version and
+-- size are what the object looked like when it was checked, so the next scan
+-- only re-checks objects that changed; seen_at is the start of the last scan
+-- that found the object, so rows for deleted objects can be dropped.
+CREATE TABLE IF NOT EXISTS integrity_scan (
+    storage_key VARCHAR(512) NOT NULL PRIMARY KEY,
+    version VARCHAR(64) NOT NULL,
+    size BIGINT NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    detail VARCHAR(255) NULL,
+    checked_at DATETIME NOT NULL,
+    seen_at DATETIME NOT NULL,
+    INDEX idx_integrity_scan_status (status),
+    INDEX idx_integrity_scan_seen_at (seen_at)
+);
+
+-- Matches stored objects to their documents when looking for orphans
+CREATE INDEX idx_documents_file_path ON documents (file_path);
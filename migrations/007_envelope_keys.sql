@@ -0,0 +1,8 @@
+-- Envelope encryption: each content-addressed blob gets its own data key,
+-- stored wrapped by the master key of version key_version (see envelope.py).
+-- Blobs stored before this migration keep NULLs and are decrypted with the
+-- key derived from ENCRYPTION_KEY.
+ALTER TABLE blobs
+    ADD COLUMN key_version INT NULL,
+    ADD COLUMN wrapped_key VARBINARY(60) NULL;
+CREATE INDEX idx_blobs_key_version ON blobs (key_version);
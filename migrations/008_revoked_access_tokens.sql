@@ -0,0 +1,8 @@
+-- Access tokens revoked one at a time (on logout), by their jti claim, until
+-- they expire (epoch seconds). Expired rows are deleted by later logouts.
+CREATE TABLE IF NOT EXISTS revoked_access_tokens (
+    jti CHAR(22) NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    expires_at BIGINT NOT NULL,
+    INDEX idx_revoked_access_tokens_expires_at (expires_at)
+);
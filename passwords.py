@@ -0,0 +1,64 @@
+"""Password hashing with bcrypt or argon2, and detection of hashes that need upgrading.
+
+The scheme of a stored hash is read from its prefix, so both kinds verify
+side by side while users are migrated on their next login. All functions
+are top-level so they can run in a process pool.
+"""
+import bcrypt
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:  # optional dependency
+    PasswordHasher = None
+
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+ARGON2_PREFIX = '$argon2'
+
+
+def _argon2(params):
+    if PasswordHasher is None:
+        raise RuntimeError("argon2 hashing needs the argon2-cffi package")
+    return PasswordHasher(**(params or {}))
+
+
+def hash_password(password, scheme='bcrypt', bcrypt_rounds=12, argon2_params=None):
+    """Hash ``password`` with ``scheme`` ('bcrypt' or 'argon2') and return it as text."""
+    if scheme == 'argon2':
+        return _argon2(argon2_params).hash(password)
+    if scheme == 'bcrypt':
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds)).decode('utf-8')
+    raise ValueError(f"Unknown password hash scheme: {scheme}")
+
+
+def verify_password(password, stored):
+    """Check ``password`` against a stored bcrypt or argon2 hash."""
+    if stored.startswith(ARGON2_PREFIX):
+        try:
+            return _argon2(None).verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    if stored.startswith(BCRYPT_PREFIXES):
+        return bcrypt.checkpw(password.encode('utf-8'), stored.encode('utf-8'))
+    return False
+
+
+def needs_rehash(stored, scheme='bcrypt', bcrypt_rounds=12, argon2_params=None):
+    """Tell whether ``stored`` was made with another scheme or other cost parameters."""
+    if scheme == 'argon2':
+        return not stored.startswith(ARGON2_PREFIX) or _argon2(argon2_params).check_needs_rehash(stored)
+    if not stored.startswith(BCRYPT_PREFIXES):
+        return True
+    return int(stored.split('$')[2]) != bcrypt_rounds
+
+
+def verify_and_upgrade(password, stored, scheme='bcrypt', bcrypt_rounds=12, argon2_params=None):
+    """Verify ``password`` and, if ``stored`` is outdated, rehash it in the same job.
+
+    Returns ``(valid, new_hash)``; ``new_hash`` is None unless a rehash was needed.
+    """
+    if not verify_password(password, stored):
+        return False, None
+    if needs_rehash(stored, scheme, bcrypt_rounds, argon2_params):
+        return True, hash_password(password, scheme, bcrypt_rounds, argon2_params)
+    return True, None
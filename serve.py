@@ -0,0 +1,329 @@
+"""Production entry point: a prefork launcher for the Flask app.
+
+The master process binds the listening socket, forks ``SERVE_WORKERS``
+worker processes and supervises them. Each worker imports the app itself,
+warms up its per-process state (``server.warm_up``) and serves requests on
+a bounded thread pool. With ``SERVE_REUSE_PORT`` every worker binds its own
+``SO_REUSEPORT`` socket instead and the kernel spreads connections between
+them.
+
+Signals sent to the master:
+
+- ``SIGHUP``: graceful reload. New workers are started (re-importing the
+  code unless ``--preload`` is used) and, once they are warmed up, the old
+  ones stop accepting and finish their in-flight requests. Responses that
+  never finish (the activity stream) are ended through the app module's
+  ``shut_down`` hook.
+- ``SIGTERM`` / ``SIGINT``: graceful shutdown.
+- ``SIGQUIT``: immediate shutdown.
+
+    python serve.py --workers 4 --port 8080
+"""
+import argparse
+import importlib
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from flask import Config
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_settings():
+    # Read without importing config, so a reload picks up changes to it
+    config = Config(ROOT)
+    config.from_pyfile('config.py')
+    return config
+
+
+def default_workers():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_app(spec):
+    module_name, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attr or 'app')
+
+
+def listen(host, port, backlog, reuse_port=False):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerRequestHandler(WSGIRequestHandler):
+    # Idle keep-alive connections give their thread back after this many seconds
+    timeout = 30
+    access_log = False
+
+    def log_request(self, code='-', size='-'):
+        if self.access_log:
+            super().log_request(code, size)
+
+
+class WorkerServer(ThreadedWSGIServer):
+    """Werkzeug's threaded server with at most ``threads`` requests at a time.
+
+    Once every thread is busy the worker stops accepting, leaving new
+    connections in the shared backlog for a less busy worker.
+    """
+
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, *args, threads=64, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+def shut_down(server, app):
+    """Stop `server` gracefully, first ending the app's never-ending (streaming) responses."""
+    hook = getattr(sys.modules.get(app.import_name), 'shut_down', None)
+    if hook is not None:
+        hook()
+    server.shutdown()
+
+
+def run_worker(options, sock, ready_fd):
+    """Body of a worker process; returns its exit status."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGQUIT, lambda signum, frame: os._exit(1))
+
+    if sock is None:
+        sock = listen(options.host, options.port, options.backlog, reuse_port=True)
+    WorkerRequestHandler.timeout = options.timeout
+    WorkerRequestHandler.access_log = options.access_log
+    app = options.app or load_app(options.app_spec)
+    warm_up = getattr(sys.modules.get(app.import_name), 'warm_up', None)
+    if warm_up is not None:
+        warm_up()
+
+    server = WorkerServer(options.host, options.port, app, handler=WorkerRequestHandler,
+                          fd=sock.fileno(), threads=options.threads)
+    sock.close()
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, which runs on this thread
+        threading.Thread(target=shut_down, args=(server, app), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()  # joins the request threads still running
+    return 0
+
+
+class Master:
+    def __init__(self, options):
+        self.options = options
+        self.socket = None
+        self.workers = {}       # pid -> generation
+        self.ready = {}         # read end of the ready pipe -> pid
+        self.retiring = {}      # pid -> deadline for a graceful exit
+        self.generation = 0
+        self.signals = []
+
+    def spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 1
+            try:
+                status = run_worker(self.options, self.socket, write_fd)
+            except Exception as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+            finally:
+                # Flush what the app registered (audit log writer, worker pools)
+                import atexit
+                atexit._run_exitfuncs()
+                os._exit(status)
+        os.close(write_fd)
+        self.workers[pid] = self.generation
+        self.ready[read_fd] = pid
+        return pid
+
+    def spawn_generation(self):
+        """Start a full set of workers and wait until they are warmed up."""
+        self.generation += 1
+        pids = {self.spawn() for _ in range(self.options.workers)}
+        deadline = time.monotonic() + self.options.boot_timeout
+        waiting = [fd for fd, pid in self.ready.items() if pid in pids]
+        failed = False
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select(waiting, [], [], remaining)
+            for fd in readable:
+                # End of file instead of the ready byte: the worker died while booting
+                failed = failed or not os.read(fd, 1)
+                os.close(fd)
+                waiting.remove(fd)
+                del self.ready[fd]
+        for fd in waiting:
+            os.close(fd)
+            del self.ready[fd]
+        self.reap()
+        return not (failed or waiting or any(pid not in self.workers for pid in pids))
+
+    def retire(self, pids, graceful=True):
+        deadline = time.monotonic() + self.options.graceful_timeout
+        for pid in pids:
+            if pid in self.workers:
+                self.kill(pid, signal.SIGTERM if graceful else signal.SIGKILL)
+                self.retiring[pid] = deadline
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        """Collect exited workers; returns the pids that exited unexpectedly."""
+        crashed = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            self.workers.pop(pid, None)
+            if self.retiring.pop(pid, None) is None:
+                crashed.append(pid)
+                print(f"Worker {pid} exited unexpectedly (status {os.waitstatus_to_exitcode(status)})")
+        return crashed
+
+    def reload(self):
+        old = [pid for pid, generation in self.workers.items() if generation == self.generation]
+        print(f"Reloading: starting {self.options.workers} new worker(s)")
+        if not self.spawn_generation():
+            # Keep serving with the old workers rather than go down on a bad deploy
+            print("New workers failed to start; keeping the current ones")
+            self.retire([pid for pid, generation in self.workers.items() if generation == self.generation])
+            self.generation -= 1
+            return
+        self.retire(old)
+
+    def stop(self, graceful=True):
+        self.retire(list(self.workers), graceful)
+        while self.workers:
+            self.reap()
+            now = time.monotonic()
+            for pid, deadline in list(self.retiring.items()):
+                if now > deadline:
+                    self.kill(pid, signal.SIGKILL)
+            time.sleep(0.1)
+
+    def run(self):
+        options = self.options
+        if not options.reuse_port:
+            self.socket = listen(options.host, options.port, options.backlog)
+        if options.preload:
+            options.app = load_app(options.app_spec)
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+
+        if not self.spawn_generation():
+            print("Workers failed to start")
+            self.stop(graceful=False)
+            return 1
+        print(f"Serving {options.app_spec} on http://{options.host}:{options.port} "
+              f"with {options.workers} worker(s) (master pid {os.getpid()})")
+
+        while True:
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                elif signum == signal.SIGQUIT:
+                    self.stop(graceful=False)
+                    return 0
+                else:
+                    print("Shutting down")
+                    self.stop()
+                    return 0
+
+            for pid in self.reap():
+                self.spawn()
+            now = time.monotonic()
+            for pid, deadline in list(self.retiring.items()):
+                if now > deadline:
+                    self.kill(pid, signal.SIGKILL)
+            # Workers started to replace crashed ones report ready on their own time
+            for fd in list(self.ready):
+                if select.select([fd], [], [], 0)[0]:
+                    os.close(fd)
+                    del self.ready[fd]
+            time.sleep(0.5)
+
+
+def main():
+    settings = load_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', dest='app_spec', default='server:app', help='module:attribute of the WSGI app')
+    parser.add_argument('--host', default=settings['SERVE_HOST'])
+    parser.add_argument('--port', type=int, default=settings['SERVE_PORT'])
+    parser.add_argument('--workers', type=int, default=settings['SERVE_WORKERS'] or default_workers())
+    parser.add_argument('--threads', type=int, default=settings['SERVE_THREADS'],
+                        help='requests handled at once per worker')
+    parser.add_argument('--backlog', type=int, default=settings['SERVE_BACKLOG'])
+    parser.add_argument('--timeout', type=int, default=settings['SERVE_TIMEOUT'],
+                        help='seconds an idle connection is kept open')
+    parser.add_argument('--graceful-timeout', type=int, default=settings['SERVE_GRACEFUL_TIMEOUT'])
+    parser.add_argument('--boot-timeout', type=int, default=settings['SERVE_BOOT_TIMEOUT'])
+    parser.add_argument('--access-log', action='store_true', default=settings['SERVE_ACCESS_LOG'],
+                        help='log every request to stderr')
+    parser.add_argument('--reuse-port', action='store_true', default=settings['SERVE_REUSE_PORT'],
+                        help='each worker binds its own SO_REUSEPORT socket')
+    parser.add_argument('--preload', action='store_true', default=settings['SERVE_PRELOAD'],
+                        help='import the app once in the master (reloads then keep the old code)')
+    options = parser.parse_args()
+    options.app = None
+    if options.reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('SO_REUSEPORT is not available on this platform')
+
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    sys.exit(Master(options).run())
+
+
+if __name__ == '__main__':
+    main()
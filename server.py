@@ -1,21 +1,60 @@
+import atexit
+import base64
+import io
+import logging
+import multiprocessing
 import os
-from flask import Flask, session, request, jsonify, send_from_directory, render_template, make_response, abort
+import re
+import secrets
+import zipfile
+from flask import Flask, Response, stream_with_context, session, request, jsonify, send_from_directory, render_template, make_response, abort, g, has_app_context
 from flask_session import Session
 from werkzeug.utils import secure_filename
-import jwt
 from datetime import datetime, timedelta
-import bcrypt
-from functools import wraps
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+from itertools import chain, islice
 import mysql.connector
 from config import DATABASE_CONFIG
 from flask_cors import CORS
 import traceback
-from cryptography.fernet import Fernet, InvalidToken
+import time
+import click
+from cryptography.fernet import Fernet
 from config import ENCRYPTION_KEY
+from chunked_crypto import (CorruptBlobError, derive_chunk_key, encrypt_stream, is_chunked, iter_decrypt,
+                            iter_decrypt_range, iter_plaintext, plaintext_size, read_header, MAGIC)
+from db_pool import ConnectionPool, PoolTimeout
+from worker_pool import BoundedExecutor, PoolSaturated
+from blob_store import BLOB_PREFIX, blob_key, content_hash, derive_hash_key
+from compression import CODEC_NONE, choose_codec, choose_codec_from_prefix, resolve_codec
+from event_bus import EventBus, TablePoller
+from audit_log import AuditLogWriter, INSERT_QUERY as ACTIVITY_INSERT_QUERY
+from sqlite_session import SQLiteSessionInterface
+from passwords import hash_password, verify_and_upgrade
+from storage import LocalStorage, S3Storage
+from envelope import DataKeyCache, KeyUnwrapError, MasterKeyring, create_first_master_key, new_data_key
+from integrity import STATUS_ERROR, STATUS_OK, check_object, init_worker
+from zip_stream import iter_zip
+from metrics import (MetricsMiddleware, RequestMetrics, TracedJSONProvider, TracedStorage, current_trace, span,
+                     traced_connect, traced_iter)
+from auth_tokens import (RevocationList, decode_access_token, hash_refresh_token, mint_access_token,
+                         new_refresh_token)
+import json
 
 app = Flask(__name__, static_folder='frontend', static_url_path='')
 app.config.from_pyfile('config.py')
-Session(app)
+if app.config['SESSION_TYPE'] == 'sqlite':
+    app.session_interface = SQLiteSessionInterface(
+        app.config['SESSION_SQLITE_PATH'],
+        cache_size=app.config['SESSION_CACHE_SIZE'],
+        sweep_interval=app.config['SESSION_SWEEP_INTERVAL'],
+        permanent=app.config['SESSION_PERMANENT'],
+    )
+else:
+    Session(app)
 CORS(app, resources={
     r"/*": {
         "origins": ["http://127.0.0.1:8080", "http://localhost:8080"],
@@ -25,7 +64,26 @@ CORS(app, resources={
     }
 })
 
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+def label_request_trace():
+    # Routes, not paths, so that document ids do not each get their own series
+    trace = current_trace()
+    if trace is not None and request.url_rule is not None:
+        trace.route = request.url_rule.rule
+
+request_metrics = None
+if app.config['METRICS_ENABLED']:
+    request_log = logging.getLogger('dms.requests')
+    if not request_log.handlers:
+        request_log.addHandler(logging.StreamHandler())
+        request_log.setLevel(logging.INFO)
+        request_log.propagate = False
+    request_metrics = RequestMetrics(app.config['METRICS_BUCKETS'], app.config['REQUEST_LOG_SAMPLE_RATE'],
+                                     request_log)
+    app.json = TracedJSONProvider(app)
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, request_metrics)
+    app.before_request(label_request_trace)
+
+UPLOAD_FOLDER = os.environ.get('DMS_UPLOAD_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
@@ -42,63 +100,500 @@ def generate_fernet_key():
             raise
     return generate_fernet_key.fernet
 
+def get_chunk_key():
+    """Create or retrieve the AES-GCM key used for chunked blobs."""
+    if not hasattr(get_chunk_key, 'key'):
+        get_chunk_key.key = derive_chunk_key(ENCRYPTION_KEY)
+    return get_chunk_key.key
+
+def get_hash_key():
+    """Create or retrieve the HMAC key that names content-addressed blobs."""
+    if not hasattr(get_hash_key, 'key'):
+        get_hash_key.key = derive_hash_key(ENCRYPTION_KEY)
+    return get_hash_key.key
+
+def get_keyring():
+    """Create or retrieve the versioned master keys that wrap per-blob data keys."""
+    if not hasattr(get_keyring, 'keyring'):
+        get_keyring.keyring = MasterKeyring(app.config['MASTER_KEY_DIR'])
+    return get_keyring.keyring
+
+def get_data_key_cache():
+    """Create or retrieve the cache of unwrapped data keys."""
+    if not hasattr(get_data_key_cache, 'cache'):
+        get_data_key_cache.cache = DataKeyCache(get_keyring(), app.config['DATA_KEY_CACHE_SIZE'],
+                                                app.config['DATA_KEY_CACHE_TTL'])
+    return get_data_key_cache.cache
+
+def blob_data_key(key_version, wrapped_key):
+    """AES-GCM key of a blob from its `blobs` row; rows from before envelope encryption have NULLs."""
+    if wrapped_key is None:
+        return get_chunk_key()
+    return get_data_key_cache().get(key_version, wrapped_key)
+
+def get_storage():
+    """Create or retrieve the document storage backend selected by STORAGE_BACKEND."""
+    if not hasattr(get_storage, 'storage'):
+        if app.config['STORAGE_BACKEND'] == 's3':
+            get_storage.storage = S3Storage(
+                app.config['S3_BUCKET'],
+                prefix=app.config['S3_PREFIX'],
+                endpoint_url=app.config['S3_ENDPOINT_URL'],
+                region=app.config['S3_REGION'],
+                access_key=app.config['S3_ACCESS_KEY_ID'],
+                secret_key=app.config['S3_SECRET_ACCESS_KEY'],
+                part_size=app.config['S3_PART_SIZE'],
+                max_connections=app.config['S3_MAX_CONNECTIONS'],
+            )
+        else:
+            get_storage.storage = LocalStorage(app.config['UPLOAD_FOLDER'])
+        if app.config['METRICS_ENABLED']:
+            get_storage.storage = TracedStorage(get_storage.storage)
+    return get_storage.storage
+
+def storage_key(file_path):
+    """Storage key for a `documents.file_path` value.
+
+    Rows written before storage keys hold absolute paths under UPLOAD_FOLDER;
+    `flask relativize-paths` rewrites them.
+    """
+    if os.path.isabs(file_path):
+        return os.path.relpath(file_path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    return file_path
+
+def content_key(digest):
+    return blob_key(digest, app.config['BLOB_SHARD_DEPTH'])
+
+def relativized_key(file_path, digest):
+    """Storage key that `flask relativize-paths` gives a document with an absolute `file_path`."""
+    if digest:
+        return content_key(digest)
+    key = storage_key(file_path)
+    if key.startswith('..'):
+        # Legacy files were stored directly in an upload folder that has since moved
+        key = os.path.basename(file_path)
+    return key
+
+def get_crypto_pool():
+    """Create or retrieve the worker pool that encryption and decryption run on."""
+    if not hasattr(get_crypto_pool, 'pool'):
+        get_crypto_pool.pool = BoundedExecutor(
+            'crypto',
+            max_workers=app.config['CRYPTO_POOL_WORKERS'],
+            max_queue=app.config['CRYPTO_POOL_QUEUE'],
+            kind=app.config['CRYPTO_POOL_KIND'],
+            retry_after=app.config['CRYPTO_POOL_RETRY_AFTER'],
+        )
+        atexit.register(get_crypto_pool.pool.shutdown)
+    return get_crypto_pool.pool
+
+def get_password_pool():
+    """Create or retrieve the worker pool that password hashing runs on.
+
+    Kept apart from the crypto pool and capped low, so a burst of logins
+    cannot take every core away from downloads.
+    """
+    if not hasattr(get_password_pool, 'pool'):
+        get_password_pool.pool = BoundedExecutor(
+            'password',
+            max_workers=app.config['PASSWORD_HASH_WORKERS'] or max(1, (os.cpu_count() or 1) // 2),
+            max_queue=app.config['PASSWORD_HASH_QUEUE'],
+            kind=app.config['PASSWORD_HASH_POOL_KIND'],
+            retry_after=app.config['PASSWORD_HASH_RETRY_AFTER'],
+        )
+        atexit.register(get_password_pool.pool.shutdown)
+    return get_password_pool.pool
+
+def get_upload_pool():
+    """Create or retrieve the worker pool that stores the files of a batch upload side by side.
+
+    Each job still seals its chunks on the crypto pool.
+    """
+    if not hasattr(get_upload_pool, 'pool'):
+        get_upload_pool.pool = BoundedExecutor(
+            'upload',
+            max_workers=app.config['UPLOAD_POOL_WORKERS'],
+            max_queue=app.config['UPLOAD_POOL_QUEUE'],
+            retry_after=app.config['CRYPTO_POOL_RETRY_AFTER'],
+        )
+        atexit.register(get_upload_pool.pool.shutdown)
+    return get_upload_pool.pool
+
+def password_hash_options():
+    return (app.config['PASSWORD_HASH_SCHEME'], app.config['BCRYPT_ROUNDS'], app.config['ARGON2_PARAMS'])
+
+def crypto_submit(fn, *args):
+    """Queue a crypto job, blocking while the pool is full (used once a request is admitted)."""
+    return get_crypto_pool().submit(fn, *args, wait=True)
+
+def crypto_options():
+    return {'submit': crypto_submit, 'window': app.config['CRYPTO_POOL_WINDOW']}
+
+def saturated_response(error):
+    response = jsonify({"success": False, "message": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.errorhandler(PoolSaturated)
+def handle_pool_saturated(error):
+    return saturated_response(error)
+
+def upload_codec(filename, fp):
+    """Pick the compression codec for an upload from its name and leading bytes."""
+    return choose_codec(filename, fp, resolve_codec(app.config['COMPRESSION']),
+                        app.config['COMPRESSION_MIN_SAVING'])
+
+def store_upload_encrypted(filename, src, key, data_key):
+    """Store an uploaded file's plaintext encrypted under `key`, compressed if it pays off."""
+    if isinstance(src, zipfile.ZipExtFile):
+        # Every seek in a ZIP member restarts its decompression, so sample a prefix read once instead
+        codec, src = choose_codec_from_prefix(filename, src, resolve_codec(app.config['COMPRESSION']),
+                                              app.config['COMPRESSION_MIN_SAVING'])
+    else:
+        codec = upload_codec(filename, src)
+    store_encrypted(src, key, codec, data_key)
+
+def store_encrypted(src, key, codec=CODEC_NONE, data_key=None):
+    """Stream-encrypt the readable `src` into storage under `key` in the chunked format.
+
+    `data_key` defaults to the key derived from ENCRYPTION_KEY.
+    """
+    with get_storage().writer(key) as f, span('crypto'):
+        encrypt_stream(src, f, data_key or get_chunk_key(), app.config['ENCRYPTION_CHUNK_SIZE'],
+                       **crypto_options(), codec=codec, level=app.config['COMPRESSION_LEVEL'])
+
+def iter_decrypted_file(key, data_key=None):
+    """Yield the plaintext of a stored blob (chunked or legacy Fernet)."""
+    f, _ = get_storage().open(key)
+    with f:
+        yield from traced_iter(iter_plaintext(f, data_key or get_chunk_key(), generate_fernet_key(),
+                                              **crypto_options()), 'crypto')
+
 def encrypt_file(file_data):
-    """Encrypt file data using Fernet."""
+    """Encrypt file data into the chunked format."""
     try:
         if not isinstance(file_data, bytes):
             raise ValueError("Input must be bytes")
-            
-        fernet = generate_fernet_key()
-        return fernet.encrypt(file_data)
+
+        out = io.BytesIO()
+        with span('crypto'):
+            encrypt_stream(io.BytesIO(file_data), out, get_chunk_key(), app.config['ENCRYPTION_CHUNK_SIZE'],
+                           **crypto_options())
+        return out.getvalue()
     except Exception as e:
         print(f"Encryption error: {e}")
         traceback.print_exc()
         raise
 
-def decrypt_file(encrypted_data):
-    """Decrypt file data using Fernet."""
+def decrypt_file(encrypted_data, data_key=None):
+    """Decrypt file data in either the chunked or the legacy Fernet format."""
     try:
         if not encrypted_data:
             raise ValueError("No data to decrypt")
-            
-        fernet = generate_fernet_key()
-        return fernet.decrypt(encrypted_data)
-    except InvalidToken:
+
+        with span('crypto'):
+            return b''.join(iter_plaintext(io.BytesIO(encrypted_data), data_key or get_chunk_key(),
+                                           generate_fernet_key(), **crypto_options()))
+    except CorruptBlobError:
         raise Exception("Invalid or corrupted encrypted data")
     except Exception as e:
         print(f"Decryption error: {e}")
         traceback.print_exc()
         raise
 
+def get_db_pool():
+    """Create or retrieve the process-wide database connection pool."""
+    if not hasattr(get_db_pool, 'pool'):
+        connect = lambda: mysql.connector.connect(**DATABASE_CONFIG)
+        get_db_pool.pool = ConnectionPool(
+            traced_connect(connect) if app.config['METRICS_ENABLED'] else connect,
+            size=app.config['DB_POOL_SIZE'],
+            max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+            timeout=app.config['DB_POOL_TIMEOUT'],
+            recycle=app.config['DB_POOL_RECYCLE'],
+            pre_ping=app.config['DB_POOL_PRE_PING'],
+        )
+    return get_db_pool.pool
+
 def create_connection():
+    """Check out a pooled connection; it is shared for the rest of the request."""
+    if has_app_context():
+        connection = g.get('db_connection')
+        if connection is not None and connection.checked_out:
+            return connection
     try:
-        connection = mysql.connector.connect(**DATABASE_CONFIG)
-        return connection
-    except mysql.connector.Error as err:
+        with span('db_connect'):
+            connection = get_db_pool().checkout()
+    except (mysql.connector.Error, PoolTimeout) as err:
         print(f"Error connecting to database: {err}")
         return None
+    if has_app_context():
+        g.db_connection = connection
+    return connection
+
+@app.teardown_appcontext
+def release_connection(exception):
+    # Routes close their connection in `finally`, this only catches leftovers.
+    connection = g.pop('db_connection', None)
+    if connection is not None:
+        connection.close()
+
+def bump_counter(cursor, name, delta):
+    """Adjust a maintained dashboard counter inside the caller's transaction."""
+    if delta:
+        cursor.execute("UPDATE dashboard_counters SET value = value + %s WHERE name = %s", (delta, name))
+
+def release_blobs(cursor, references):
+    """Drop document references to stored blobs, given as (content_hash, count) pairs.
+
+    Blobs are only deleted from disk by `flask gc-blobs` once nothing refers to them.
+    """
+    params = [(count, digest) for digest, count in references if digest and count]
+    if params:
+        cursor.executemany("UPDATE blobs SET ref_count = ref_count - %s WHERE content_hash = %s", params)
+
+def remove_legacy_file(file_path, digest):
+    """Remove a document file stored before content addressing (one file per document)."""
+    if digest is None:
+        try:
+            get_storage().delete(storage_key(file_path))
+        except ValueError:
+            print(f"Not deleting {file_path}: outside storage (run flask relativize-paths)")
+
+def read_counters(cursor):
+    """Return the maintained dashboard counters as a dict."""
+    cursor.execute("SELECT name, value FROM dashboard_counters")
+    return {name: value for name, value in cursor.fetchall()}
+
+def activity_events(rows):
+    return [(row_id, 'activity', {'user_id': user_id, 'action': action,
+                                  'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S')})
+            for row_id, user_id, action, timestamp in rows]
+
+def fetch_activity(after, missing, limit):
+    """activity_logs rows with an id above `after` or in `missing`, as live feed events."""
+    connection = get_db_pool().checkout()
+    try:
+        cursor = connection.cursor()
+        query = "SELECT id, user_id, action, timestamp FROM activity_logs WHERE id > %s"
+        if missing:
+            query += f" OR id IN ({', '.join(['%s'] * len(missing))})"
+        cursor.execute(query + " ORDER BY id LIMIT %s", (after, *missing, limit))
+        rows = cursor.fetchall()
+        # Each poll must see rows committed since the previous one
+        connection.commit()
+        return activity_events(rows)
+    finally:
+        connection.close()
+
+def recent_activity(limit):
+    connection = get_db_pool().checkout()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT id, user_id, action, timestamp FROM activity_logs ORDER BY id DESC LIMIT %s",
+                       (limit,))
+        rows = cursor.fetchall()
+        connection.commit()
+        return activity_events(rows)
+    finally:
+        connection.close()
+
+def shut_down():
+    """End this process's activity streams so that a graceful stop does not wait them out.
+
+    Called by serve.py in a worker that is told to stop, before it waits for
+    its in-flight requests.
+    """
+    if hasattr(get_activity_feed, 'poller'):
+        get_activity_feed.poller.bus.close()
+
+def get_activity_feed():
+    """Create or retrieve the live activity feed, started in this process.
+
+    Every process polls activity_logs, so a stream sees the activity of all
+    worker processes.
+    """
+    if not hasattr(get_activity_feed, 'poller'):
+        get_activity_feed.poller = TablePoller(
+            EventBus(history=app.config['ACTIVITY_STREAM_HISTORY'], buffer_size=app.config['ACTIVITY_STREAM_BUFFER']),
+            fetch_activity,
+            recent_activity,
+            interval=app.config['ACTIVITY_STREAM_POLL_INTERVAL'],
+            gap_timeout=app.config['ACTIVITY_STREAM_GAP_TIMEOUT'],
+            history=app.config['ACTIVITY_STREAM_HISTORY'],
+        )
+    get_activity_feed.poller.ensure_started()
+    return get_activity_feed.poller.bus
+
+def get_audit_log():
+    """Create or retrieve the batched activity_logs writer."""
+    if not hasattr(get_audit_log, 'writer'):
+        get_audit_log.writer = AuditLogWriter(
+            get_db_pool().checkout,
+            batch_size=app.config['AUDIT_LOG_BATCH_SIZE'],
+            flush_interval=app.config['AUDIT_LOG_FLUSH_INTERVAL'],
+            max_queue=app.config['AUDIT_LOG_MAX_QUEUE'],
+            spill_path=app.config['AUDIT_LOG_SPILL_FILE'],
+        )
+        atexit.register(get_audit_log.writer.close)
+    return get_audit_log.writer
+
+def warm_up():
+    """Build this process's keys, worker pools and database connections ahead of the first request.
+
+    Called by serve.py in every worker after it forks.
+    """
+    generate_fernet_key()
+    get_chunk_key()
+    get_hash_key()
+    get_data_key_cache()
+    get_storage()
+    get_crypto_pool().run(int)
+    get_password_pool().run(int)
+    get_upload_pool().run(int)
+    get_audit_log()
+    try:
+        connections = [get_db_pool().checkout() for _ in range(app.config['DB_POOL_SIZE'])]
+    except (mysql.connector.Error, PoolTimeout) as err:
+        print(f"Error opening database connections during warm-up: {err}")
+        return
+    for connection in connections:
+        connection.close()
+
+def log_activity(user_id, action):
+    """Queue an activity_logs row for the batched writer.
+
+    For events that do not change any data (such as a login). Data changes
+    record their activity through a unit_of_work() instead. The live feed
+    picks the row up once it is written.
+    """
+    get_audit_log().enqueue(user_id, action, datetime.now())
+
+class UnitOfWork:
+    """A data change and the activity rows describing it, committed as one transaction."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self._activity = []
+
+    def log(self, user_id, action):
+        self._activity.append((user_id, action, datetime.now()))
+
+    def commit(self):
+        if self._activity:
+            self.cursor.executemany(ACTIVITY_INSERT_QUERY, self._activity)
+        self.connection.commit()
+        self._activity = []
+
+@contextmanager
+def unit_of_work(connection):
+    """Run a block as one transaction: committed once on success, rolled back on error."""
+    work = UnitOfWork(connection)
+    try:
+        yield work
+    except Exception:
+        connection.rollback()
+        raise
+    work.commit()
+
+def load_revocations(since):
+    connection = get_db_pool().checkout()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT user_id, revoked_at FROM token_revocations WHERE revoked_at >= %s", (since,))
+        return cursor.fetchall()
+    finally:
+        connection.close()
+
+def load_revoked_tokens(now):
+    connection = get_db_pool().checkout()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT jti, expires_at FROM revoked_access_tokens WHERE expires_at >= %s", (now,))
+        return cursor.fetchall()
+    finally:
+        connection.close()
+
+def get_revocations():
+    """Create or retrieve the in-memory list of users and tokens that were revoked."""
+    if not hasattr(get_revocations, 'revocations'):
+        get_revocations.revocations = RevocationList(
+            load_revocations,
+            token_lifetime=app.config['ACCESS_TOKEN_LIFETIME'],
+            refresh_interval=app.config['TOKEN_REVOCATION_REFRESH'],
+            load_tokens=load_revoked_tokens,
+        )
+    return get_revocations.revocations
+
+def bearer_claims():
+    """Return the claims of a valid, unrevoked `Authorization: Bearer` access token, or None."""
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    claims = decode_access_token(app.config['SECRET_KEY'], header[len('Bearer '):].strip())
+    if claims is None or get_revocations().is_revoked(claims['user_id'], claims['iat'], claims.get('jti')):
+        return None
+    return claims
+
+def bearer_user():
+    """Return the user of a valid `Authorization: Bearer` access token, or None.
+
+    Verified in memory only: no session or database access per request.
+    """
+    claims = bearer_claims()
+    if claims is None:
+        return None
+    return {
+        'id': claims['user_id'],
+        'email': claims.get('email'),
+        'is_admin': claims.get('is_admin', False),
+        'role': 'admin' if claims.get('is_admin') else 'user',
+    }
+
+def issue_refresh_token(cursor, user_id, family_id):
+    """Store a new refresh token of `family_id` (one per login) for `user_id` and return it."""
+    token, token_hash = new_refresh_token()
+    cursor.execute("""
+        INSERT INTO refresh_tokens (token_hash, user_id, family_id, expires_at)
+        VALUES (%s, %s, %s, %s)
+    """, (token_hash, user_id, family_id,
+          datetime.now() + timedelta(seconds=app.config['REFRESH_TOKEN_LIFETIME'])))
+    return token
+
+def revoke_user_tokens(cursor, user_id):
+    """Invalidate every token issued to `user_id` so far; returns the revocation time."""
+    revoked_at = int(time.time())
+    cursor.execute("""
+        INSERT INTO token_revocations (user_id, revoked_at) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE revoked_at = VALUES(revoked_at)
+    """, (user_id, revoked_at))
+    cursor.execute("DELETE FROM refresh_tokens WHERE user_id = %s", (user_id,))
+    return revoked_at
 
 def is_logged_in():
-    return 'user' in session
+    return bearer_user() is not None or 'user' in session
 
 # Custom login_required decorator to ensure `current_user` is passed correctly
 def login_required(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        if 'user' not in session:  # Check if the user is logged in
+        # A bearer token is tried first; without a valid one, fall back to the session
+        current_user = bearer_user() or session.get('user')
+        if not current_user:  # Check if the user is logged in
             return jsonify({'message': 'Unauthorized'}), 401
-        current_user = session['user']  # Extract current user from session
         return func(current_user, *args, **kwargs)  # Pass current_user along with other args
     return wrapper
 
 def admin_required(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        if 'user' not in session:
+        user = bearer_user() or session.get('user')
+        if not user:
             return jsonify({"success": False, "error": "Not logged in"}), 401
-        
-        user = session.get('user')
-        if not user or not user.get('is_admin'):
+
+        if not user.get('is_admin'):
             return jsonify({"success": False, "error": "Admin privileges required"}), 403
             
         return func(user, *args, **kwargs)
@@ -160,8 +655,19 @@ def login():
         user_id, user_email, user_password, is_active, is_admin = user
         if not is_active:
             return jsonify({'message': 'Account is deactivated. Please contact admin.'}), 403
-        if not bcrypt.checkpw(password.encode('utf-8'), user_password.encode('utf-8')):
+        # Verified (and rehashed if the scheme or cost changed) on the password pool
+        try:
+            job = get_password_pool().submit(verify_and_upgrade, password, user_password, *password_hash_options())
+        except PoolSaturated as e:
+            return saturated_response(e)
+        valid, new_hash = job.result()
+        if not valid:
             return jsonify({'message': 'Invalid password'}), 401
+        if new_hash:
+            # Only replace the hash that was verified, in case the password changed meanwhile
+            with unit_of_work(connection) as work:
+                work.cursor.execute("UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                                    (new_hash, user_id, user_password))
 
         # Check if the selected role matches the user's actual role
         if selected_role == 'admin' and not is_admin:
@@ -177,24 +683,21 @@ def login():
             'role': 'admin' if is_admin else 'user'  # Add role to session
         }
 
-        # Generate a token (optional if needed)
-        payload = {
-            'user_id': user_id,
-            'email': user_email,
-            'is_admin': is_admin,
-            'exp': datetime.utcnow() + timedelta(hours=1)
-        }
-        token = jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
+        # Tokens for API clients: a short-lived access token and a single-use refresh token.
+        # Logging out ends the refresh token family of this login.
+        family_id = os.urandom(16).hex()
+        session['token_family'] = family_id
+        token = mint_access_token(app.config['SECRET_KEY'], session['user'], app.config['ACCESS_TOKEN_LIFETIME'],
+                                  family_id)
+        with unit_of_work(connection) as work:
+            refresh_token = issue_refresh_token(work.cursor, user_id, family_id)
 
         # Log the login activity
         action = 'logged in as admin' if is_admin else 'logged in as user'
-        cursor.execute("""
-            INSERT INTO activity_logs (user_id, action) 
-            VALUES (%s, %s)
-        """, (user_id, action))
-        connection.commit()
+        log_activity(user_id, action)
 
-        return jsonify({'message': 'Login successful!', 'token': token, 'is_admin': is_admin}), 200
+        return jsonify({'message': 'Login successful!', 'token': token, 'refresh_token': refresh_token,
+                        'expires_in': app.config['ACCESS_TOKEN_LIFETIME'], 'is_admin': is_admin}), 200
 
     except Exception as e:
         print(f"Error during login: {e}")
@@ -203,6 +706,54 @@ def login():
         if connection:
             connection.close()
 
+@app.route('/token/refresh', methods=['POST'])
+def rotate_refresh_token():
+    """Trade a refresh token for a new access token and a new refresh token."""
+    data = request.get_json(silent=True) or {}
+    token = data.get('refresh_token')
+    if not token:
+        return jsonify({'message': 'refresh_token is required'}), 400
+
+    connection = None
+    try:
+        connection = create_connection()
+        if not connection:
+            return jsonify({'message': 'Database connection failed'}), 500
+
+        user = new_token = None
+        with unit_of_work(connection) as work:
+            work.cursor.execute("""
+                SELECT r.user_id, r.family_id, r.used_at, r.expires_at > NOW(), u.email, u.is_admin, u.is_active
+                FROM refresh_tokens r JOIN users u ON u.id = r.user_id
+                WHERE r.token_hash = %s FOR UPDATE
+            """, (hash_refresh_token(token),))
+            row = work.cursor.fetchone()
+            if row:
+                user_id, family_id, used_at, live, email, is_admin, is_active = row
+                if used_at is not None:
+                    # A rotated-out token came back, so the chain may be stolen: end all of it
+                    work.cursor.execute("DELETE FROM refresh_tokens WHERE family_id = %s", (family_id,))
+                    work.log(user_id, 'Refresh token reused, token family revoked')
+                elif live and is_active:
+                    work.cursor.execute("UPDATE refresh_tokens SET used_at = NOW() WHERE token_hash = %s",
+                                        (hash_refresh_token(token),))
+                    new_token = issue_refresh_token(work.cursor, user_id, family_id)
+                    user = {'id': user_id, 'email': email, 'is_admin': is_admin}
+
+        if user is None:
+            return jsonify({'message': 'Invalid or expired refresh token'}), 401
+        access_token = mint_access_token(app.config['SECRET_KEY'], user, app.config['ACCESS_TOKEN_LIFETIME'],
+                                         family_id)
+        return jsonify({'token': access_token, 'refresh_token': new_token,
+                        'expires_in': app.config['ACCESS_TOKEN_LIFETIME']}), 200
+
+    except Exception as e:
+        print(f"Error refreshing token: {e}")
+        return jsonify({'message': 'Token refresh failed', 'error': str(e)}), 500
+    finally:
+        if connection:
+            connection.close()
+
 @app.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -221,35 +772,33 @@ def register():
         if cursor.fetchone():
             return jsonify({'message': 'Email already exists'}), 400
 
-        # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # Hash the password on the password pool
+        try:
+            job = get_password_pool().submit(hash_password, password, *password_hash_options())
+        except PoolSaturated as e:
+            return saturated_response(e)
+        hashed_password = job.result()
 
         # Check if the new user is the first user
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
-        is_admin = user_count == 0
+        cursor.execute("SELECT 1 FROM users LIMIT 1")
+        is_admin = cursor.fetchone() is None
         role = 'admin' if is_admin else 'user'
 
-        # Insert the user with the appropriate role
-        cursor.execute("""
-            INSERT INTO users (email, password, role, is_active, is_admin)
-            VALUES (%s, %s, %s, True, %s)
-        """, (email, hashed_password.decode('utf-8'), role, is_admin))
-        connection.commit()
+        with unit_of_work(connection) as work:
+            # Insert the user with the appropriate role
+            work.cursor.execute("""
+                INSERT INTO users (email, password, role, is_active, is_admin)
+                VALUES (%s, %s, %s, True, %s)
+            """, (email, hashed_password, role, is_admin))
+            user_id = work.cursor.lastrowid
+            bump_counter(work.cursor, 'users', 1)
 
-        # Log the registration activity
-        log_query = """
-            INSERT INTO activity_logs (user_id, action, timestamp)
-            VALUES (%s, %s, NOW())
-        """
-        user_id = cursor.lastrowid
-        cursor.execute(log_query, (user_id, f"Registered new user with email {email}"))
-        connection.commit()
+            # Log the registration activity
+            work.log(user_id, f"Registered new user with email {email}")
 
-        # Log the promotion to admin if applicable
-        if is_admin:
-            cursor.execute(log_query, (user_id, f"Promoted user with email {email} to admin"))
-            connection.commit()
+            # Log the promotion to admin if applicable
+            if is_admin:
+                work.log(user_id, f"Promoted user with email {email} to admin")
 
         return jsonify({'message': 'Registration successful'}), 201
 
@@ -260,34 +809,90 @@ def register():
         if connection:
             connection.close()
 
+def encode_cursor(*values):
+    """Pack a keyset position into an opaque continuation token."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size):
+    """Unpack a continuation token; raises ValueError when it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def page_limit(args=None):
+    args = request.args if args is None else args
+    limit = int(args.get('limit', 10))
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, app.config['MAX_PAGE_SIZE'])
+
+def total_mode(args):
+    """The `total` parameter: keyset requests skip the count unless asked, page/limit requests count exactly."""
+    return args.get('total', 'none' if args.get('cursor') else 'exact')
+
+def page_total(cursor, exact_query, params, counter=None):
+    """Total row count as requested by the `total` parameter (exact, approx or none)."""
+    mode = total_mode(request.args)
+    if mode == 'none':
+        return None
+    if mode == 'approx' and counter:
+        return read_counters(cursor).get(counter)
+    cursor.execute(exact_query, params)
+    return cursor.fetchone()[0]
+
 @app.route('/get_users', methods=['GET'])
 @login_required
 def get_users(current_user):
+    connection = None
     try:
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 10))
-        offset = (page - 1) * limit
+        limit = page_limit()
+        page_cursor = request.args.get('cursor')
 
         connection = create_connection()
         cursor = connection.cursor(dictionary=True)
 
         # Include is_active in the SELECT statement
-        cursor.execute("""
-            SELECT id, email, role, is_active 
-            FROM users 
-            LIMIT %s OFFSET %s
-        """, (limit, offset))
+        if page_cursor:
+            after_id, = decode_cursor(page_cursor, 1)
+            cursor.execute("""
+                SELECT id, email, role, is_active
+                FROM users
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (after_id, limit + 1))
+        else:
+            # Legacy page/limit parameters
+            page = int(request.args.get('page', 1))
+            cursor.execute("""
+                SELECT id, email, role, is_active
+                FROM users
+                ORDER BY id
+                LIMIT %s OFFSET %s
+            """, (limit + 1, (page - 1) * limit))
         users = cursor.fetchall()
 
-        cursor.execute("SELECT COUNT(*) as count FROM users")
-        total = cursor.fetchone()['count']
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_cursor(users[-1]['id'])
+
+        total = page_total(connection.cursor(), "SELECT COUNT(*) FROM users", (), counter='users')
 
         return jsonify({
             'users': users,
             'total': total,
+            'next_cursor': next_cursor,
             'success': True
         }), 200
 
+    except ValueError as e:
+        return jsonify({'error': str(e), "success": False}), 400
     except mysql.connector.Error as e:
         print(f"Error getting users: {e}")
         return jsonify({'error': str(e), "success": False}), 500
@@ -302,13 +907,10 @@ def get_dashboard_data(current_user):
         connection = create_connection()
         cursor = connection.cursor()
 
-        # Fetch total document count
-        cursor.execute("SELECT COUNT(*) FROM documents")
-        total_documents = cursor.fetchone()[0]
-
-        # Fetch total users count
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
+        # Fetch the maintained document and user counts
+        counters = read_counters(cursor)
+        total_documents = counters.get('documents', 0)
+        total_users = counters.get('users', 0)
 
         # Fetch the latest 7 activities (assuming the table is named 'activity_logs' with a timestamp column)
         cursor.execute("""
@@ -368,71 +970,84 @@ def get_user_name(current_user):
         if connection:
             connection.close()
 
+def documents_page_query(args, user):
+    """SQL and parameters for one page of /get_documents (also served by asgi.py).
+
+    Admins see every active document, other users their own. Returns
+    ``(query, params, limit)``; one row past `limit` is fetched to tell
+    whether there is a next page. Raises ValueError for invalid pagination
+    parameters.
+    """
+    limit = page_limit(args)
+    page_cursor = args.get('cursor')
+
+    # Newest first; id breaks ties so the keyset order is total.
+    # Served by the (status, [user_id,] upload_date, id) indexes.
+    conditions = ["status = 'active'"]
+    params = []
+    if not user.get('is_admin'):
+        conditions.append("user_id = %s")
+        params.append(user['id'])
+
+    if page_cursor:
+        upload_date, doc_id = decode_cursor(page_cursor, 2)
+        upload_date = datetime.fromisoformat(upload_date)
+        conditions.append("(upload_date < %s OR (upload_date = %s AND id < %s))")
+        params += [upload_date, upload_date, doc_id]
+        window = "LIMIT %s"
+        params.append(limit + 1)
+    else:
+        # Legacy page/limit parameters
+        page = int(args.get('page', 1))
+        window = "LIMIT %s OFFSET %s"
+        params += [limit + 1, (page - 1) * limit]
+
+    query = f"""
+        SELECT id, name, upload_date, user_id
+        FROM documents
+        WHERE {' AND '.join(conditions)}
+        ORDER BY upload_date DESC, id DESC
+        {window}
+    """
+    return query, params, limit
+
+def documents_count_query(user):
+    """Exact count of the documents /get_documents lists for `user`, as ``(query, params)``."""
+    if user.get('is_admin'):
+        return "SELECT COUNT(*) FROM documents WHERE status = 'active'", ()
+    return "SELECT COUNT(*) FROM documents WHERE status = 'active' AND user_id = %s", (user['id'],)
+
+def documents_page(documents, limit, total):
+    """The /get_documents response body for the rows of documents_page_query."""
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1]['upload_date'], documents[-1]['id'])
+    return {
+        "success": True,
+        "documents": documents,
+        "total": total,
+        "next_cursor": next_cursor
+    }
+
 @app.route('/get_documents', methods=['GET'])
 @login_required
 def get_documents(current_user):
+    connection = None
     try:
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 10))
-        offset = (page - 1) * limit
+        query, params, limit = documents_page_query(request.args, current_user)
 
         connection = create_connection()
         cursor = connection.cursor(dictionary=True)
-        
-        # Updated query to ensure ID is included and no NULL values
-        if current_user.get('is_admin'):
-            query = """
-                SELECT 
-                    id, 
-                    name, 
-                    upload_date, 
-                    user_id 
-                FROM documents 
-                WHERE status = 'active' AND id IS NOT NULL
-                ORDER BY upload_date DESC 
-                LIMIT %s OFFSET %s
-            """
-            cursor.execute(query, (limit, offset))
-        else:
-            query = """
-                SELECT 
-                    id, 
-                    name, 
-                    upload_date, 
-                    user_id 
-                FROM documents 
-                WHERE status = 'active' 
-                    AND id IS NOT NULL 
-                    AND user_id = %s 
-                ORDER BY upload_date DESC
-                LIMIT %s OFFSET %s
-            """
-            cursor.execute(query, (current_user['id'], limit, offset))
-
+        cursor.execute(query, params)
         documents = cursor.fetchall()
-        
-        # Debug logging
-        print(f"Retrieved documents: {documents}")
-        
-        # Verify documents have IDs
-        for doc in documents:
-            if not doc['id']:
-                print(f"Warning: Document missing ID: {doc}")
-
-        # Get total count
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM documents WHERE status = 'active'"
-            + ("" if current_user.get('is_admin') else " AND user_id = %s"),
-            ([] if current_user.get('is_admin') else [current_user['id']])
-        )
-        total = cursor.fetchone()['count']
 
-        return jsonify({
-            "success": True,
-            "documents": documents,
-            "total": total
-        }), 200
+        total = page_total(connection.cursor(), *documents_count_query(current_user),
+                           counter='documents' if current_user.get('is_admin') else None)
+        return jsonify(documents_page(documents, limit, total)), 200
 
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e), "message": "Invalid pagination parameters"}), 400
     except Exception as e:
         print(f"Error getting documents: {e}")
         return jsonify({
@@ -464,10 +1079,22 @@ def get_user_documents(current_user):
         if connection:
             connection.close()
 
+def record_upload(user_id, filename, digest, written):
+    # Whether content was already stored says another user may hold the same file, so it is
+    # only logged and counted, never returned to the client
+    if not written:
+        print(f"Upload {filename} by user {user_id} deduplicated against blob {digest}")
+    if request_metrics is not None:
+        request_metrics.count_upload(not written)
+
 @app.route('/upload_document', methods=['POST'])
 @login_required
 def upload_document(current_user):
     connection = None
+    try:
+        get_crypto_pool().check_capacity()
+    except PoolSaturated as e:
+        return saturated_response(e)
     try:
         if 'file' not in request.files:
             return jsonify({"message": "No file part"}), 400
@@ -476,62 +1103,314 @@ def upload_document(current_user):
             return jsonify({"message": "No selected file"}), 400
 
         filename = secure_filename(file.filename)
-        file_data = file.read()
-        
-        # Encrypt file data
-        fernet = generate_fernet_key()
-        encrypted_data = fernet.encrypt(file_data)
-        
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        with open(file_path, 'wb') as f:
-            f.write(encrypted_data)
+        open_source = partial(rewound, file.stream)
+
+        # Blobs are named by a keyed hash of the plaintext, so a known file is
+        # neither encrypted nor written again
+        digest, size, written, used_key = store_upload(filename, open_source)
+        key = content_key(digest)
 
         connection = create_connection()
         if not connection:
             return jsonify({"message": "Database connection failed"}), 500
             
-        cursor = connection.cursor()
         user_id = current_user['id']
-        cursor.execute("""
-            INSERT INTO documents (name, file_path, user_id, status) 
-            VALUES (%s, %s, %s, 'active')
-        """, (filename, file_path, user_id))
-        connection.commit()
-
-        # Log the activity
-        cursor.execute("""
-            INSERT INTO activity_logs (user_id, action) 
-            VALUES (%s, %s)
-        """, (user_id, 'Uploaded a document'))
-        connection.commit()
-
+        with unit_of_work(connection) as work:
+            row_keys = reference_blobs(work.cursor, {digest: (size, 1)})
+            if restore_blob(filename, open_source, digest, used_key, row_keys[digest]):
+                written = True
+            work.cursor.execute("""
+                INSERT INTO documents (name, file_path, user_id, status, content_hash) 
+                VALUES (%s, %s, %s, 'active', %s)
+            """, (filename, key, user_id, digest))
+            bump_counter(work.cursor, 'documents', 1)
+
+            # Log the activity
+            work.log(user_id, 'Uploaded a document')
+
+        record_upload(user_id, filename, digest, written)
         return jsonify({"message": "Document uploaded successfully!"}), 201
 
     except Exception as e:
         print(f"Error in upload_document: {e}")
-        if connection:
-            connection.rollback()
         return jsonify({"message": "Failed to upload document", "error": str(e)}), 500
     finally:
         if connection:
             connection.close()
 
-def send_decrypted_file(file_path, filename, attachment=False):
+def rewound(stream):
+    stream.seek(0)
+    return nullcontext(stream)
+
+def reserve_blob(digest, size):
+    """Make sure blob `digest` has a row and a data key before it is stored.
+
+    A new row gets a fresh data key and no references yet (the upload's
+    transaction adds them). Two uploads of the same new content race to
+    insert it, and both then encrypt with the winner's key. Returns
+    ``((key_version, wrapped_key), created)``.
+    """
+    connection = create_connection()
+    if not connection:
+        raise RuntimeError("Database connection failed")
     try:
-        with open(file_path, 'rb') as f:
-            encrypted_data = f.read()
+        cursor = connection.cursor()
+        key_version, wrapped_key = get_keyring().wrap(new_data_key())
+        cursor.execute("""
+            INSERT IGNORE INTO blobs (content_hash, size, ref_count, key_version, wrapped_key)
+            VALUES (%s, %s, 0, %s, %s)
+        """, (digest, size, key_version, wrapped_key))
+        created = cursor.rowcount == 1
+        cursor.execute("SELECT key_version, wrapped_key FROM blobs WHERE content_hash = %s", (digest,))
+        row = cursor.fetchone()
+        connection.commit()
+    finally:
+        connection.close()
+    return (row[0], row[1]), created
+
+def store_upload(filename, open_source):
+    """Hash one uploaded file and store it encrypted unless its blob already exists.
+
+    `open_source()` returns a context manager for a fresh reader of the file.
+    Returns ``(digest, size, written, (key_version, wrapped_key))``.
+    """
+    with open_source() as src, span('crypto'):
+        digest, size = content_hash(src, get_hash_key())
+    key = content_key(digest)
+    used_key, created = reserve_blob(digest, size)
+    # A file without a row has an unknown key, so a new row always gets a new file
+    written = created or not get_storage().exists(key)
+    if written:
+        with open_source() as src:
+            store_upload_encrypted(filename, src, key, blob_data_key(*used_key))
+    return digest, size, written, used_key
+
+def reference_blobs(cursor, blobs):
+    """Add an upload's document references to its blobs, inside the upload's transaction.
+
+    `blobs` maps digests to ``(size, references)``. Rows that gc-blobs
+    removed since store_upload are recreated with a new data key. Returns
+    each digest's ``(key_version, wrapped_key)``; the row locks taken here
+    keep gc-blobs away until commit.
+    """
+    digests = sorted(blobs)
+    rows = []
+    for digest in digests:
+        size, references = blobs[digest]
+        rows.append((digest, size, references, *get_keyring().wrap(new_data_key())))
+    # executemany() sends this as a single multi-row INSERT; sorted so
+    # concurrent uploads lock shared blob rows in the same order
+    cursor.executemany("""
+        INSERT INTO blobs (content_hash, size, ref_count, key_version, wrapped_key) VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE ref_count = ref_count + VALUES(ref_count)
+    """, rows)
+    cursor.execute(f"""
+        SELECT content_hash, key_version, wrapped_key FROM blobs
+        WHERE content_hash IN ({', '.join(['%s'] * len(digests))})
+    """, digests)
+    return {digest: (key_version, wrapped_key) for digest, key_version, wrapped_key in cursor.fetchall()}
+
+def restore_blob(filename, open_source, digest, used_key, row_key):
+    """Store blob `digest` again if its file is gone or was encrypted under another key than its row's.
+
+    Called inside the upload's transaction, after reference_blobs. Returns
+    whether the blob was rewritten.
+    """
+    key = content_key(digest)
+    if row_key == used_key and get_storage().exists(key):
+        return False
+    with open_source() as src:
+        store_upload_encrypted(filename, src, key, blob_data_key(*row_key))
+    return True
+
+def batch_sources():
+    """The files of a batch upload as ``(original name, safe name, open_source)``.
+
+    Taken from a ZIP in the `archive` field, whose members are decompressed
+    as they are encrypted, or else from the `files` fields. Raises ValueError
+    for a request over the batch limits.
+    """
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        try:
+            zf = zipfile.ZipFile(archive.stream)
+        except zipfile.BadZipFile:
+            raise ValueError("The archive is not a valid ZIP file")
+        members = [info for info in zf.infolist()
+                   if not info.is_dir() and not info.filename.startswith('__MACOSX/')]
+        if len(members) > app.config['UPLOAD_BATCH_MAX_FILES']:
+            raise ValueError(f"At most {app.config['UPLOAD_BATCH_MAX_FILES']} files per batch")
+        # Declared sizes bound what zipfile will decompress, so this also stops ZIP bombs
+        if sum(info.file_size for info in members) > app.config['UPLOAD_BATCH_MAX_BYTES']:
+            raise ValueError("The archive expands beyond the batch size limit")
+        return [(info.filename, secure_filename(os.path.basename(info.filename)), partial(zf.open, info))
+                for info in members]
+
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if len(files) > app.config['UPLOAD_BATCH_MAX_FILES']:
+        raise ValueError(f"At most {app.config['UPLOAD_BATCH_MAX_FILES']} files per batch")
+    return [(file.filename, secure_filename(file.filename), partial(rewound, file.stream)) for file in files]
+
+@app.route('/upload_documents', methods=['POST'])
+@login_required
+def upload_documents(current_user):
+    """Upload many documents in one request: repeated `files` fields or a ZIP `archive`."""
+    connection = None
+    try:
+        get_crypto_pool().check_capacity()
+        get_upload_pool().check_capacity()
+    except PoolSaturated as e:
+        return saturated_response(e)
+    try:
+        try:
+            sources = batch_sources()
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        if not sources:
+            return jsonify({"success": False, "message": "No files in the batch"}), 400
+
+        # Files are hashed, compressed and encrypted concurrently; results keep the request order
+        pool = get_upload_pool()
+        jobs = [pool.submit(store_upload, filename, open_source, wait=True) if filename else None
+                for _, filename, open_source in sources]
+        results, stored = [], []
+        for (original, filename, open_source), job in zip(sources, jobs):
+            result = {"filename": original, "success": False}
+            results.append(result)
+            if job is None:
+                result["message"] = "Invalid file name"
+                continue
+            try:
+                digest, size, written, used_key = job.result()
+            except Exception as e:
+                print(f"Error storing {original} in batch upload: {e}")
+                result["message"] = "Failed to store file"
+                continue
+            result.update(success=True, name=filename)
+            stored.append((result, filename, open_source, digest, size, used_key, written))
+
+        if stored:
+            connection = create_connection()
+            if not connection:
+                return jsonify({"message": "Database connection failed"}), 500
+
+            user_id = current_user['id']
+            references = Counter(digest for _, _, _, digest, _, _, _ in stored)
+            sizes = {digest: size for _, _, _, digest, size, _, _ in stored}
+            with unit_of_work(connection) as work:
+                row_keys = reference_blobs(work.cursor, {digest: (sizes[digest], references[digest])
+                                                         for digest in references})
+                restored = set()
+                for _, filename, open_source, digest, _, used_key, _ in stored:
+                    if digest in restored:
+                        continue
+                    if restore_blob(filename, open_source, digest, used_key, row_keys[digest]):
+                        restored.add(digest)
+                # One multi-row INSERT
+                work.cursor.executemany("""
+                    INSERT INTO documents (name, file_path, user_id, status, content_hash)
+                    VALUES (%s, %s, %s, 'active', %s)
+                """, [(filename, content_key(digest), user_id, digest) for _, filename, _, digest, _, _, _ in stored])
+                bump_counter(work.cursor, 'documents', len(stored))
+                for _ in stored:
+                    work.log(user_id, 'Uploaded a document')
+
+            for _, filename, _, digest, _, _, written in stored:
+                record_upload(user_id, filename, digest, written or digest in restored)
+
+        uploaded = len(stored)
+        status = 201 if uploaded == len(results) else 207 if uploaded else 400
+        return jsonify({
+            "success": uploaded > 0,
+            "message": f"Uploaded {uploaded} of {len(results)} documents",
+            "uploaded": uploaded,
+            "failed": len(results) - uploaded,
+            "results": results,
+        }), status
 
-        # Decrypt the file
-        fernet = generate_fernet_key()
-        decrypted_data = fernet.decrypt(encrypted_data)
+    except Exception as e:
+        print(f"Error in upload_documents: {e}")
+        return jsonify({"message": "Failed to upload documents", "error": str(e)}), 500
+    finally:
+        if connection:
+            connection.close()
+
+# A document's name and stored object with its blob's wrapped data key (NULLs for legacy blobs)
+DOCUMENT_BLOB_QUERY = """
+    SELECT d.name, d.file_path, b.key_version, b.wrapped_key FROM documents d
+    LEFT JOIN blobs b ON b.content_hash = d.content_hash
+"""
+
+def requested_range(size, etag):
+    """Resolve the request's Range header against `size` bytes.
+
+    Returns ``(start, stop, is_partial)``, or None when the range cannot be satisfied.
+    """
+    byte_range = request.range
+    if byte_range is None or byte_range.units != 'bytes' or len(byte_range.ranges) != 1:
+        return 0, size, False
+    if request.if_range.etag is not None and request.if_range.etag != etag:
+        return 0, size, False
+    resolved = byte_range.range_for_length(size)
+    if resolved is None:
+        return None
+    return resolved[0], resolved[1], True
+
+def send_decrypted_file(file_path, filename, attachment=False, data_key=None):
+    """Stream a stored blob back decrypted, honouring single byte-range requests."""
+    try:
+        get_crypto_pool().check_capacity()
+    except PoolSaturated as e:
+        return saturated_response(e)
+    try:
+        f, info = get_storage().open(storage_key(file_path))
+    except (FileNotFoundError, ValueError):
+        return jsonify({"error": "File not found on server", "success": False}), 404
+    try:
+        etag = f'{info.version}-{info.size:x}'
+
+        chunked = is_chunked(f.read(len(MAGIC)))
+        f.seek(0)
+        if chunked:
+            header = read_header(f)
+            size = plaintext_size(header, info.size)
+        else:
+            # Legacy Fernet blobs can only be authenticated as a whole
+            with span('crypto'):
+                plaintext = b''.join(iter_plaintext(f, data_key or get_chunk_key(), generate_fernet_key(),
+                                                    **crypto_options()))
+            size = len(plaintext)
+            f.close()
+
+        resolved = requested_range(size, etag)
+        if resolved is None:
+            f.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        start, stop, is_partial = resolved
+
+        def generate():
+            if not chunked:
+                yield plaintext[start:stop]
+                return
+            with f:
+                yield from traced_iter(iter_decrypt_range(f, data_key or get_chunk_key(), header, info.size,
+                                                          start, stop, **crypto_options()), 'crypto')
 
-        response = make_response(decrypted_data)
-        response.headers['Content-Type'] = 'application/octet-stream'
         disposition = 'attachment' if attachment else 'inline'
+        response = Response(generate(), status=206 if is_partial else 200, direct_passthrough=True)
+        # In case the body is never iterated
+        response.call_on_close(f.close)
+        response.headers['Content-Type'] = 'application/octet-stream'
         response.headers['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+        response.headers['Content-Length'] = str(stop - start)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['ETag'] = f'"{etag}"'
+        if is_partial:
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
         return response
 
     except Exception as e:
+        f.close()
         return jsonify({"error": "Error processing file", "details": str(e), "success": False}), 500
 
 @app.route('/user/document/<int:doc_id>/download', methods=['GET'])
@@ -542,21 +1421,19 @@ def download_document(current_user, doc_id):
         cursor = connection.cursor()
 
         if current_user.get('is_admin'):
-            query = "SELECT name, file_path FROM documents WHERE id = %s"
+            query = DOCUMENT_BLOB_QUERY + " WHERE d.id = %s"
             cursor.execute(query, (doc_id,))
         else:
-            query = "SELECT name, file_path FROM documents WHERE id = %s AND user_id = %s AND status = 'active'"
+            query = DOCUMENT_BLOB_QUERY + " WHERE d.id = %s AND d.user_id = %s AND d.status = 'active'"
             cursor.execute(query, (doc_id, current_user['id']))
 
         result = cursor.fetchone()
         if not result:
             return jsonify({"error": "Document not found", "success": False}), 404
 
-        filename, file_path = result
-        if not os.path.exists(file_path):
-            return jsonify({"error": "File not found on server", "success": False}), 404
-
-        return send_decrypted_file(file_path, filename, attachment=True)
+        filename, file_path, key_version, wrapped_key = result
+        return send_decrypted_file(file_path, filename, attachment=True,
+                                   data_key=blob_data_key(key_version, wrapped_key))
 
     except Exception as e:
         return jsonify({"error": str(e), "success": False}), 500
@@ -564,6 +1441,148 @@ def download_document(current_user, doc_id):
         if connection:
             connection.close()
 
+def export_name(name, taken):
+    """Return `name`, numbered if the archive already holds an entry with that name."""
+    stem, ext = os.path.splitext(name or 'document')
+    candidate, n = stem + ext, 1
+    while candidate in taken:
+        candidate = f'{stem} ({n}){ext}'
+        n += 1
+    taken.add(candidate)
+    return candidate
+
+def iter_export_entries(documents):
+    """Archive entries for `documents`, decrypting each one only while it is written.
+
+    Documents that cannot be read are skipped (or cut short, if a chunk fails
+    authentication midway) and listed in a final export_errors.txt entry,
+    since the response status has already been sent by then.
+    """
+    errors = []
+    taken = set()
+
+    def decrypted(doc_id, f, data_key, header, blob_size, size):
+        with f:
+            try:
+                yield from traced_iter(iter_decrypt_range(f, data_key, header, blob_size, 0, size,
+                                                          **crypto_options()), 'crypto')
+            except Exception as e:
+                print(f"Error exporting document {doc_id}: {e}")
+                errors.append(f"{doc_id}: truncated, {e}")
+
+    for doc_id, name, file_path, upload_date, key_version, wrapped_key in documents:
+        date_time = max(upload_date, datetime(1980, 1, 1)).timetuple()[:6]
+        try:
+            f, info = get_storage().open(storage_key(file_path))
+        except (FileNotFoundError, ValueError):
+            errors.append(f"{doc_id}: file not found on server")
+            continue
+        try:
+            data_key = blob_data_key(key_version, wrapped_key)
+            if is_chunked(f.read(len(MAGIC))):
+                f.seek(0)
+                header = read_header(f)
+                size = plaintext_size(header, info.size)
+                chunks = decrypted(doc_id, f, data_key, header, info.size, size)
+            else:
+                # Legacy Fernet blobs can only be authenticated as a whole
+                f.seek(0)
+                with f, span('crypto'):
+                    plaintext = b''.join(iter_plaintext(f, data_key, generate_fernet_key(),
+                                                        **crypto_options()))
+                size, chunks = len(plaintext), [plaintext]
+        except Exception as e:
+            f.close()
+            print(f"Error exporting document {doc_id}: {e}")
+            errors.append(f"{doc_id}: {e}")
+            continue
+        yield export_name(name, taken), size, date_time, chunks
+
+    if errors:
+        report = ('Documents that could not be exported in full:\n' + '\n'.join(errors) + '\n').encode()
+        yield export_name('export_errors.txt', taken), len(report), datetime.now().timetuple()[:6], [report]
+
+@app.route('/export_documents', methods=['GET', 'POST'])
+@login_required
+def export_documents(current_user):
+    """Stream the selected documents decrypted into one ZIP archive.
+
+    Takes `ids` (a list, or comma-separated in a query string) or the
+    filters `user_id`, `since` and `until` (upload dates), as JSON or query
+    parameters. Users can only export their own active documents.
+    """
+    data = request.get_json(silent=True) or request.args
+    connection = None
+    try:
+        conditions = ["d.status = 'active'"]
+        params = []
+        ids = data.get('ids')
+        if isinstance(ids, str):
+            ids = [part for part in ids.split(',') if part.strip()]
+        if ids:
+            ids = sorted({int(doc_id) for doc_id in ids})
+            conditions.append(f"d.id IN ({', '.join(['%s'] * len(ids))})")
+            params.extend(ids)
+        user_id = data.get('user_id')
+        if not current_user.get('is_admin'):
+            user_id = current_user['id']
+        if user_id not in (None, ''):
+            conditions.append("d.user_id = %s")
+            params.append(int(user_id))
+        if data.get('since'):
+            conditions.append("d.upload_date >= %s")
+            params.append(datetime.fromisoformat(data['since']))
+        if data.get('until'):
+            conditions.append("d.upload_date < %s")
+            params.append(datetime.fromisoformat(data['until']))
+        if len(params) == 0:
+            raise ValueError("select documents by ids, user_id, since or until")
+        limit = app.config['EXPORT_MAX_DOCUMENTS']
+        if ids and len(ids) > limit:
+            raise ValueError(f"at most {limit} documents per export")
+
+        get_crypto_pool().check_capacity()
+
+        connection = create_connection()
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT d.id, d.name, d.file_path, d.upload_date, b.key_version, b.wrapped_key FROM documents d
+            LEFT JOIN blobs b ON b.content_hash = d.content_hash
+            WHERE {' AND '.join(conditions)}
+            ORDER BY d.id
+            LIMIT %s
+        """, params + [limit + 1])
+        documents = cursor.fetchall()
+        connection.close()
+        connection = None
+
+        if ids:
+            missing = sorted(set(ids) - {row[0] for row in documents})
+            if missing:
+                return jsonify({"success": False, "message": "Documents not found", "missing": missing}), 404
+        elif not documents:
+            return jsonify({"success": False, "message": "No documents match the filter"}), 404
+        elif len(documents) > limit:
+            return jsonify({"success": False,
+                            "message": f"More than {limit} documents match; narrow the filter"}), 400
+
+        log_activity(current_user['id'], f"Exported {len(documents)} documents")
+        filename = f"documents-{datetime.now():%Y%m%d-%H%M%S}.zip"
+        response = Response(iter_zip(iter_export_entries(documents)), mimetype='application/zip',
+                            direct_passthrough=True)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    except PoolSaturated as e:
+        return saturated_response(e)
+    except (ValueError, TypeError) as e:
+        return jsonify({"success": False, "message": f"Invalid export parameters: {e}"}), 400
+    except Exception as e:
+        print(f"Error in export_documents: {e}")
+        return jsonify({"success": False, "message": "Failed to export documents"}), 500
+    finally:
+        if connection:
+            connection.close()
+
 @app.route('/delete_document/<int:doc_id>', methods=['DELETE'])
 @login_required
 def delete_document(current_user, doc_id):
@@ -573,28 +1592,27 @@ def delete_document(current_user, doc_id):
         cursor = connection.cursor()
 
         # Fetch the document's file path from the database
-        cursor.execute("SELECT file_path FROM documents WHERE id = %s", (doc_id,))
+        cursor.execute("SELECT file_path, content_hash FROM documents WHERE id = %s", (doc_id,))
         result = cursor.fetchone()
 
         # If document not found, return error
         if not result:
             return jsonify({"message": "Document not found", "success": False}), 404
 
-        file_path = result[0]
+        file_path, digest = result
 
-        # If file exists, remove it
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        with unit_of_work(connection) as work:
+            # Delete document from the database
+            work.cursor.execute("DELETE FROM documents WHERE id = %s", (doc_id,))
+            deleted = work.cursor.rowcount
+            bump_counter(work.cursor, 'documents', -deleted)
+            release_blobs(work.cursor, [(digest, deleted)])
 
-        # Delete document from the database
-        cursor.execute("DELETE FROM documents WHERE id = %s", (doc_id,))
-        connection.commit()
+            # Log the activity
+            user_id = current_user['id']  # Use current_user from the session
+            work.log(user_id, f'Deleted document with ID {doc_id}')
 
-        # Log the activity
-        user_id = current_user['id']  # Use current_user from the session
-        cursor.execute("INSERT INTO activity_logs (user_id, action) VALUES (%s, %s)",
-                       (user_id, f'Deleted document with ID {doc_id}'))
-        connection.commit()
+        remove_legacy_file(file_path, digest)
 
         # Return success response
         return jsonify({
@@ -618,8 +1636,7 @@ def get_document_count(current_user):  # Accept current_user here
     try:
         connection = create_connection()
         cursor = connection.cursor()
-        cursor.execute("SELECT COUNT(*) FROM documents")
-        count = cursor.fetchone()[0]
+        count = read_counters(cursor).get('documents', 0)
         return jsonify({"success": True, "count": count}), 200
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
@@ -652,23 +1669,102 @@ def get_all_documents(current_user):
         if connection:
             connection.close()
 
+def fulltext_query(text):
+    """Turn free text into a boolean-mode query that matches every word as a prefix.
+
+    Returns ``(query, short_words)``: words shorter than the full-text token
+    size are not indexed, so they are left for the caller to match otherwise.
+    """
+    words = re.findall(r'\w+', text)
+    min_size = app.config['FULLTEXT_MIN_TOKEN_SIZE']
+    return (' '.join(f'+{word}*' for word in words if len(word) >= min_size),
+            [word for word in words if len(word) < min_size])
+
+def stream_activity_rows(connection, cursor, limit):
+    """Yield the activity log page as JSON text, fetching rows in batches."""
+    try:
+        yield '{"success": true, "logs": ['
+        sent = 0
+        last_id = None
+        more = False
+        for batch in iter(lambda: cursor.fetchmany(100), []):
+            for row in batch:
+                if sent == limit:
+                    more = True
+                    continue
+                yield (',' if sent else '') + app.json.dumps(row)
+                sent += 1
+                last_id = row['id']
+        next_cursor = encode_cursor(last_id) if more else None
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+    finally:
+        connection.close()
+
 @app.route('/get_activity_logs', methods=['POST'])
 @login_required
 def get_activity_logs(current_user):
-    search_term = request.json.get('search_term', '')
+    data = request.get_json(silent=True) or {}
+    connection = None
     try:
+        limit = int(data.get('limit', app.config['ACTIVITY_LOG_PAGE_SIZE']))
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        limit = min(limit, app.config['ACTIVITY_LOG_MAX_PAGE_SIZE'])
+
+        user_id = data.get('user_id')
+        text = data.get('query')
+        search_term = str(data.get('search_term') or '').strip()
+        if search_term:
+            # Single search box: numbers are user ids, anything else searches the action text
+            if search_term.isdigit():
+                user_id = user_id or search_term
+            else:
+                text = text or search_term
+
+        conditions = []
+        params = []
+        if user_id not in (None, ''):
+            conditions.append("user_id = %s")
+            params.append(int(user_id))
+        if text:
+            boolean_query, short_words = fulltext_query(text)
+            if boolean_query:
+                conditions.append("MATCH(action) AGAINST (%s IN BOOLEAN MODE)")
+                params.append(boolean_query)
+            # Words shorter than the full-text token size are not indexed, but must still match
+            for word in short_words:
+                conditions.append("action LIKE %s")
+                params.append('%' + word.replace('_', r'\_') + '%')
+            if not boolean_query and not short_words:
+                # No words at all, e.g. only punctuation
+                conditions.append("action LIKE %s")
+                params.append(f'%{text}%')
+        if data.get('since'):
+            conditions.append("timestamp >= %s")
+            params.append(datetime.fromisoformat(data['since']))
+        if data.get('until'):
+            conditions.append("timestamp < %s")
+            params.append(datetime.fromisoformat(data['until']))
+        if data.get('cursor'):
+            before_id, = decode_cursor(data['cursor'], 1)
+            conditions.append("id < %s")
+            params.append(int(before_id))
+
         connection = create_connection()
         cursor = connection.cursor(dictionary=True)
-
-        if (search_term):
-            query = "SELECT * FROM activity_logs WHERE user_id LIKE %s OR action LIKE %s"
-            cursor.execute(query, (f'%{search_term}%', f'%{search_term}%'))
-        else:
-            query = "SELECT * FROM activity_logs"
-            cursor.execute(query)
-
-        logs = cursor.fetchall()
-        return jsonify({"success": True, "logs": logs}), 200
+        cursor.execute(f"""
+            SELECT * FROM activity_logs
+            WHERE {' AND '.join(conditions) or '1 = 1'}
+            ORDER BY id DESC
+            LIMIT %s
+        """, params + [limit + 1])
+
+        # The generator owns the connection from here on
+        rows = stream_activity_rows(connection, cursor, limit)
+        connection = None
+        return Response(stream_with_context(rows), mimetype='application/json')
+    except (ValueError, TypeError) as e:
+        return jsonify({"success": False, "message": f"Invalid search parameters: {e}"}), 400
     except Exception as e:
         print(f"Error getting activity logs: {e}")
         return jsonify({"success": False, "message": "Failed to get activity logs"}), 500
@@ -676,10 +1772,73 @@ def get_activity_logs(current_user):
         if connection:
             connection.close()
 
+@app.route('/admin/activity/stream', methods=['GET'])
+@admin_required
+def stream_activity(current_user):
+    """Server-Sent Events feed of new activity_logs rows."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    activity_bus = get_activity_feed()
+    subscription = activity_bus.subscribe(last_event_id)
+    keepalive = app.config['ACTIVITY_STREAM_KEEPALIVE']
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events, reset = subscription.wait(keepalive)
+                if reset:
+                    # Too far behind for deltas; the client reloads the full state
+                    yield 'event: reset\ndata: {}\n\n'
+                for event in events:
+                    yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+                if subscription.closed:
+                    # The worker is stopping; the client reconnects to another one with Last-Event-ID
+                    return
+                if not events and not reset:
+                    yield ': keep-alive\n\n'
+        finally:
+            activity_bus.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/logout', methods=['POST'])
 def logout():
+    """End the session, revoke the presented access token and end its login's refresh tokens."""
+    claims = bearer_claims()
+    user = session.get('user')
+    user_id = claims['user_id'] if claims else user and user['id']
+    # The bearer token and the session cookie normally come from the same login
+    families = {family_id for family_id in (claims and claims.get('fam'), session.get('token_family'))
+                if family_id}
     session.clear()
-    return jsonify({'message': 'Logged out successfully!'}), 200
+    if claims is None and not families:
+        return jsonify({'message': 'Logged out successfully!'}), 200
+
+    connection = None
+    try:
+        connection = create_connection()
+        if not connection:
+            return jsonify({'message': 'Database connection failed'}), 500
+        with unit_of_work(connection) as work:
+            if claims is not None and 'jti' in claims:
+                work.cursor.execute("DELETE FROM revoked_access_tokens WHERE expires_at < %s", (int(time.time()),))
+                work.cursor.execute("""
+                    INSERT INTO revoked_access_tokens (jti, user_id, expires_at) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE expires_at = VALUES(expires_at)
+                """, (claims['jti'], user_id, claims['exp']))
+            for family_id in sorted(families):
+                work.cursor.execute("DELETE FROM refresh_tokens WHERE family_id = %s AND user_id = %s",
+                                    (family_id, user_id))
+        if claims is not None and 'jti' in claims:
+            get_revocations().revoke_token(claims['jti'], claims['exp'])
+        return jsonify({'message': 'Logged out successfully!'}), 200
+    except Exception as e:
+        print(f"Error during logout: {e}")
+        return jsonify({'message': 'Logout failed', 'error': str(e)}), 500
+    finally:
+        if connection:
+            connection.close()
 
 @app.route('/profile_pictures/<filename>')
 def profile_pictures(filename):
@@ -709,14 +1868,17 @@ def update_user_status(current_user):
 
     try:
         connection = create_connection()
-        cursor = connection.cursor()
-        cursor.execute("UPDATE users SET is_active = %s WHERE id = %s", (is_active, user_id))
-        connection.commit()
-        # Log the activity
-        action = "Activated user" if is_active else "Deactivated user"
-        log_query = "INSERT INTO activity_logs (user_id, action, timestamp) VALUES (%s, %s, NOW())"
-        cursor.execute(log_query, (current_user['id'], f"{action} user with ID {user_id}"))
-        connection.commit()
+        revoked_at = None
+        with unit_of_work(connection) as work:
+            work.cursor.execute("UPDATE users SET is_active = %s WHERE id = %s", (is_active, user_id))
+            if not is_active:
+                revoked_at = revoke_user_tokens(work.cursor, user_id)
+            # Log the activity
+            action = "Activated user" if is_active else "Deactivated user"
+            work.log(current_user['id'], f"{action} user with ID {user_id}")
+        if revoked_at is not None:
+            # Other worker processes pick it up within TOKEN_REVOCATION_REFRESH seconds
+            get_revocations().revoke(int(user_id), revoked_at)
 
         return jsonify({"success": True, "message": f"User status updated to {'Active' if is_active else 'Inactive'}"}), 200
     except Exception as e:
@@ -733,17 +1895,29 @@ def delete_user_account(current_user):
 
     try:
         connection = create_connection()
-        cursor = connection.cursor()
-
-        # Log the action before deleting the user
-        admin_id = current_user['id']  # Assuming `current_user` provides the logged-in admin's details
-        log_query = "INSERT INTO activity_logs (user_id, action, timestamp) VALUES (%s, %s, NOW())"
-        log_message = f"Admin with ID {admin_id} deleted user with ID {user_id}"
-        cursor.execute(log_query, (admin_id, log_message))
-
-        # Delete the user
-        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        connection.commit()
+        with unit_of_work(connection) as work:
+            cursor = work.cursor
+
+            # Log the action together with the delete
+            admin_id = current_user['id']  # Assuming `current_user` provides the logged-in admin's details
+            work.log(admin_id, f"Admin with ID {admin_id} deleted user with ID {user_id}")
+
+            # Delete the user; documents removed by a cascading foreign key are counted
+            # and release their blobs too
+            cursor.execute("""
+                SELECT content_hash, COUNT(*) FROM documents WHERE user_id = %s GROUP BY content_hash
+            """, (user_id,))
+            references = cursor.fetchall()
+            documents_before = sum(count for _, count in references)
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            bump_counter(cursor, 'users', -cursor.rowcount)
+            cursor.execute("SELECT COUNT(*) FROM documents WHERE user_id = %s", (user_id,))
+            documents_after = cursor.fetchone()[0]
+            bump_counter(cursor, 'documents', documents_after - documents_before)
+            if documents_after == 0:
+                release_blobs(cursor, references)
+            revoked_at = revoke_user_tokens(cursor, user_id)
+        get_revocations().revoke(int(user_id), revoked_at)
 
         return jsonify({"success": True, "message": "User account deleted successfully"})
     except Exception as e:
@@ -752,6 +1926,30 @@ def delete_user_account(current_user):
         if connection:
             connection.close()
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request latency and span histograms in the Prometheus text format, for scrapers with METRICS_TOKEN."""
+    token = app.config['METRICS_TOKEN']
+    if request_metrics is None or not token:
+        abort(404)
+    # The upload counters tell whether some user already stored a given file
+    presented = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not secrets.compare_digest(presented.encode(), token.encode()):
+        return Response('Unauthorized\n', status=401, headers={'WWW-Authenticate': 'Bearer'})
+    body, content_type = request_metrics.exposition()
+    return Response(body, content_type=content_type)
+
+@app.route('/admin/pool_stats', methods=['GET'])
+@admin_required
+def get_pool_stats(current_user):
+    return jsonify({"success": True, "pool": get_db_pool().stats(), "audit_log": get_audit_log().stats(),
+                    "crypto": get_crypto_pool().stats(),
+                    "password_hash": get_password_pool().stats(),
+                    "upload": get_upload_pool().stats(),
+                    "data_keys": get_data_key_cache().stats(),
+                    "activity_feed": get_activity_feed.poller.stats() if hasattr(get_activity_feed, 'poller') else None,
+                    "sessions": app.session_interface.stats() if app.config['SESSION_TYPE'] == 'sqlite' else None}), 200
+
 @app.route('/admin/document/<int:doc_id>/download', methods=['GET'])
 @admin_required
 def download_admin_document(current_user, doc_id):
@@ -763,18 +1961,15 @@ def download_admin_document(current_user, doc_id):
         connection = create_connection()
         cursor = connection.cursor()
 
-        cursor.execute("SELECT name, file_path FROM documents WHERE id = %s", (doc_id,))
+        cursor.execute(DOCUMENT_BLOB_QUERY + " WHERE d.id = %s", (doc_id,))
         result = cursor.fetchone()
 
         if not result:
             return jsonify({"error": "Document not found", "success": False}), 404
 
-        filename, file_path = result
-
-        if not os.path.exists(file_path):
-            return jsonify({"error": "File not found on server", "success": False}), 404
-
-        return send_decrypted_file(file_path, filename, attachment=True)
+        filename, file_path, key_version, wrapped_key = result
+        return send_decrypted_file(file_path, filename, attachment=True,
+                                   data_key=blob_data_key(key_version, wrapped_key))
 
     except Exception as e:
         print(f"Error in download_admin_document: {e}")
@@ -791,7 +1986,7 @@ def admin_delete_document(current_user, doc_id):
         cursor = connection.cursor()
 
         # Admin can delete any document
-        cursor.execute("SELECT file_path FROM documents WHERE id = %s", (doc_id,))
+        cursor.execute("SELECT file_path, content_hash FROM documents WHERE id = %s", (doc_id,))
         result = cursor.fetchone()
 
         if not result:
@@ -800,19 +1995,16 @@ def admin_delete_document(current_user, doc_id):
                 "error": "Document not found"
             }), 404
 
-        file_path = result[0]
+        file_path, digest = result
 
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        with unit_of_work(connection) as work:
+            work.cursor.execute("DELETE FROM documents WHERE id = %s", (doc_id,))
+            deleted = work.cursor.rowcount
+            bump_counter(work.cursor, 'documents', -deleted)
+            release_blobs(work.cursor, [(digest, deleted)])
+            work.log(current_user['id'], f'Admin deleted document {doc_id}')
 
-        cursor.execute("DELETE FROM documents WHERE id = %s", (doc_id,))
-        connection.commit()
-
-        cursor.execute(
-            "INSERT INTO activity_logs (user_id, action) VALUES (%s, %s)",
-            (current_user['id'], f'Admin deleted document {doc_id}')
-        )
-        connection.commit()
+        remove_legacy_file(file_path, digest)
 
         return jsonify({
             "success": True,
@@ -838,7 +2030,7 @@ def delete_user_document(current_user, doc_id):
 
         # Check if document exists and belongs to the user
         cursor.execute("""
-            SELECT file_path FROM documents 
+            SELECT file_path, content_hash FROM documents 
             WHERE id = %s AND user_id = %s
         """, (doc_id, current_user['id']))
         result = cursor.fetchone()
@@ -849,23 +2041,21 @@ def delete_user_document(current_user, doc_id):
                 "error": "Document not found or you don't have permission to delete it"
             }), 404
 
-        file_path = result[0]
+        file_path, digest = result
 
-        # Delete file from filesystem if it exists
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        with unit_of_work(connection) as work:
+            # Delete document from database
+            work.cursor.execute("DELETE FROM documents WHERE id = %s AND user_id = %s", 
+                          (doc_id, current_user['id']))
+            deleted = work.cursor.rowcount
+            bump_counter(work.cursor, 'documents', -deleted)
+            release_blobs(work.cursor, [(digest, deleted)])
 
-        # Delete document from database
-        cursor.execute("DELETE FROM documents WHERE id = %s AND user_id = %s", 
-                      (doc_id, current_user['id']))
-        connection.commit()
+            # Log the activity
+            work.log(current_user['id'], f'Deleted document {doc_id}')
 
-        # Log the activity
-        cursor.execute(
-            "INSERT INTO activity_logs (user_id, action) VALUES (%s, %s)",
-            (current_user['id'], f'Deleted document {doc_id}')
-        )
-        connection.commit()
+        # Legacy per-document files are removed once the row is gone
+        remove_legacy_file(file_path, digest)
 
         return jsonify({
             "success": True,
@@ -889,27 +2079,31 @@ def decrypt_user_document(current_user, doc_id):
         connection = create_connection()
         cursor = connection.cursor()
 
-        cursor.execute("SELECT file_path FROM documents WHERE id = %s AND user_id = %s", (doc_id, current_user['id']))
+        cursor.execute(DOCUMENT_BLOB_QUERY + " WHERE d.id = %s AND d.user_id = %s", (doc_id, current_user['id']))
         result = cursor.fetchone()
 
         if not result:
             return jsonify({"error": "Document not found", "success": False}), 404
 
-        file_path = result[0]
+        _, file_path, key_version, wrapped_key = result
+        key = storage_key(file_path)
+        storage = get_storage()
 
-        if not os.path.exists(file_path):
+        try:
+            f, _ = storage.open(key)
+        except (FileNotFoundError, ValueError):
             return jsonify({"error": "File not found on server", "success": False}), 404
 
         try:
-            with open(file_path, 'rb') as f:
+            with f:
                 encrypted_data = f.read()
 
-            decrypted_data = decrypt_file(encrypted_data)
+            decrypted_data = decrypt_file(encrypted_data, blob_data_key(key_version, wrapped_key))
 
             # Save the decrypted file temporarily
-            temp_file_path = file_path + '.decrypted'
-            with open(temp_file_path, 'wb') as f:
-                f.write(decrypted_data)
+            with storage.writer(key + '.decrypted') as out:
+                out.write(decrypted_data)
+            temp_file_path = storage.location(key + '.decrypted')
 
             return jsonify({"message": "File decrypted successfully", "temp_file_path": temp_file_path, "success": True}), 200
         except Exception as e:
@@ -930,27 +2124,31 @@ def decrypt_admin_document(current_user, doc_id):
         connection = create_connection()
         cursor = connection.cursor()
 
-        cursor.execute("SELECT file_path FROM documents WHERE id = %s", (doc_id,))
+        cursor.execute(DOCUMENT_BLOB_QUERY + " WHERE d.id = %s", (doc_id,))
         result = cursor.fetchone()
 
         if not result:
             return jsonify({"error": "Document not found", "success": False}), 404
 
-        file_path = result[0]
+        _, file_path, key_version, wrapped_key = result
+        key = storage_key(file_path)
+        storage = get_storage()
 
-        if not os.path.exists(file_path):
+        try:
+            f, _ = storage.open(key)
+        except (FileNotFoundError, ValueError):
             return jsonify({"error": "File not found on server", "success": False}), 404
 
         try:
-            with open(file_path, 'rb') as f:
+            with f:
                 encrypted_data = f.read()
 
-            decrypted_data = decrypt_file(encrypted_data)
+            decrypted_data = decrypt_file(encrypted_data, blob_data_key(key_version, wrapped_key))
 
             # Save the decrypted file temporarily
-            temp_file_path = file_path + '.decrypted'
-            with open(temp_file_path, 'wb') as f:
-                f.write(decrypted_data)
+            with storage.writer(key + '.decrypted') as out:
+                out.write(decrypted_data)
+            temp_file_path = storage.location(key + '.decrypted')
 
             return jsonify({"message": "File decrypted successfully", "temp_file_path": temp_file_path, "success": True}), 200
         except Exception as e:
@@ -964,5 +2162,421 @@ def decrypt_admin_document(current_user, doc_id):
         if connection:
             connection.close()
 
+@app.cli.command('recount')
+def recount():
+    """Reset the maintained dashboard counters from the real table sizes."""
+    connection = create_connection()
+    if not connection:
+        raise click.ClickException("Database connection failed")
+    try:
+        cursor = connection.cursor()
+        for name, table in (('documents', 'documents'), ('users', 'users')):
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            value = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO dashboard_counters (name, value) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE value = VALUES(value)
+            """, (name, value))
+            click.echo(f"{name}: {value}")
+        cursor.execute("""
+            UPDATE blobs SET ref_count = (
+                SELECT COUNT(*) FROM documents WHERE documents.content_hash = blobs.content_hash)
+        """)
+        click.echo(f"blob reference counts corrected: {cursor.rowcount}")
+        connection.commit()
+    finally:
+        connection.close()
+
+@app.cli.command('gc-blobs')
+@click.option('--dry-run', is_flag=True, help='Only report which blobs would be deleted.')
+def gc_blobs(dry_run):
+    """Delete stored blobs that no document refers to any more."""
+    connection = create_connection()
+    if not connection:
+        raise click.ClickException("Database connection failed")
+    removed = freed = 0
+    try:
+        cursor = connection.cursor()
+        # Rows younger than the grace period may belong to uploads still being stored
+        cursor.execute("SELECT content_hash, size FROM blobs WHERE ref_count <= 0 AND created_at < %s",
+                       (datetime.now() - timedelta(seconds=app.config['BLOB_GC_GRACE']),))
+        candidates = cursor.fetchall()
+        connection.commit()
+
+        storage = get_storage()
+        for digest, size in candidates:
+            if dry_run:
+                click.echo(f"would delete {digest} ({size} bytes)")
+                continue
+            # The row lock makes a concurrent upload of the same content wait,
+            # and that upload rewrites the file if it finds it gone.
+            cursor.execute("SELECT ref_count FROM blobs WHERE content_hash = %s FOR UPDATE", (digest,))
+            row = cursor.fetchone()
+            if row and row[0] <= 0:
+                storage.delete(content_key(digest))
+                cursor.execute("DELETE FROM blobs WHERE content_hash = %s", (digest,))
+                removed += 1
+                freed += size
+            connection.commit()
+    finally:
+        connection.close()
+    if not dry_run:
+        click.echo(f"deleted {removed} blob(s), {freed} plaintext bytes")
+
+@app.cli.command('migrate-blobs')
+@click.option('--dry-run', is_flag=True, help='Only report which blobs would be rewritten.')
+def migrate_blobs(dry_run):
+    """Rewrite legacy Fernet blobs in storage into the chunked binary format."""
+    storage = get_storage()
+    fernet = generate_fernet_key()
+    chunk_key = get_chunk_key()
+    migrated = failed = 0
+    bytes_before = bytes_after = plaintext_bytes = 0
+    fernet_seconds = chunked_seconds = 0.0
+    started = time.perf_counter()
+
+    # Legacy blobs sit at the top level, one per document
+    for key in sorted(k for k in storage.keys() if '/' not in k):
+        if key.endswith('.decrypted'):
+            continue
+        f, info = storage.open(key)
+        with f:
+            if is_chunked(f.read(len(MAGIC))):
+                continue
+        old_size = info.size
+        if dry_run:
+            click.echo(f"would migrate {key} ({old_size} bytes)")
+            continue
+
+        try:
+            f, _ = storage.open(key)
+            with f:
+                token = f.read()
+            t0 = time.perf_counter()
+            plaintext = fernet.decrypt(token)
+            t1 = time.perf_counter()
+            store_encrypted(io.BytesIO(plaintext), key, upload_codec(key, io.BytesIO(plaintext)))
+            t2 = time.perf_counter()
+            f, info = storage.open(key)
+            with f:
+                for _ in iter_decrypt(f, chunk_key):
+                    pass
+            t3 = time.perf_counter()
+        except Exception as e:
+            failed += 1
+            click.echo(f"failed to migrate {key}: {e}", err=True)
+            continue
+
+        migrated += 1
+        new_size = info.size
+        bytes_before += old_size
+        bytes_after += new_size
+        plaintext_bytes += len(plaintext)
+        fernet_seconds += t1 - t0
+        chunked_seconds += t3 - t2
+        click.echo(f"migrated {key}: {old_size} -> {new_size} bytes")
+
+    elapsed = time.perf_counter() - started
+    click.echo(f"migrated {migrated} blob(s), {failed} failed, in {elapsed:.2f}s")
+    if migrated:
+        mb = plaintext_bytes / (1024 * 1024)
+        click.echo(f"bytes reclaimed: {bytes_before - bytes_after} "
+                   f"({100.0 * (bytes_before - bytes_after) / bytes_before:.1f}% of {bytes_before})")
+        if fernet_seconds and chunked_seconds:
+            click.echo(f"decrypt throughput: fernet {mb / fernet_seconds:.1f} MB/s, "
+                       f"chunked {mb / chunked_seconds:.1f} MB/s")
+
+@app.cli.command('relativize-paths')
+@click.option('--dry-run', is_flag=True, help='Only report which rows would change.')
+def relativize_paths(dry_run):
+    """Rewrite absolute documents.file_path values into storage keys."""
+    connection = create_connection()
+    if not connection:
+        raise click.ClickException("Database connection failed")
+    updates = []
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT id, file_path, content_hash FROM documents")
+        for doc_id, file_path, digest in cursor.fetchall():
+            if not os.path.isabs(file_path):
+                continue
+            key = relativized_key(file_path, digest)
+            updates.append((key, doc_id))
+            if dry_run:
+                click.echo(f"document {doc_id}: {file_path} -> {key}")
+        if not dry_run:
+            cursor.executemany("UPDATE documents SET file_path = %s WHERE id = %s", updates)
+            connection.commit()
+    finally:
+        connection.close()
+    if not dry_run:
+        click.echo(f"rewrote {len(updates)} path(s)")
+
+@app.cli.command('init-master-key')
+def init_master_key():
+    """Create master key version 1 in MASTER_KEY_DIR, once, before the first start.
+
+    Copy the directory to every node afterwards: servers refuse to start
+    without a key rather than each making its own.
+    """
+    directory = app.config['MASTER_KEY_DIR']
+    if not create_first_master_key(directory):
+        raise click.ClickException(f"{directory} already holds master key(s) {MasterKeyring(directory).versions()}")
+    click.echo(f"created master key version 1 in {directory}; copy it to every node")
+
+@app.cli.command('add-master-key')
+def add_master_key():
+    """Add a master key version, which wraps every new data key from now on.
+
+    Existing data keys stay wrapped under their old versions until
+    rewrap-data-keys runs. Copy the new key file to every node and reload
+    the servers first, so that they can all unwrap keys wrapped under it.
+    """
+    version = get_keyring().add()
+    click.echo(f"added master key version {version} in {app.config['MASTER_KEY_DIR']}; copy it to every "
+               f"node and reload the servers, then run rewrap-data-keys")
+
+@app.cli.command('rewrap-data-keys')
+def rewrap_data_keys():
+    """Re-wrap every blob's data key under the current master key version.
+
+    Only the wrapped keys in `blobs` change; no blob is read or rewritten.
+    Safe to interrupt and run again.
+    """
+    keyring = get_keyring()
+    current = keyring.current_version
+
+    connection = create_connection()
+    if not connection:
+        raise click.ClickException("Database connection failed")
+    rewrapped = failed = 0
+    started = time.perf_counter()
+    try:
+        cursor = connection.cursor()
+        last = ''
+        while True:
+            cursor.execute("""
+                SELECT content_hash, key_version, wrapped_key FROM blobs
+                WHERE content_hash > %s AND key_version <> %s
+                ORDER BY content_hash LIMIT %s
+            """, (last, current, app.config['KEY_ROTATION_BATCH']))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            params = []
+            for digest, key_version, wrapped_key in rows:
+                try:
+                    _, new_wrapped = keyring.wrap(keyring.unwrap(key_version, wrapped_key), current)
+                except KeyUnwrapError as e:
+                    failed += 1
+                    click.echo(f"cannot re-wrap {digest}: {e}", err=True)
+                    continue
+                params += [digest, new_wrapped, key_version]
+            if params:
+                # One statement per batch; rows changed since they were read are left alone
+                selects = ' UNION ALL '.join(["SELECT %s AS content_hash, %s AS wrapped_key, %s AS key_version"]
+                                             * (len(params) // 3))
+                cursor.execute(f"""
+                    UPDATE blobs JOIN ({selects}) AS rewrapped USING (content_hash)
+                    SET blobs.wrapped_key = rewrapped.wrapped_key, blobs.key_version = %s
+                    WHERE blobs.key_version = rewrapped.key_version
+                """, params + [current])
+                rewrapped += cursor.rowcount
+            connection.commit()
+            click.echo(f"re-wrapped {rewrapped} data key(s)")
+
+        cursor.execute("SELECT key_version, COUNT(*) FROM blobs WHERE key_version IS NOT NULL GROUP BY key_version")
+        remaining = {key_version: count for key_version, count in cursor.fetchall() if key_version != current}
+        cursor.execute("SELECT COUNT(*) FROM blobs WHERE wrapped_key IS NULL")
+        legacy = cursor.fetchone()[0]
+        connection.commit()
+    finally:
+        connection.close()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f"re-wrapped {rewrapped} data key(s) under master key version {current} in {elapsed:.1f}s, "
+               f"{failed} failed")
+    if remaining:
+        click.echo(f"data keys still under older versions: {remaining}")
+    else:
+        retired = [version for version in keyring.versions() if version != current]
+        if retired:
+            click.echo(f"no data key uses master key version(s) {retired} any more; their files can be "
+                       f"removed from every node")
+    if legacy:
+        click.echo(f"{legacy} blob(s) from before envelope encryption still use the key derived from "
+                   f"ENCRYPTION_KEY")
+    if failed:
+        raise click.exceptions.Exit(1)
+
+def scan_data_keys(cursor, keys):
+    """Data keys of the content-addressed blobs among storage `keys`, unwrapped for a scan.
+
+    Returns ``(data_keys, unreadable)``: keys without a blobs row or wrapped
+    key are left out (they use the legacy chunk key), and `unreadable` holds
+    error results for keys whose data key cannot be unwrapped.
+    """
+    digests = {key: key.rsplit('/', 1)[-1] for key in keys if key.startswith(BLOB_PREFIX + '/')}
+    if not digests:
+        return {}, {}
+    unique = sorted(set(digests.values()))
+    cursor.execute(f"""
+        SELECT content_hash, key_version, wrapped_key FROM blobs
+        WHERE content_hash IN ({', '.join(['%s'] * len(unique))}) AND wrapped_key IS NOT NULL
+    """, unique)
+    wrapped = {digest: (key_version, wrapped_key) for digest, key_version, wrapped_key in cursor.fetchall()}
+    data_keys, unreadable = {}, {}
+    keyring = get_keyring()
+    for key, digest in digests.items():
+        if digest not in wrapped:
+            continue
+        try:
+            # Not through the data key cache: a scan would only evict everything in it
+            data_keys[key] = keyring.unwrap(*wrapped[digest])
+        except KeyUnwrapError as e:
+            unreadable[key] = (key, STATUS_ERROR, str(e))
+    return data_keys, unreadable
+
+@app.cli.command('scan-integrity')
+@click.option('--workers', type=int, default=None, help='Verifier processes (default: INTEGRITY_SCAN_WORKERS).')
+@click.option('--full', is_flag=True, help='Also re-check objects that have not changed since their last check.')
+def scan_integrity(workers, full):
+    """Authenticate stored blobs and report orphaned objects and dangling documents.
+
+    Only objects that are new or changed since the last scan are verified,
+    unless --full. Exits with status 1 if any blob is corrupt or unreadable,
+    or any document has no stored object.
+    """
+    connection = create_connection()
+    if not connection:
+        raise click.ClickException("Database connection failed")
+    workers = workers or app.config['INTEGRITY_SCAN_WORKERS']
+    batch_size = app.config['INTEGRITY_SCAN_BATCH']
+    storage = get_storage()
+    scan_started = datetime.now().replace(microsecond=0)
+    counts = Counter()
+    checked_bytes = 0
+    started = time.perf_counter()
+
+    def record(batch, results):
+        nonlocal checked_bytes
+        checked_at = datetime.now()
+        rows = []
+        for key, status, detail in results:
+            if status is None:
+                continue
+            info = batch[key]
+            rows.append((key, info.version, info.size, status, detail, checked_at, scan_started))
+            counts[status] += 1
+            checked_bytes += info.size
+        if rows:
+            cursor.executemany("""
+                INSERT INTO integrity_scan (storage_key, version, size, status, detail, checked_at, seen_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE version = VALUES(version), size = VALUES(size),
+                    status = VALUES(status), detail = VALUES(detail),
+                    checked_at = VALUES(checked_at), seen_at = VALUES(seen_at)
+            """, rows)
+        connection.commit()
+
+    # Files written by the decrypt routes are plaintext, not blobs
+    objects = ((key, info) for key, info in storage.objects() if not key.endswith('.decrypted'))
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker,
+                               initargs=(storage, get_chunk_key(), ENCRYPTION_KEY))
+    try:
+        cursor = connection.cursor()
+        # Two batches in flight, so the workers keep verifying while results are written
+        pending = deque()
+        while True:
+            batch = dict(islice(objects, batch_size))
+            if not batch:
+                break
+            cursor.execute(f"""
+                SELECT storage_key, version, size FROM integrity_scan
+                WHERE storage_key IN ({', '.join(['%s'] * len(batch))})
+            """, list(batch))
+            known = {key: (version, size) for key, version, size in cursor.fetchall()}
+            unchanged = set() if full else {key for key, info in batch.items()
+                                            if known.get(key) == (info.version, info.size)}
+            if unchanged:
+                cursor.execute(f"""
+                    UPDATE integrity_scan SET seen_at = %s
+                    WHERE storage_key IN ({', '.join(['%s'] * len(unchanged))})
+                """, [scan_started, *unchanged])
+                counts['unchanged'] += len(unchanged)
+            changed = [key for key in batch if key not in unchanged]
+            data_keys, unreadable = scan_data_keys(cursor, changed)
+            changed = [key for key in changed if key not in unreadable]
+            chunksize = max(1, len(changed) // (workers * 4))
+            results = pool.map(check_object, changed, [data_keys.get(key) for key in changed], chunksize=chunksize)
+            pending.append((batch, chain(results, unreadable.values())))
+            if len(pending) > 1:
+                record(*pending.popleft())
+        while pending:
+            record(*pending.popleft())
+        elapsed = time.perf_counter() - started
+
+        # Objects not seen by this scan are gone from storage
+        cursor.execute("DELETE FROM integrity_scan WHERE seen_at < %s", (scan_started,))
+        connection.commit()
+
+        cursor.execute(f"""
+            SELECT storage_key, status, detail FROM integrity_scan
+            WHERE status <> '{STATUS_OK}' ORDER BY storage_key
+        """)
+        failed = cursor.fetchall()
+        for key, status, detail in failed:
+            click.echo(f"{status}: {key}: {detail}")
+        # Rows that relativize-paths has not rewritten yet hold absolute paths, which never equal a
+        # storage key; they are matched by the key it would give them instead
+        cursor.execute("""
+            SELECT id, file_path, content_hash, upload_date < %s FROM documents
+            WHERE file_path LIKE '/%%'
+        """, (scan_started,))
+        unmigrated = [(doc_id, file_path, relativized_key(file_path, digest), settled)
+                      for doc_id, file_path, digest, settled in cursor.fetchall()]
+        unmigrated_keys = {key for _, _, key, _ in unmigrated}
+        cursor.execute("""
+            SELECT s.storage_key FROM integrity_scan s
+            LEFT JOIN documents d ON d.file_path = s.storage_key
+            WHERE d.id IS NULL ORDER BY s.storage_key
+        """)
+        orphans = [key for key, in cursor.fetchall() if key not in unmigrated_keys]
+        for key in orphans:
+            click.echo(f"orphaned: {key}")
+        # Documents uploaded during the scan may have been stored after the walk passed them
+        cursor.execute("""
+            SELECT d.id, d.file_path FROM documents d
+            LEFT JOIN integrity_scan s ON s.storage_key = d.file_path
+            WHERE s.storage_key IS NULL AND d.upload_date < %s AND d.file_path NOT LIKE '/%%'
+        """, (scan_started,))
+        dangling = cursor.fetchall()
+        settled = [row for row in unmigrated if row[3]]
+        for start in range(0, len(settled), batch_size):
+            rows = settled[start:start + batch_size]
+            cursor.execute(f"""
+                SELECT storage_key FROM integrity_scan
+                WHERE storage_key IN ({', '.join(['%s'] * len(rows))})
+            """, [key for _, _, key, _ in rows])
+            scanned = {key for key, in cursor.fetchall()}
+            dangling += [(doc_id, file_path) for doc_id, file_path, key, _ in rows if key not in scanned]
+        dangling.sort()
+        for doc_id, file_path in dangling:
+            click.echo(f"dangling: document {doc_id}: {file_path}")
+        connection.commit()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        connection.close()
+
+    verified = sum(counts[status] for status in counts if status != 'unchanged')
+    click.echo(f"verified {verified} object(s), {checked_bytes / 1e6:.1f} MB, in {elapsed:.1f}s "
+               f"({verified / elapsed if elapsed else 0:.0f} objects/s); {counts['unchanged']} unchanged")
+    click.echo(f"{len(failed)} failed, {len(orphans)} orphaned, {len(dangling)} dangling")
+    if failed or dangling:
+        raise click.exceptions.Exit(1)
+
 if __name__ == '__main__':
+    # Development server only; use `python serve.py` in production
+    get_keyring()  # refuse to start without a master key (flask --app server init-master-key)
     app.run(debug=True, port=8080)
@@ -0,0 +1,285 @@
+"""Server-side Flask sessions in SQLite with an in-process LRU cache.
+
+Session rows carry their own expiry time; reads ignore expired rows and a
+background thread deletes them. SQLite in WAL mode lets every worker
+process share the file. Every write stamps its row with the next number of
+a shared sequence (``written``), and a deleted session is kept as an
+expired row until the sweep. ``PRAGMA data_version`` tells a process when
+another connection has written; it then drops just the cached sessions
+written since it last looked, rather than risking a stale (e.g. logged-out)
+one.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires REAL NOT NULL,
+        written INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)",
+    """CREATE TABLE IF NOT EXISTS session_writes (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        seq INTEGER NOT NULL
+    )""",
+    "INSERT OR IGNORE INTO session_writes (id, seq) VALUES (1, 0)",
+]
+
+
+class SQLiteSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.modified = False
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """Session interface storing sessions in the SQLite database at ``path``.
+
+    Up to ``cache_size`` serialized sessions are kept in memory. An unchanged
+    session is only written back to extend its expiry once less than half of
+    its lifetime is left, so read-only requests normally touch neither the
+    disk nor the database.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, path, cache_size=10000, sweep_interval=300, permanent=True):
+        self.path = path
+        self.cache_size = cache_size
+        self.sweep_interval = sweep_interval
+        self.permanent = permanent
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()     # sid -> (data, expires, written)
+        self._seen = 0                  # last write sequence number the cache was checked against
+        self._pid = None
+
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._invalidations = 0
+        self._swept = 0
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            self._ensure_started()
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            local.connection = connection
+            # Unknown, so the first check looks for writes since the cache was last checked
+            local.data_version = None
+            local.pid = os.getpid()
+        return local.connection
+
+    def _ensure_started(self):
+        # Like the connection, the sweeper does not survive fork()
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._cache = OrderedDict()
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                columns = {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}
+                if 'written' not in columns:
+                    # Session files from before per-session invalidation
+                    connection.execute("ALTER TABLE sessions ADD COLUMN written INTEGER NOT NULL DEFAULT 0")
+                connection.execute("CREATE INDEX IF NOT EXISTS idx_sessions_written ON sessions (written)")
+                self._seen = connection.execute("SELECT seq FROM session_writes").fetchone()[0]
+            finally:
+                connection.close()
+            if self.sweep_interval:
+                threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _check_data_version(self, connection):
+        # data_version changes when any *other* connection commits, in this
+        # process or another one; drop the cached sessions written since the
+        # last check so that none is served stale.
+        version = connection.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._local.data_version:
+            return
+        self._local.data_version = version
+        with self._lock:
+            seen = self._seen
+        connection.execute("BEGIN")
+        try:
+            seq = connection.execute("SELECT seq FROM session_writes").fetchone()[0]
+            changed = connection.execute("SELECT id, written FROM sessions WHERE written > ?", (seen,)).fetchall()
+        finally:
+            connection.execute("COMMIT")
+        with self._lock:
+            for sid, written in changed:
+                entry = self._cache.get(sid)
+                # This process's own writes are cached already
+                if entry is not None and entry[2] != written:
+                    del self._cache[sid]
+                    self._invalidations += 1
+            self._seen = max(self._seen, seq)
+
+    def _write(self, sql, **params):
+        """Run a write to `sessions`, with the next write sequence number as `:seq`; returns it."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("UPDATE session_writes SET seq = seq + 1")
+            seq = connection.execute("SELECT seq FROM session_writes").fetchone()[0]
+            connection.execute(sql, {**params, 'seq': seq})
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._writes += 1
+        return seq
+
+    def _cache_put(self, sid, entry, seen=None):
+        with self._lock:
+            if seen is not None and seen != self._seen:
+                # Checked for writes meanwhile; the row read before that may already be stale
+                return
+            self._cache[sid] = entry
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def load(self, sid):
+        """Return ``(data, expires)`` for a live session, or None."""
+        connection = self._connection()
+        self._check_data_version(connection)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                self._cache.move_to_end(sid)
+        if entry is not None and entry[1] > now:
+            self._hits += 1
+        else:
+            self._misses += 1
+            with self._lock:
+                seen = self._seen
+            entry = connection.execute("SELECT data, expires, written FROM sessions WHERE id = ? AND expires > ?",
+                                       (sid, now)).fetchone()
+            if entry is None:
+                self._cache_drop(sid)
+                return None
+            self._cache_put(sid, entry, seen)
+        # Decoded per request, so one request's edits never leak into the cache
+        return self.serializer.loads(entry[0]), entry[1]
+
+    def store(self, sid, data, expires):
+        text = self.serializer.dumps(data)
+        seq = self._write("INSERT OR REPLACE INTO sessions (id, data, expires, written) "
+                          "VALUES (:sid, :data, :expires, :seq)", sid=sid, data=text, expires=expires)
+        self._cache_put(sid, (text, expires, seq))
+
+    def touch(self, sid, expires):
+        seq = self._write("UPDATE sessions SET expires = :expires, written = :seq WHERE id = :sid",
+                          sid=sid, expires=expires)
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                self._cache[sid] = (entry[0], expires, seq)
+
+    def delete(self, sid):
+        # Kept as an expired row until the sweep, so other processes see which session went
+        self._write("UPDATE sessions SET data = '', expires = 0, written = :seq WHERE id = :sid", sid=sid)
+        self._cache_drop(sid)
+
+    def sweep(self):
+        """Delete expired sessions; returns how many were removed."""
+        removed = self._connection().execute("DELETE FROM sessions WHERE expires <= ?",
+                                             (time.time(),)).rowcount
+        self._swept += removed
+        return removed
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping expired sessions: {e}")
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.load(sid)
+            if entry is not None:
+                data, expires = entry
+                return SQLiteSession(data, sid=sid, expires=expires)
+        return SQLiteSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                self.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        if session.modified or session.new:
+            if session.new and self.permanent:
+                session.permanent = True
+            self.store(session.sid, dict(session), now + lifetime)
+        elif session.expires - now < lifetime / 2:
+            self.touch(session.sid, now + lifetime)
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def stats(self):
+        with self._lock:
+            cached = len(self._cache)
+        return {
+            'cached': cached,
+            'hits': self._hits,
+            'misses': self._misses,
+            'writes': self._writes,
+            'invalidations': self._invalidations,
+            'swept': self._swept,
+        }
@@ -0,0 +1,333 @@
+"""Where encrypted document blobs live: a local directory or an S3-compatible bucket.
+
+Objects are addressed by relative keys with ``/`` separators (for example
+``blobs/ab/cd/abcd...``). ``documents.file_path`` stores these keys, so app
+nodes that share one bucket or one network mount serve the same documents.
+Both backends offer the same methods:
+
+- ``open(key)`` returns ``(file, ObjectInfo)``. The file is a readable,
+  seekable binary file that reads lazily, so a range request only fetches
+  what it needs.
+- ``writer(key)`` is a context manager yielding a writable file. The object
+  appears only if the block exits cleanly. The file can seek back into its
+  first ``part_size`` bytes, which is where the chunked format patches its
+  header.
+- ``exists``, ``delete``, ``keys``, ``objects`` and ``location``.
+
+A missing object raises FileNotFoundError in both backends.
+"""
+import io
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # optional dependency
+    boto3 = None
+
+# version changes whenever the object is rewritten (used in ETags)
+ObjectInfo = namedtuple('ObjectInfo', 'size version')
+
+MIN_PART_SIZE = 5 * 1024 * 1024     # S3's lower limit for every part but the last
+
+
+class LocalStorage:
+    """Objects as files under ``root``."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        path = os.path.normpath(os.path.join(self.root, *key.split('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Storage key outside the storage root: {key!r}")
+        return path
+
+    def open(self, key):
+        f = open(self.path(key), 'rb')
+        stat = os.fstat(f.fileno())
+        return f, ObjectInfo(stat.st_size, f'{stat.st_mtime_ns:x}')
+
+    @contextmanager
+    def writer(self, key):
+        path = self.path(key)
+        # Unique per writer: two requests may store the same content-addressed blob at once
+        temp_path = f'{path}.{os.urandom(4).hex()}.part'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(temp_path, 'wb') as f:
+                yield f
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix=''):
+        """Yield every key under ``prefix``, skipping unfinished writes."""
+        top = self.path(prefix) if prefix else self.root
+        for directory, _, files in os.walk(top):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                yield os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+
+    def objects(self, prefix=''):
+        """Yield ``(key, ObjectInfo)`` for every key under ``prefix``."""
+        for key in self.keys(prefix):
+            try:
+                stat = os.stat(self.path(key))
+            except FileNotFoundError:
+                continue
+            yield key, ObjectInfo(stat.st_size, f'{stat.st_mtime_ns:x}')
+
+    def location(self, key):
+        return self.path(key)
+
+
+class S3Reader(io.RawIOBase):
+    """Seekable reader over one S3 object.
+
+    Sequential reads share one ranged GET streamed from the current offset;
+    a seek elsewhere opens a new one on the next read.
+    """
+
+    def __init__(self, client, bucket, key, size):
+        super().__init__()
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self.size = size
+        self._pos = 0
+        self._body = None
+        self._body_pos = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, n=-1):
+        if self._pos >= self.size:
+            return b''
+        if self._body is None or self._body_pos != self._pos:
+            self._close_body()
+            response = self._client.get_object(Bucket=self._bucket, Key=self._key, Range=f'bytes={self._pos}-')
+            self._body = response['Body']
+        wanted = self.size - self._pos if n is None or n < 0 else min(n, self.size - self._pos)
+        parts = []
+        while wanted:
+            part = self._body.read(wanted)
+            if not part:
+                break
+            parts.append(part)
+            wanted -= len(part)
+        data = b''.join(parts)
+        self._pos += len(data)
+        self._body_pos = self._pos
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+
+class S3Writer:
+    """Streams a new object to S3 as a multipart upload of ``part_size`` parts.
+
+    The first part stays in memory until the end, so the writer can seek
+    back into it, and it is uploaded last as part 1. Objects smaller than
+    one part are sent with a single PUT.
+    """
+
+    def __init__(self, client, bucket, key, part_size):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = part_size
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._pos = 0
+        self._size = 0
+        self._upload_id = None
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        target = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._size}[whence] + offset
+        if target != self._size and target > len(self._head):
+            raise io.UnsupportedOperation("S3Writer can only seek within the first part or to the end")
+        self._pos = target
+        return self._pos
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        length = len(data)
+        if self._pos < self._size:
+            if self._pos + length > min(self._size, len(self._head)):
+                raise io.UnsupportedOperation("S3Writer can only overwrite bytes within the first part")
+            self._head[self._pos:self._pos + length] = data
+            self._pos += length
+            return length
+
+        room = self._part_size - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        self._tail += data
+        while len(self._tail) >= self._part_size:
+            self._upload_part(self._tail[:self._part_size])
+            del self._tail[:self._part_size]
+        self._size += length
+        self._pos = self._size
+        return length
+
+    def _upload_part(self, body):
+        if self._upload_id is None:
+            response = self._client.create_multipart_upload(Bucket=self._bucket, Key=self._key)
+            self._upload_id = response['UploadId']
+        # Part 1 is the head, uploaded at the end
+        number = len(self._parts) + 2
+        response = self._client.upload_part(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                            PartNumber=number, Body=bytes(body))
+        self._parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+    def commit(self):
+        if self._upload_id is None:
+            self._client.put_object(Bucket=self._bucket, Key=self._key, Body=bytes(self._head + self._tail))
+            return
+        if self._tail:
+            self._upload_part(self._tail)
+        response = self._client.upload_part(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                            PartNumber=1, Body=bytes(self._head))
+        parts = [{'PartNumber': 1, 'ETag': response['ETag']}] + self._parts
+        self._client.complete_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                               MultipartUpload={'Parts': parts})
+
+    def abort(self):
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+
+
+class S3Storage:
+    """Objects in an S3 bucket (or MinIO, Ceph and other S3-compatible stores via ``endpoint_url``)."""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, access_key=None, secret_key=None,
+                 part_size=8 * 1024 * 1024, max_connections=50):
+        if boto3 is None:
+            raise RuntimeError("S3 storage needs the boto3 package")
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.part_size = part_size
+        self._client_options = {
+            'endpoint_url': endpoint_url, 'region_name': region,
+            'aws_access_key_id': access_key, 'aws_secret_access_key': secret_key,
+            'config': BotoConfig(max_pool_connections=max_connections, retries={'mode': 'standard'}),
+        }
+        # boto3 clients are thread-safe; one per process is shared by all requests
+        self.client = boto3.client('s3', **self._client_options)
+
+    def __getstate__(self):
+        # Sent to worker processes without the client, which cannot be pickled
+        state = self.__dict__.copy()
+        del state['client']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.client = boto3.client('s3', **self._client_options)
+
+    def _key(self, key):
+        if key.startswith('/') or '..' in key.split('/'):
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return self.prefix + key
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key) from None
+            raise
+
+    def open(self, key):
+        head = self._head(key)
+        info = ObjectInfo(head['ContentLength'], head['ETag'].strip('"').replace('-', ''))
+        return S3Reader(self.client, self.bucket, self._key(key), info.size), info
+
+    @contextmanager
+    def writer(self, key):
+        writer = S3Writer(self.client, self.bucket, self._key(key), self.part_size)
+        try:
+            yield writer
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+
+    def exists(self, key):
+        try:
+            self._head(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def keys(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get('Contents', ()):
+                yield item['Key'][len(self.prefix):]
+
+    def objects(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get('Contents', ()):
+                info = ObjectInfo(item['Size'], item['ETag'].strip('"').replace('-', ''))
+                yield item['Key'][len(self.prefix):], info
+
+    def location(self, key):
+        return f's3://{self.bucket}/{self._key(key)}'
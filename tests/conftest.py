@@ -0,0 +1,242 @@
+"""Shared fixtures: the Flask app on temporary storage and master keys, with a stand-in database.
+
+No MySQL server is needed. ``FakeDatabase`` records every statement and
+answers the ones a test registered a handler for; anything else succeeds
+with no rows. ConnectionPool takes any connect callable, so the stand-in is
+pooled like a real connection.
+"""
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DMS_UPLOAD_FOLDER', tempfile.mkdtemp(prefix='dms-tests-uploads-'))
+
+import server  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+from envelope import MasterKeyring, create_first_master_key  # noqa: E402
+from storage import LocalStorage  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, db, dictionary=False):
+        self.db = db
+        self.dictionary = dictionary
+        self.rowcount = 0
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, query, params=None, *args, **kwargs):
+        query = ' '.join(query.split())
+        self.db.statements.append((query, params))
+        rows = []
+        self.rowcount = None
+        for pattern, handler in self.db.handlers:
+            match = pattern.search(query)
+            if match:
+                rows = handler(params, self) or []
+                break
+        self._rows = list(rows)
+        # Handlers of writes may set rowcount themselves
+        if self.rowcount is None:
+            self.rowcount = len(self._rows) or 1
+
+    def executemany(self, query, seq_params):
+        for params in seq_params:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    in_transaction = False
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, dictionary=False, **kwargs):
+        return FakeCursor(self.db, dictionary)
+
+    def commit(self):
+        self.db.commits += 1
+
+    def rollback(self):
+        self.db.rollbacks += 1
+
+    def start_transaction(self, **kwargs):
+        pass
+
+    def ping(self, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.handlers = []
+        self.statements = []
+        self.commits = self.rollbacks = 0
+
+    def on(self, pattern, handler):
+        """Answer statements matching the regex `pattern` with ``handler(params, cursor)``'s rows."""
+        self.handlers.append((re.compile(pattern, re.IGNORECASE), handler))
+
+    def executed(self, pattern):
+        pattern = re.compile(pattern, re.IGNORECASE)
+        return [(query, params) for query, params in self.statements if pattern.search(query)]
+
+
+class DocumentTables:
+    """`documents` and `blobs` for the statements of the upload, delete, download, export and gc-blobs paths."""
+
+    def __init__(self, db):
+        self.documents = {}     # id -> [name, file_path, user_id, content_hash, upload_date]
+        self.blobs = {}         # content_hash -> [size, ref_count, key_version, wrapped_key, created_at]
+        self.last_id = 0
+        db.on(r'^INSERT IGNORE INTO blobs', self.reserve)
+        db.on(r'^SELECT key_version, wrapped_key FROM blobs WHERE content_hash = %s', self.blob_key)
+        db.on(r'^INSERT INTO blobs .* ON DUPLICATE KEY UPDATE ref_count', self.reference)
+        db.on(r'^SELECT content_hash, key_version, wrapped_key FROM blobs WHERE content_hash IN', self.blob_keys)
+        db.on(r'^UPDATE blobs SET ref_count = ref_count - %s', self.release)
+        db.on(r'^SELECT content_hash, size FROM blobs WHERE ref_count <= 0', self.unreferenced)
+        db.on(r'^SELECT ref_count FROM blobs WHERE content_hash = %s FOR UPDATE', self.ref_count)
+        db.on(r'^DELETE FROM blobs WHERE content_hash = %s', self.drop_blob)
+        db.on(r'^INSERT INTO documents', self.add_document)
+        db.on(r'^SELECT file_path, content_hash FROM documents WHERE id = %s', self.document_file)
+        db.on(r'^DELETE FROM documents WHERE id = %s', self.delete_document)
+        db.on(r'^SELECT d.id, d.name, d.file_path, d.upload_date, b.key_version, b.wrapped_key', self.export_rows)
+        db.on(r'^SELECT d.name, d.file_path, b.key_version, b.wrapped_key', self.document_blob)
+
+    def reserve(self, params, cursor):
+        digest, size, key_version, wrapped_key = params
+        cursor.rowcount = 0
+        if digest not in self.blobs:
+            self.blobs[digest] = [size, 0, key_version, wrapped_key, datetime.now()]
+            cursor.rowcount = 1
+
+    def blob_key(self, params, cursor):
+        blob = self.blobs.get(params[0])
+        return [tuple(blob[2:4])] if blob else []
+
+    def reference(self, params, cursor):
+        digest, size, references, key_version, wrapped_key = params
+        if digest in self.blobs:
+            self.blobs[digest][1] += references
+        else:
+            self.blobs[digest] = [size, references, key_version, wrapped_key, datetime.now()]
+
+    def blob_keys(self, params, cursor):
+        return [(digest, *self.blobs[digest][2:4]) for digest in params if digest in self.blobs]
+
+    def release(self, params, cursor):
+        count, digest = params
+        self.blobs[digest][1] -= count
+
+    def unreferenced(self, params, cursor):
+        return [(digest, blob[0]) for digest, blob in sorted(self.blobs.items())
+                if blob[1] <= 0 and blob[4] < params[0]]
+
+    def ref_count(self, params, cursor):
+        return [(self.blobs[params[0]][1],)] if params[0] in self.blobs else []
+
+    def drop_blob(self, params, cursor):
+        del self.blobs[params[0]]
+
+    def add_document(self, params, cursor):
+        name, file_path, user_id, digest = params
+        cursor.lastrowid = max(self.documents, default=self.last_id) + 1
+        self.last_id = cursor.lastrowid
+        self.documents[cursor.lastrowid] = [name, file_path, user_id, digest, datetime.now()]
+
+    def document_file(self, params, cursor):
+        document = self.documents.get(params[0])
+        return [(document[1], document[3])] if document else []
+
+    def delete_document(self, params, cursor):
+        cursor.rowcount = 1 if self.documents.pop(params[0], None) else 0
+
+    def blob_of(self, document):
+        return self.blobs.get(document[3], [None] * 4)[2:4]
+
+    def export_rows(self, params, cursor):
+        query = cursor.db.statements[-1][0]
+        params = list(params)
+        selected = re.search(r'd\.id IN \(([^)]*)\)', query)
+        ids = [params.pop(0) for _ in range(selected.group(1).count('%s'))] if selected else None
+        user_id = params.pop(0) if 'd.user_id' in query else None
+        return [(doc_id, document[0], document[1], document[4], *self.blob_of(document))
+                for doc_id, document in sorted(self.documents.items())
+                if (ids is None or doc_id in ids) and user_id in (None, document[2])][:params[-1]]
+
+    def document_blob(self, params, cursor):
+        document = self.documents.get(params[0])
+        if document is None or (len(params) > 1 and document[2] != params[1]):
+            return []
+        return [(document[0], document[1], *self.blob_of(document))]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server.get_db_pool, 'pool', ConnectionPool(lambda: FakeConnection(database), size=2),
+                        raising=False)
+    # Revocations are reloaded from the stand-in on first use
+    monkeypatch.delattr(server.get_revocations, 'revocations', raising=False)
+    return database
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    backend = LocalStorage(str(tmp_path / 'uploads'))
+    monkeypatch.setattr(server.get_storage, 'storage', backend, raising=False)
+    return backend
+
+
+@pytest.fixture
+def keyring(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'master_keys')
+    create_first_master_key(directory)
+    ring = MasterKeyring(directory)
+    monkeypatch.setattr(server.get_keyring, 'keyring', ring, raising=False)
+    monkeypatch.delattr(server.get_data_key_cache, 'cache', raising=False)
+    return ring
+
+
+@pytest.fixture
+def client(db, storage, keyring):
+    server.app.config['TESTING'] = True
+    return server.app.test_client()
+
+
+@pytest.fixture
+def document_tables(db, storage, keyring):
+    return DocumentTables(db)
+
+
+def log_in(client, user_id=1, is_admin=False):
+    """Give `client` a session as `user_id`, as POST /login would."""
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': f'user{user_id}@example.com', 'is_admin': is_admin,
+                           'role': 'admin' if is_admin else 'user'}
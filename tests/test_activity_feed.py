@@ -0,0 +1,121 @@
+from datetime import datetime
+
+import pytest
+
+import server
+from conftest import log_in
+from event_bus import EventBus, TablePoller
+
+
+class ActivityTable:
+    """A shared activity_logs table; `visible` rows are the committed ones."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, row_id, action):
+        self.rows[row_id] = (row_id, 'activity', {'action': action})
+
+    def fetch(self, after, missing, limit):
+        return [row for row_id, row in sorted(self.rows.items()) if row_id > after or row_id in missing][:limit]
+
+    def recent(self, limit):
+        return [row for _, row in sorted(self.rows.items())][-limit:]
+
+
+def worker(table, gap_timeout=10.0):
+    """A worker process's bus and poller, seeded without starting the polling thread."""
+    poller = TablePoller(EventBus(history=100), table.fetch, table.recent, gap_timeout=gap_timeout)
+    poller._seed()
+    return poller
+
+
+def actions(subscription):
+    events, _ = subscription.wait(0)
+    return [event['data']['action'] for event in events]
+
+
+def test_every_worker_sees_every_workers_activity():
+    table = ActivityTable()
+    first, second = worker(table), worker(table)
+    subscriptions = [first.bus.subscribe(), second.bus.subscribe()]
+
+    # Rows written by requests in either process
+    table.add(1, 'login')
+    table.add(2, 'upload')
+    first.poll()
+    second.poll()
+
+    assert [actions(subscription) for subscription in subscriptions] == [['login', 'upload']] * 2
+
+
+def test_row_committed_late_below_the_newest_id_is_published():
+    table = ActivityTable()
+    poller = worker(table)
+    subscription = poller.bus.subscribe()
+    table.add(2, 'upload')
+    poller.poll()
+    table.add(1, 'delete')      # inserted first, committed after id 2
+    poller.poll()
+    poller.poll()
+
+    assert actions(subscription) == ['upload', 'delete']
+    assert poller.stats()['gaps_filled'] == 1
+
+
+def test_skipped_id_is_given_up_after_the_gap_timeout():
+    table = ActivityTable()
+    poller = worker(table, gap_timeout=0)
+    table.add(2, 'upload')
+    poller.poll()
+    poller.poll()
+
+    assert poller.stats()['waiting_for'] == 0
+
+
+def test_client_resumes_on_another_worker():
+    table = ActivityTable()
+    for row_id, action in enumerate(['login', 'upload', 'delete'], 1):
+        table.add(row_id, action)
+    other = worker(table)
+
+    assert actions(other.bus.subscribe('1')) == ['upload', 'delete']
+    assert other.bus.subscribe('0:12').needs_reset
+    # From a worker that has already seen row 4: only newer rows follow
+    ahead = other.bus.subscribe('4')
+    table.add(4, 'register')
+    table.add(5, 'logout')
+    other.poll()
+    assert actions(ahead) == ['logout']
+
+
+def test_resume_from_before_the_replay_window_resets():
+    table = ActivityTable()
+    for row_id in range(1, 201):
+        table.add(row_id, f'action {row_id}')
+
+    assert worker(table).bus.subscribe('50').needs_reset
+
+
+@pytest.fixture
+def feed(db, monkeypatch):
+    monkeypatch.delattr(server.get_activity_feed, 'poller', raising=False)
+    # Seeded on first use; the polling thread is kept out of the way
+    monkeypatch.setitem(server.app.config, 'ACTIVITY_STREAM_POLL_INTERVAL', 3600)
+    rows = [(row_id, 1, action, datetime(2026, 10, 18, 12, 0, row_id))
+            for row_id, action in enumerate(['login', 'upload'], 1)]
+    db.on(r'FROM activity_logs ORDER BY id DESC', lambda params, cursor: rows[::-1][:params[0]])
+    db.on(r'FROM activity_logs WHERE id >', lambda params, cursor: [row for row in rows if row[0] > params[0]])
+    return rows
+
+
+def test_stream_replays_rows_from_the_table(client, feed):
+    log_in(client, is_admin=True)
+    response = client.get('/admin/activity/stream', headers={'Last-Event-ID': '1'}, buffered=False)
+    chunks = response.response
+    try:
+        assert next(chunks) == b'retry: 3000\n\n'
+        assert next(chunks) == (b'id: 2\nevent: activity\n'
+                                b'data: {"user_id": 1, "action": "upload", "timestamp": "2026-10-18 12:00:02"}\n\n')
+    finally:
+        response.close()
@@ -0,0 +1,49 @@
+import pytest
+
+import server
+from conftest import log_in
+
+
+@pytest.fixture
+def logs(client, db):
+    """Activity log rows 5 down to 1, answered newest first and limited like the query."""
+    rows = [{'id': i, 'user_id': 1, 'action': f'action {i}', 'timestamp': None} for i in range(5, 0, -1)]
+    db.on(r'FROM activity_logs WHERE', lambda params, cursor: rows[:params[-1]])
+    log_in(client, is_admin=True)
+    return rows
+
+
+def search(client, **params):
+    return client.post('/get_activity_logs', json=params)
+
+
+def last_search(db):
+    return db.executed(r'FROM activity_logs WHERE')[-1]
+
+
+def test_short_words_are_matched_with_like(client, db, logs):
+    assert search(client, query='log in').status_code == 200
+
+    query, params = last_search(db)
+    assert 'MATCH(action) AGAINST (%s IN BOOLEAN MODE) AND action LIKE %s' in query
+    assert params[:2] == ['+log*', '%in%']
+
+
+def test_only_short_words_skip_the_fulltext_match(client, db, logs):
+    search(client, search_term='on a_')
+
+    query, params = last_search(db)
+    assert 'MATCH' not in query
+    assert params[:2] == ['%on%', r'%a\_%']
+
+
+def test_next_cursor_continues_the_listing(client, db, logs, monkeypatch):
+    monkeypatch.setitem(server.app.config, 'ACTIVITY_LOG_PAGE_SIZE', 2)
+
+    page = search(client).get_json()
+    assert [row['id'] for row in page['logs']] == [5, 4]
+
+    search(client, cursor=page['next_cursor'])
+    query, params = last_search(db)
+    assert 'id < %s' in query
+    assert params[0] == 4
@@ -0,0 +1,100 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from audit_log import AuditLogWriter
+from conftest import FakeConnection, FakeDatabase
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+
+class ActivityTable:
+    """activity_logs rows of the stand-in database, whose inserts fail while ``down`` is set."""
+
+    def __init__(self, db):
+        self.rows = []
+        self.down = False
+        db.on(r'^INSERT INTO activity_logs', self.insert)
+
+    def insert(self, params, cursor):
+        if self.down:
+            raise ConnectionError("database is down")
+        self.rows.append(tuple(params))
+
+
+@pytest.fixture
+def table():
+    db = FakeDatabase()
+    table = ActivityTable(db)
+    table.db = db
+    return table
+
+
+@pytest.fixture
+def make_writer(table, tmp_path):
+    writers = []
+
+    def make_writer():
+        writer = AuditLogWriter(lambda: FakeConnection(table.db), batch_size=10, flush_interval=0.01,
+                                spill_path=str(tmp_path / 'activity_logs.spill'))
+        writers.append(writer)
+        return writer
+
+    yield make_writer
+    for writer in writers:
+        writer.close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_rows_are_written_in_batches(table, make_writer):
+    writer = make_writer()
+    for i in range(3):
+        writer.enqueue(1, f'action {i}', NOW)
+    writer.close()
+
+    assert table.rows == [(1, f'action {i}', NOW) for i in range(3)]
+    assert writer.stats()['written'] == 3
+
+
+def test_failed_batch_is_spilled_and_replayed_once(table, make_writer, tmp_path):
+    writer = make_writer()
+    table.down = True
+    writer.enqueue(1, 'logged in', NOW)
+    writer.enqueue(2, 'uploaded a.txt', NOW)
+    wait_for(lambda: writer.stats()['spilled'] == 2)
+    assert (tmp_path / 'activity_logs.spill').read_text().count('\n') == 2
+    assert not table.rows
+
+    table.down = False
+    writer.enqueue(3, 'logged out', NOW)
+    wait_for(lambda: writer.stats()['replayed'] == 2)
+    writer.enqueue(4, 'logged in', NOW)
+    writer.close()
+
+    assert sorted(table.rows) == [(1, 'logged in', NOW), (2, 'uploaded a.txt', NOW),
+                                  (3, 'logged out', NOW), (4, 'logged in', NOW)]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_left_by_a_stopped_writer_is_replayed_by_the_next(table, make_writer, tmp_path):
+    table.down = True
+    first = make_writer()
+    first.enqueue(1, 'logged in', NOW)
+    first.close()
+    assert first.stats()['spilled'] == 1
+
+    table.down = False
+    second = make_writer()
+    second.enqueue(2, 'logged out', NOW)
+    second.close()
+
+    assert sorted(table.rows) == [(1, 'logged in', NOW), (2, 'logged out', NOW)]
+    assert second.stats()['replayed'] == 1
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,145 @@
+import time
+from datetime import datetime
+
+import server
+from auth_tokens import RevocationList, decode_access_token, mint_access_token
+
+USER = {'id': 1, 'email': 'user1@example.com', 'is_admin': False}
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def access_token(family_id='family-1'):
+    return mint_access_token(server.app.config['SECRET_KEY'], USER, server.app.config['ACCESS_TOKEN_LIFETIME'],
+                             family_id)
+
+
+def test_logout_revokes_the_bearer_token(client, db):
+    token = access_token()
+    assert client.get('/user_dashboard', headers=bearer(token)).status_code == 200
+
+    assert client.post('/logout', headers=bearer(token)).status_code == 200
+
+    assert client.get('/user_dashboard', headers=bearer(token)).status_code == 401
+    claims = decode_access_token(server.app.config['SECRET_KEY'], token)
+    (_, params), = db.executed('INSERT INTO revoked_access_tokens')
+    assert params == (claims['jti'], 1, claims['exp'])
+    assert db.executed('DELETE FROM refresh_tokens')[0][1] == ('family-1', 1)
+
+
+def test_logout_leaves_other_logins_alone(client, db):
+    token, other = access_token('family-1'), access_token('family-2')
+    client.post('/logout', headers=bearer(token))
+
+    assert client.get('/user_dashboard', headers=bearer(other)).status_code == 200
+    assert [params for _, params in db.executed('DELETE FROM refresh_tokens')] == [('family-1', 1)]
+
+
+def test_token_revoked_by_another_process_is_rejected(client, db):
+    token = access_token()
+    claims = decode_access_token(server.app.config['SECRET_KEY'], token)
+    db.on(r'FROM revoked_access_tokens', lambda params, cursor: [(claims['jti'], claims['exp'])])
+
+    assert client.get('/user_dashboard', headers=bearer(token)).status_code == 401
+
+
+def test_user_revocation_rejects_tokens_issued_before_it():
+    now = int(time.time())
+    revocations = RevocationList(lambda since: [(1, now)], token_lifetime=900)
+
+    assert revocations.is_revoked(1, now - 10)
+    assert revocations.is_revoked(1, now)
+    assert not revocations.is_revoked(1, now + 1)
+    assert not revocations.is_revoked(2, now - 10)
+
+
+def test_revoked_token_ids_are_forgotten_once_expired():
+    now = int(time.time())
+    revocations = RevocationList(lambda since: [], token_lifetime=900, refresh_interval=0,
+                                 load_tokens=lambda now: [])
+    revocations.revoke_token('live', now + 60)
+    revocations.revoke_token('expired', now - 60)
+    revocations.refresh()
+
+    assert revocations.is_revoked(1, now, 'live')
+    assert not revocations.is_revoked(1, now, 'expired')
+
+
+class RefreshTokens:
+    """`refresh_tokens` joined to one user, for the statements of /token/refresh."""
+
+    def __init__(self, db, is_active=True):
+        self.rows = {}      # token_hash -> [user_id, family_id, used_at, live]
+        self.is_active = is_active
+        db.on(r'^INSERT INTO refresh_tokens', self.insert)
+        db.on(r'FROM refresh_tokens r JOIN users u', self.lookup)
+        db.on(r'^UPDATE refresh_tokens SET used_at', self.use)
+        db.on(r'^DELETE FROM refresh_tokens WHERE family_id = %s', self.revoke_family)
+
+    def insert(self, params, cursor):
+        token_hash, user_id, family_id, expires_at = params
+        self.rows[token_hash] = [user_id, family_id, None, expires_at > datetime.now()]
+
+    def lookup(self, params, cursor):
+        row = self.rows.get(params[0])
+        return [(*row, USER['email'], USER['is_admin'], self.is_active)] if row else []
+
+    def use(self, params, cursor):
+        self.rows[params[0]][2] = datetime.now()
+
+    def revoke_family(self, params, cursor):
+        self.rows = {token_hash: row for token_hash, row in self.rows.items() if row[1] != params[0]}
+
+
+def first_refresh_token(db, family_id='family-1'):
+    connection = server.get_db_pool().checkout()
+    try:
+        return server.issue_refresh_token(connection.cursor(), USER['id'], family_id)
+    finally:
+        connection.close()
+
+
+def refresh(client, token):
+    return client.post('/token/refresh', json={'refresh_token': token})
+
+
+def test_refresh_rotates_the_refresh_token(client, db):
+    tokens = RefreshTokens(db)
+    token = first_refresh_token(db)
+
+    response = refresh(client, token)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['refresh_token'] != token
+    claims = decode_access_token(server.app.config['SECRET_KEY'], body['token'])
+    assert (claims['user_id'], claims['fam']) == (1, 'family-1')
+    assert client.get('/user_dashboard', headers=bearer(body['token'])).status_code == 200
+    assert refresh(client, body['refresh_token']).status_code == 200
+    assert [row[2] is not None for row in tokens.rows.values()] == [True, True, False]
+
+
+def test_reused_refresh_token_revokes_its_family(client, db):
+    tokens = RefreshTokens(db)
+    stolen = first_refresh_token(db)
+    other_login = first_refresh_token(db, 'family-2')
+    rotated = refresh(client, stolen).get_json()['refresh_token']
+
+    assert refresh(client, stolen).status_code == 401
+    assert refresh(client, rotated).status_code == 401
+    assert [row[1] for row in tokens.rows.values()] == ['family-2']
+    assert refresh(client, other_login).status_code == 200
+
+
+def test_refresh_token_of_an_expired_or_inactive_login_is_refused(client, db, monkeypatch):
+    tokens = RefreshTokens(db)
+    monkeypatch.setitem(server.app.config, 'REFRESH_TOKEN_LIFETIME', -1)
+    assert refresh(client, first_refresh_token(db)).status_code == 401
+
+    monkeypatch.setitem(server.app.config, 'REFRESH_TOKEN_LIFETIME', 3600)
+    tokens.is_active = False
+    assert refresh(client, first_refresh_token(db)).status_code == 401
+    assert refresh(client, 'not-a-token').status_code == 401
+    assert client.post('/token/refresh', json={}).status_code == 400
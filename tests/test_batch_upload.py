@@ -0,0 +1,93 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import server
+from conftest import log_in
+
+TEXT = b'quarterly numbers, ' * 5000
+RANDOM = os.urandom(150 * 1024)
+
+
+@pytest.fixture
+def tables(client, document_tables):
+    log_in(client)
+    return document_tables
+
+
+def post_batch(client, **data):
+    return client.post('/upload_documents', data=data, content_type='multipart/form-data')
+
+
+def stored_contents(client, tables):
+    """Each uploaded document's name and decrypted content, by id."""
+    log_in(client, is_admin=True)
+    return {doc_id: (document[0], client.get(f'/user/document/{doc_id}/download').data)
+            for doc_id, document in tables.documents.items()}
+
+
+def archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members:
+            if name.endswith('/'):
+                zf.writestr(zipfile.ZipInfo(name), b'')
+            else:
+                zf.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+def test_files_batch(client, tables):
+    response = post_batch(client, files=[(io.BytesIO(TEXT), 'a.txt'), (io.BytesIO(RANDOM), 'b.bin'),
+                                         (io.BytesIO(TEXT), 'a copy.txt')])
+
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body['uploaded'], body['failed']) == (3, 0)
+    assert body['results'] == [{'filename': 'a.txt', 'success': True, 'name': 'a.txt'},
+                               {'filename': 'b.bin', 'success': True, 'name': 'b.bin'},
+                               {'filename': 'a copy.txt', 'success': True, 'name': 'a_copy.txt'}]
+    assert sorted(blob[1] for blob in tables.blobs.values()) == [1, 2]
+    assert stored_contents(client, tables) == {1: ('a.txt', TEXT), 2: ('b.bin', RANDOM), 3: ('a_copy.txt', TEXT)}
+
+
+def test_zip_batch(client, tables):
+    members = [('docs/', b''), ('docs/a.txt', TEXT), ('docs/b.bin', RANDOM), ('__MACOSX/docs/._a.txt', b'x'),
+               ('docs/empty.txt', b''), ('../', b'')]
+    response = post_batch(client, archive=(archive(members), 'batch.zip'))
+
+    assert response.status_code == 201
+    assert [result['filename'] for result in response.get_json()['results']] == [
+        'docs/a.txt', 'docs/b.bin', 'docs/empty.txt']
+    assert stored_contents(client, tables) == {1: ('a.txt', TEXT), 2: ('b.bin', RANDOM), 3: ('empty.txt', b'')}
+
+
+def test_batch_with_an_invalid_name_is_partly_uploaded(client, tables):
+    response = post_batch(client, archive=(archive([('a.txt', TEXT), ('docs/..', b'x')]), 'batch.zip'))
+
+    assert response.status_code == 207
+    assert response.get_json()['results'][1] == {'filename': 'docs/..', 'success': False,
+                                                 'message': 'Invalid file name'}
+    assert len(tables.documents) == 1
+
+
+@pytest.mark.parametrize('setting,value,message', [
+    ('UPLOAD_BATCH_MAX_FILES', 1, 'At most 1 files per batch'),
+    ('UPLOAD_BATCH_MAX_BYTES', len(TEXT), 'The archive expands beyond the batch size limit'),
+])
+def test_batch_over_the_limits_is_rejected(client, tables, monkeypatch, setting, value, message):
+    monkeypatch.setitem(server.app.config, setting, value)
+
+    response = post_batch(client, archive=(archive([('a.txt', TEXT), ('b.bin', RANDOM)]), 'batch.zip'))
+
+    assert (response.status_code, response.get_json()['message']) == (400, message)
+    assert not tables.documents
+
+
+def test_invalid_archive_is_rejected(client, tables):
+    response = post_batch(client, archive=(io.BytesIO(b'not a zip'), 'batch.zip'))
+
+    assert (response.status_code, response.get_json()['message']) == (400, 'The archive is not a valid ZIP file')
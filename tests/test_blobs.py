@@ -0,0 +1,92 @@
+import io
+import os
+
+import pytest
+
+import server
+from conftest import log_in
+
+CONTENT = os.urandom(100 * 1024)
+
+
+@pytest.fixture
+def tables(client, document_tables, monkeypatch):
+    # Unreferenced blobs are collected right away
+    monkeypatch.setitem(server.app.config, 'BLOB_GC_GRACE', -60)
+    return document_tables
+
+
+def upload(client, content, name='report.pdf', user_id=1):
+    log_in(client, user_id=user_id)
+    response = client.post('/upload_document', data={'file': (io.BytesIO(content), name)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def download(client, doc_id):
+    log_in(client, is_admin=True)
+    response = client.get(f'/user/document/{doc_id}/download')
+    assert response.status_code == 200
+    return response.data
+
+
+def gc_blobs(*args):
+    return server.app.test_cli_runner().invoke(args=['gc-blobs', *args]).output
+
+
+def test_same_content_is_stored_once_and_counted_per_document(client, tables, storage):
+    assert upload(client, CONTENT, user_id=1) == {"message": "Document uploaded successfully!"}
+    assert upload(client, CONTENT, 'copy.pdf', user_id=2) == {"message": "Document uploaded successfully!"}
+    upload(client, b'other content', 'other.txt')
+
+    (digest, blob), = [(digest, blob) for digest, blob in tables.blobs.items() if blob[0] == len(CONTENT)]
+    assert blob[1] == 2
+    assert [document[1] for document in tables.documents.values()] == [
+        server.content_key(digest), server.content_key(digest), *(server.content_key(other) for other in tables.blobs
+                                                                   if other != digest)]
+    assert sum(len(files) for _, _, files in os.walk(storage.root)) == 2
+    assert download(client, 1) == download(client, 2) == CONTENT
+
+
+def test_gc_blobs_deletes_a_blob_once_no_document_refers_to_it(client, tables, storage):
+    upload(client, CONTENT)
+    upload(client, CONTENT, 'copy.pdf')
+    digest, = tables.blobs
+    key = server.content_key(digest)
+
+    log_in(client)
+    assert client.delete('/delete_document/1').status_code == 200
+    assert tables.blobs[digest][1] == 1
+    assert gc_blobs() == 'deleted 0 blob(s), 0 plaintext bytes\n'
+
+    assert client.delete('/delete_document/2').status_code == 200
+    assert tables.blobs[digest][1] == 0
+    assert gc_blobs('--dry-run') == f'would delete {digest} ({len(CONTENT)} bytes)\n'
+    assert storage.exists(key)
+
+    assert gc_blobs() == f'deleted 1 blob(s), {len(CONTENT)} plaintext bytes\n'
+    assert not storage.exists(key)
+    assert digest not in tables.blobs
+
+
+def test_upload_after_gc_stores_the_content_again(client, tables, storage):
+    upload(client, CONTENT)
+    log_in(client)
+    client.delete('/delete_document/1')
+    gc_blobs()
+
+    upload(client, CONTENT, 'again.pdf')
+
+    assert download(client, 2) == CONTENT
+
+
+def test_blob_file_gone_under_its_row_is_rewritten(client, tables, storage):
+    upload(client, CONTENT)
+    digest, = tables.blobs
+    storage.delete(server.content_key(digest))
+
+    upload(client, CONTENT, 'copy.pdf')
+
+    assert tables.blobs[digest][1] == 2
+    assert download(client, 1) == CONTENT
@@ -0,0 +1,76 @@
+import io
+import os
+
+import pytest
+
+from chunked_crypto import (TAG_SIZE, CorruptBlobError, encrypt_stream, iter_decrypt, iter_decrypt_range,
+                            read_header, verify_chunks)
+from compression import CODEC_NONE, CODEC_ZLIB
+
+KEY = bytes(range(32))
+CHUNK_SIZE = 1024
+
+
+def seal(plaintext, codec=CODEC_NONE):
+    blob = io.BytesIO()
+    assert encrypt_stream(io.BytesIO(plaintext), blob, KEY, chunk_size=CHUNK_SIZE, codec=codec) == len(plaintext)
+    return blob.getvalue()
+
+
+def open_blob(blob):
+    return b''.join(iter_decrypt(io.BytesIO(blob), KEY))
+
+
+@pytest.mark.parametrize('codec', [CODEC_NONE, CODEC_ZLIB])
+@pytest.mark.parametrize('size', [0, 1, CHUNK_SIZE, 3 * CHUNK_SIZE, 3 * CHUNK_SIZE + 17])
+def test_round_trip(codec, size):
+    plaintext = os.urandom(size // 2) + b'a' * (size - size // 2)
+    blob = seal(plaintext, codec)
+
+    assert open_blob(blob) == plaintext
+    assert read_header(io.BytesIO(blob)).content_length == size
+
+
+@pytest.mark.parametrize('codec', [CODEC_NONE, CODEC_ZLIB])
+def test_range_decrypts_only_the_requested_bytes(codec):
+    plaintext = os.urandom(5 * CHUNK_SIZE + 100)
+    blob = seal(plaintext, codec)
+
+    for start, stop in [(0, 1), (CHUNK_SIZE - 1, CHUNK_SIZE + 1), (2 * CHUNK_SIZE + 5, len(plaintext)), (7, 7)]:
+        fp = io.BytesIO(blob)
+        header = read_header(fp)
+        assert b''.join(iter_decrypt_range(fp, KEY, header, len(blob), start, stop)) == plaintext[start:stop]
+
+
+def records(blob):
+    """Split a blob into its header and its chunk records."""
+    header = read_header(io.BytesIO(blob))
+    size = CHUNK_SIZE + TAG_SIZE
+    body = blob[header.size:]
+    return blob[:header.size], [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def tampered():
+    header, chunks = records(seal(os.urandom(3 * CHUNK_SIZE + 10)))
+    flipped = bytearray(chunks[1])
+    flipped[5] ^= 1
+    yield 'flipped bit', header + b''.join([chunks[0], bytes(flipped), *chunks[2:]])
+    yield 'swapped chunks', header + b''.join([chunks[1], chunks[0], *chunks[2:]])
+    yield 'dropped last chunk', header + b''.join(chunks[:-1])
+    yield 'truncated', header + b''.join(chunks)[:-TAG_SIZE // 2]
+    changed_length = bytearray(header)
+    changed_length[-1] ^= 1
+    yield 'changed length in header', bytes(changed_length) + b''.join(chunks)
+
+
+@pytest.mark.parametrize('name,blob', list(tampered()))
+def test_tampering_is_detected(name, blob):
+    with pytest.raises(CorruptBlobError):
+        open_blob(blob)
+    with pytest.raises(CorruptBlobError):
+        verify_chunks(io.BytesIO(blob), KEY)
+
+
+def test_wrong_key_is_detected():
+    with pytest.raises(CorruptBlobError):
+        b''.join(iter_decrypt(io.BytesIO(seal(b'secret')), bytes(32)))
@@ -0,0 +1,66 @@
+import io
+import os
+
+import pytest
+
+from chunked_crypto import encrypt_stream, iter_decrypt, read_header
+from compression import (CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD, SAMPLE_SIZE, CompressingReader, available,
+                         choose_codec, choose_codec_from_prefix, decompressor)
+
+KEY = bytes(range(32))
+TEXT = b'quarterly numbers, ' * 20000
+RANDOM = os.urandom(300 * 1024)
+CODECS = [CODEC_ZLIB, pytest.param(CODEC_ZSTD, marks=pytest.mark.skipif(
+    not available(CODEC_ZSTD), reason="needs the zstandard package"))]
+
+
+@pytest.mark.parametrize('filename,content,expected', [
+    ('report.txt', TEXT, CODEC_ZLIB),
+    ('data.bin', RANDOM, CODEC_NONE),
+    ('photo.PNG', TEXT, CODEC_NONE),
+    ('empty.txt', b'', CODEC_NONE),
+    # Compressible only after the first sample window, like many PDFs
+    ('mixed.pdf', RANDOM[:SAMPLE_SIZE] + TEXT, CODEC_ZLIB),
+])
+def test_choose_codec(filename, content, expected):
+    fp = io.BytesIO(b'xx' + content)
+    fp.seek(2)
+
+    assert choose_codec(filename, fp, CODEC_ZLIB) == expected
+    assert fp.tell() == 2
+
+
+def test_choose_codec_from_prefix_replays_the_sample():
+    codec, reader = choose_codec_from_prefix('report.txt', io.BytesIO(TEXT), CODEC_ZLIB)
+
+    assert codec == CODEC_ZLIB
+    assert reader.read(7) + reader.read() == TEXT
+
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('content', [TEXT, RANDOM, b''], ids=['compressible', 'incompressible', 'empty'])
+def test_compressing_reader_round_trip(codec, content):
+    reader = CompressingReader(io.BytesIO(content), codec, read_size=4096)
+    compressed = b''.join(iter(lambda: reader.read(1000), b''))
+
+    assert decompressor(codec).decompress(compressed) == content
+    assert reader.raw_bytes == len(content)
+    if content is TEXT:
+        assert len(compressed) < len(content) // 10
+
+
+@pytest.mark.parametrize('filename,content', [('report.txt', TEXT), ('data.bin', RANDOM)])
+def test_blob_records_the_chosen_codec(filename, content):
+    codec = choose_codec(filename, io.BytesIO(content), CODEC_ZLIB)
+    blob = io.BytesIO()
+    encrypt_stream(io.BytesIO(content), blob, KEY, chunk_size=64 * 1024, codec=codec)
+    blob.seek(0)
+
+    header = read_header(blob)
+    assert (header.version, header.codec, header.content_length) == (2, codec, len(content))
+    blob.seek(0)
+    assert b''.join(iter_decrypt(blob, KEY)) == content
+    if codec == CODEC_NONE:
+        assert len(blob.getvalue()) > len(content)
+    else:
+        assert len(blob.getvalue()) < len(content) // 10
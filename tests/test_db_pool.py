@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+import pytest
+
+import server
+from conftest import FakeConnection, FakeDatabase
+from db_pool import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def fake():
+    return FakeDatabase()
+
+
+def make_pool(fake, **options):
+    return ConnectionPool(lambda: FakeConnection(fake), **{'size': 1, 'max_overflow': 0, **options})
+
+
+def test_stale_close_leaves_the_next_checkout_alone(fake):
+    pool = make_pool(fake)
+    first = pool.checkout()
+    first.close()
+    second = pool.checkout()
+    assert second.raw is not None
+
+    # e.g. a request's teardown closing what its route already closed
+    first.close()
+
+    assert second.checked_out
+    assert pool.stats()['in_use'] == 1
+    assert fake.rollbacks == 1
+
+
+def test_request_teardown_does_not_release_another_requests_connection(fake, monkeypatch):
+    monkeypatch.setattr(server.get_db_pool, 'pool', make_pool(fake, timeout=0), raising=False)
+    with server.app.app_context():
+        connection = server.create_connection()
+        # The route is done with it; another thread checks the same connection out
+        connection.close()
+        other = server.get_db_pool().checkout()
+        # Nor does a later create_connection() in the request take it over
+        assert server.create_connection() is None
+    assert other.checked_out
+    assert server.get_db_pool().stats()['in_use'] == 1
+    other.close()
+
+
+class CountingConnection(FakeConnection):
+    """A stand-in connection that counts pings and closes, and can fail its pings."""
+
+    def __init__(self, db, opened):
+        super().__init__(db)
+        self.pings = 0
+        self.closed = False
+        self.ping_fails = False
+        opened.append(self)
+
+    def ping(self, **kwargs):
+        self.pings += 1
+        if self.ping_fails:
+            raise ConnectionError("server has gone away")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened():
+    return []
+
+
+def counting_pool(fake, opened, **options):
+    return ConnectionPool(lambda: CountingConnection(fake, opened), **{'size': 1, 'max_overflow': 0, **options})
+
+
+def test_connections_are_reused(fake, opened):
+    pool = counting_pool(fake, opened)
+    pool.checkout().close()
+    pool.checkout().close()
+
+    assert len(opened) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted(fake):
+    pool = make_pool(fake, timeout=0.05)
+    held = pool.checkout()
+
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+    assert pool.stats()['exhausted'] == 1
+    held.close()
+    pool.checkout()
+
+
+def test_waiting_checkout_gets_the_released_connection(fake):
+    pool = make_pool(fake, timeout=5)
+    held = pool.checkout()
+    threading.Timer(0.05, held.close).start()
+
+    assert pool.checkout().checked_out
+    assert pool.stats()['wait_seconds_max'] > 0
+
+
+def test_overflow_connections_are_closed_on_release(fake, opened):
+    pool = counting_pool(fake, opened, max_overflow=1, timeout=0)
+    first, second = pool.checkout(), pool.checkout()
+    assert pool.stats()['open'] == 2
+
+    first.close()
+    second.close()
+
+    assert [connection.closed for connection in opened] == [False, True]
+    assert pool.stats()['open'] == pool.stats()['idle'] == 1
+
+
+def test_old_connections_are_recycled(fake, opened, monkeypatch):
+    pool = counting_pool(fake, opened, recycle=60)
+    pool.checkout().close()
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 61)
+
+    pool.checkout()
+
+    assert len(opened) == 2 and opened[0].closed
+    assert pool.stats()['recycled'] == 1
+
+
+def test_idle_connections_are_pinged_before_checkout(fake, opened, monkeypatch):
+    pool = counting_pool(fake, opened, ping_after=30)
+    pool.checkout().close()
+    pool.checkout().close()
+    assert opened[0].pings == 0
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 31)
+    opened[0].ping_fails = True
+    pool.checkout()
+
+    assert opened[0].pings == 1 and opened[0].closed
+    assert len(opened) == 2
+    assert pool.stats()['failed_pings'] == 1
+
+
+def test_child_process_starts_with_an_empty_pool(fake, opened, monkeypatch):
+    pool = counting_pool(fake, opened)
+    pool.checkout().close()
+    monkeypatch.setattr(os, 'getpid', lambda: -1)
+
+    pool.checkout()
+
+    assert len(opened) == 2
+    # The parent's connection is left to the parent
+    assert not opened[0].closed
+
+
+def test_request_shares_one_connection_until_teardown(fake, monkeypatch):
+    monkeypatch.setattr(server.get_db_pool, 'pool', make_pool(fake), raising=False)
+    with server.app.app_context():
+        connection = server.create_connection()
+        assert server.create_connection() is connection
+        assert server.get_db_pool().stats()['in_use'] == 1
+    assert not connection.checked_out
+    assert server.get_db_pool().stats()['in_use'] == 0
+
+
+def test_closed_connection_cannot_be_used(fake):
+    pool = make_pool(fake)
+    connection = pool.checkout()
+    connection.close()
+
+    with pytest.raises(AttributeError):
+        connection.cursor()
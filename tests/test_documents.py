@@ -0,0 +1,88 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import asgi
+import server
+from conftest import log_in
+
+NOW = datetime(2026, 10, 18, 12, 0, 0)
+DOCUMENTS = [{'id': i, 'name': f'doc{i}.pdf', 'upload_date': NOW - timedelta(hours=i), 'user_id': 1 + i % 2}
+             for i in range(1, 8)]
+
+
+def answer_documents(db):
+    """Serve DOCUMENTS for the page and count queries of /get_documents."""
+    def page(params, cursor):
+        params = list(params)
+        rows = DOCUMENTS
+        query = cursor.db.statements[-1][0]
+        if 'user_id = %s' in query:
+            user_id = params.pop(0)
+            rows = [row for row in rows if row['user_id'] == user_id]
+        if 'upload_date < %s' in query:
+            upload_date, _, doc_id = params[:3]
+            params = params[3:]
+            rows = [row for row in rows if (row['upload_date'], row['id']) < (upload_date, doc_id)]
+        limit, offset = params[0], params[1] if len(params) > 1 else 0
+        return [dict(row) for row in rows[offset:offset + limit]]
+
+    def count(params, cursor):
+        return [(sum(1 for row in DOCUMENTS if not params or row['user_id'] == params[0]),)]
+
+    db.on(r'^SELECT id, name, upload_date, user_id FROM documents', page)
+    db.on(r'^SELECT COUNT\(\*\) FROM documents', count)
+
+
+def asgi_get(monkeypatch, db, user, query_string):
+    """Call the native ASGI handler, with its queries answered by the same stand-in database."""
+    connection = server.get_db_pool().checkout()
+
+    async def fetch(query, params=(), dictionary=False, one=False):
+        cursor = connection.cursor(dictionary=dictionary)
+        cursor.execute(query, params)
+        return cursor.fetchone() if one else cursor.fetchall()
+
+    monkeypatch.setattr(asgi, 'fetch', fetch)
+    request = asgi.Request({'method': 'GET', 'path': '/get_documents', 'headers': [],
+                            'query_string': query_string.encode('latin-1')})
+    try:
+        response = asyncio.run(asgi.get_documents(request, user))
+    finally:
+        connection.close()
+    return response.status, json.loads(response.body)
+
+
+@pytest.mark.parametrize('is_admin', [False, True])
+def test_keyset_pages_cover_every_document_once(client, db, is_admin):
+    answer_documents(db)
+    log_in(client, user_id=1, is_admin=is_admin)
+    expected = [row['id'] for row in DOCUMENTS if is_admin or row['user_id'] == 1]
+
+    seen, query = [], 'limit=2&total=exact'
+    while True:
+        body = client.get(f'/get_documents?{query}').get_json()
+        assert body['total'] == len(expected)
+        seen += [document['id'] for document in body['documents']]
+        if body['next_cursor'] is None:
+            break
+        query = f"limit=2&cursor={body['next_cursor']}&total=exact"
+    assert seen == expected
+
+
+def test_invalid_pagination_is_rejected(client, db):
+    log_in(client)
+    assert client.get('/get_documents?limit=0').status_code == 400
+    assert client.get('/get_documents?cursor=nonsense').status_code == 400
+
+
+@pytest.mark.parametrize('query_string', ['limit=3', 'limit=3&page=2', 'limit=0', 'limit=2&total=none'])
+def test_asgi_and_flask_answer_alike(client, db, monkeypatch, query_string):
+    answer_documents(db)
+    user = {'id': 1, 'email': 'user1@example.com', 'is_admin': True, 'role': 'admin'}
+    log_in(client, user_id=1, is_admin=True)
+    flask_response = client.get(f'/get_documents?{query_string}')
+
+    assert asgi_get(monkeypatch, db, user, query_string) == (flask_response.status_code, flask_response.get_json())
@@ -0,0 +1,70 @@
+import io
+import os
+
+import pytest
+
+import server
+from conftest import log_in
+from envelope import new_data_key
+
+CONTENT = os.urandom(200 * 1024)
+
+
+@pytest.fixture
+def document(client, db, keyring):
+    """A stored, multi-chunk document 7 owned by user 1."""
+    data_key = new_data_key()
+    key = server.content_key('ef' * 32)
+    server.store_encrypted(io.BytesIO(CONTENT), key, data_key=data_key)
+    version, wrapped_key = keyring.wrap(data_key)
+    db.on(r'FROM documents d LEFT JOIN blobs b', lambda params, cursor: [('report.pdf', key, version, wrapped_key)])
+    log_in(client)
+    return '/user/document/7/download'
+
+
+def test_full_download(client, document):
+    response = client.get(document)
+
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Length'] == str(len(CONTENT))
+
+
+@pytest.mark.parametrize('header,start,stop', [
+    ('bytes=0-0', 0, 1),
+    ('bytes=100-70000', 100, 70001),
+    ('bytes=65536-131071', 65536, 131072),
+    ('bytes=-10', len(CONTENT) - 10, len(CONTENT)),
+    ('bytes=150000-', 150000, len(CONTENT)),
+])
+def test_range_request_gets_206(client, document, header, start, stop):
+    response = client.get(document, headers={'Range': header})
+
+    assert response.status_code == 206
+    assert response.data == CONTENT[start:stop]
+    assert response.headers['Content-Range'] == f'bytes {start}-{stop - 1}/{len(CONTENT)}'
+    assert response.headers['Content-Length'] == str(stop - start)
+
+
+def test_unsatisfiable_range_gets_416(client, document):
+    response = client.get(document, headers={'Range': f'bytes={len(CONTENT)}-'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_if_range_with_a_stale_etag_gets_the_whole_document(client, document):
+    etag = client.get(document).headers['ETag']
+
+    assert client.get(document, headers={'Range': 'bytes=0-9', 'If-Range': etag}).status_code == 206
+    response = client.get(document, headers={'Range': 'bytes=0-9', 'If-Range': '"0-0"'})
+    assert response.status_code == 200
+    assert response.data == CONTENT
+
+
+def test_multiple_ranges_get_the_whole_document(client, document):
+    response = client.get(document, headers={'Range': 'bytes=0-9,20-29'})
+
+    assert response.status_code == 200
+    assert response.data == CONTENT
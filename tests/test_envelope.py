@@ -0,0 +1,81 @@
+import pytest
+
+import server
+from envelope import (DataKeyCache, KeyUnwrapError, MasterKeyring, NoMasterKeyError, create_first_master_key,
+                      new_data_key)
+
+
+def test_keyring_refuses_an_empty_directory(tmp_path):
+    with pytest.raises(NoMasterKeyError):
+        MasterKeyring(str(tmp_path / 'master_keys'))
+    assert not (tmp_path / 'master_keys').exists()
+
+
+def test_first_master_key_is_created_once(tmp_path):
+    directory = str(tmp_path / 'master_keys')
+    assert create_first_master_key(directory)
+    first = (tmp_path / 'master_keys' / '1.key').read_bytes()
+
+    assert not create_first_master_key(directory)
+    assert (tmp_path / 'master_keys' / '1.key').read_bytes() == first
+    assert MasterKeyring(directory).versions() == [1]
+
+
+def test_data_keys_unwrap_across_versions(keyring):
+    data_key = new_data_key()
+    version, wrapped = keyring.wrap(data_key)
+    assert version == 1
+
+    assert keyring.add() == 2
+    assert keyring.current_version == 2
+    assert keyring.unwrap(1, wrapped) == data_key
+
+    rewrapped_version, rewrapped = keyring.wrap(keyring.unwrap(version, wrapped))
+    assert rewrapped_version == 2
+    assert keyring.unwrap(2, rewrapped) == data_key
+
+
+def test_version_added_by_another_process_is_picked_up(keyring):
+    other = MasterKeyring(keyring.directory)
+    version, wrapped = other.wrap(new_data_key(), other.add())
+
+    assert keyring.unwrap(version, wrapped) == other.unwrap(version, wrapped)
+
+
+def test_wrapped_key_is_bound_to_its_version(keyring):
+    _, wrapped = keyring.wrap(new_data_key())
+    keyring.add()
+
+    with pytest.raises(KeyUnwrapError):
+        keyring.unwrap(2, wrapped)
+    with pytest.raises(KeyUnwrapError):
+        keyring.unwrap(9, wrapped)
+
+
+def test_data_key_cache_expires_entries(keyring, monkeypatch):
+    version, wrapped = keyring.wrap(new_data_key())
+    cache = DataKeyCache(keyring, max_size=1, ttl=60)
+    assert cache.get(version, wrapped) == cache.get(version, wrapped)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    monkeypatch.setattr('envelope.time.monotonic', lambda: 10 ** 9)
+    cache.get(version, wrapped)
+    assert cache.misses == 2
+
+
+def test_init_master_key_command(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'master_keys')
+    monkeypatch.setitem(server.app.config, 'MASTER_KEY_DIR', directory)
+    runner = server.app.test_cli_runner()
+
+    assert runner.invoke(args=['init-master-key']).exit_code == 0
+    assert MasterKeyring(directory).versions() == [1]
+    assert runner.invoke(args=['init-master-key']).exit_code != 0
+
+
+def test_add_master_key_does_not_rewrap(keyring, db):
+    result = server.app.test_cli_runner().invoke(args=['add-master-key'])
+
+    assert result.exit_code == 0
+    assert keyring.versions() == [1, 2]
+    assert db.statements == []
@@ -0,0 +1,78 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import server
+from conftest import log_in
+
+CONTENT = os.urandom(150 * 1024)
+
+
+@pytest.fixture
+def tables(client, document_tables):
+    """Documents 1 and 2 (same name) of user 1, and 3 of user 2."""
+    for name, content, user_id in [('report.pdf', CONTENT, 1), ('report.pdf', b'second report', 1),
+                                   ('notes.txt', b'notes', 2)]:
+        log_in(client, user_id=user_id)
+        client.post('/upload_document', data={'file': (io.BytesIO(content), name)},
+                    content_type='multipart/form-data')
+    return document_tables
+
+
+def export(client, **params):
+    return client.post('/export_documents', json=params)
+
+
+def entries(response):
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.testzip() is None
+        return {info.filename: zf.read(info) for info in zf.infolist()}
+
+
+def test_export_streams_the_documents_decrypted(client, tables):
+    log_in(client, user_id=1)
+    response = export(client, ids=[1, 2])
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert entries(response) == {'report.pdf': CONTENT, 'report (1).pdf': b'second report'}
+
+
+def test_admin_exports_by_user(client, tables):
+    log_in(client, is_admin=True)
+
+    assert entries(export(client, user_id=2)) == {'notes.txt': b'notes'}
+
+
+def test_user_cannot_export_other_users_documents(client, tables):
+    log_in(client, user_id=1)
+    response = export(client, ids=[1, 3])
+
+    assert response.status_code == 404
+    assert response.get_json()['missing'] == [3]
+
+
+def test_unreadable_document_is_listed_in_the_archive(client, tables, storage):
+    storage.delete(tables.documents[2][1])
+    log_in(client, user_id=1)
+
+    assert entries(export(client, ids=[1, 2])) == {
+        'report.pdf': CONTENT,
+        'export_errors.txt': b'Documents that could not be exported in full:\n2: file not found on server\n'}
+
+
+@pytest.mark.parametrize('params', [{}, {'ids': ['x']}, {'ids': [1], 'since': 'yesterday'}])
+def test_invalid_selection_is_rejected(client, tables, params):
+    log_in(client, is_admin=True)
+
+    assert export(client, **params).status_code == 400
+
+
+def test_export_over_the_limit_is_rejected(client, tables, monkeypatch):
+    monkeypatch.setitem(server.app.config, 'EXPORT_MAX_DOCUMENTS', 1)
+    log_in(client, is_admin=True)
+
+    assert export(client, ids=[1, 2]).status_code == 400
+    assert export(client, user_id=1).status_code == 400
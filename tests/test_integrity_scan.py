@@ -0,0 +1,110 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from envelope import new_data_key
+
+
+class IntegrityTables:
+    """`documents`, `blobs` and `integrity_scan` for the statements scan-integrity runs."""
+
+    def __init__(self, db):
+        self.documents = {}     # id -> (file_path, content_hash, upload_date)
+        self.blobs = {}         # content_hash -> (key_version, wrapped_key)
+        self.scan = {}          # storage_key -> [version, size, status, detail, seen_at]
+        db.on(r'^INSERT INTO integrity_scan', self.record)
+        db.on(r'^SELECT storage_key, version, size FROM integrity_scan', self.known)
+        db.on(r'^UPDATE integrity_scan SET seen_at', self.seen)
+        db.on(r'^DELETE FROM integrity_scan', self.forget)
+        db.on(r'FROM integrity_scan WHERE status <>', self.failed)
+        db.on(r'^SELECT storage_key FROM integrity_scan WHERE storage_key IN', self.scanned)
+        db.on(r'FROM documents WHERE file_path LIKE', self.unmigrated)
+        db.on(r'^SELECT s.storage_key FROM integrity_scan s LEFT JOIN documents', self.orphans)
+        db.on(r'^SELECT d.id, d.file_path FROM documents d LEFT JOIN integrity_scan', self.dangling)
+        db.on(r'FROM blobs WHERE content_hash IN', self.wrapped_keys)
+
+    def record(self, params, cursor):
+        key, version, size, status, detail, _, seen_at = params
+        self.scan[key] = [version, size, status, detail, seen_at]
+
+    def known(self, params, cursor):
+        return [(key, self.scan[key][0], self.scan[key][1]) for key in params if key in self.scan]
+
+    def seen(self, params, cursor):
+        for key in params[1:]:
+            self.scan[key][4] = params[0]
+
+    def forget(self, params, cursor):
+        self.scan = {key: row for key, row in self.scan.items() if row[4] >= params[0]}
+
+    def failed(self, params, cursor):
+        return [(key, row[2], row[3]) for key, row in sorted(self.scan.items()) if row[2] != 'ok']
+
+    def scanned(self, params, cursor):
+        return [(key,) for key in params if key in self.scan]
+
+    def unmigrated(self, params, cursor):
+        return [(doc_id, path, digest, uploaded < params[0])
+                for doc_id, (path, digest, uploaded) in self.documents.items() if path.startswith('/')]
+
+    def orphans(self, params, cursor):
+        paths = {path for path, _, _ in self.documents.values()}
+        return [(key,) for key in sorted(self.scan) if key not in paths]
+
+    def dangling(self, params, cursor):
+        return [(doc_id, path) for doc_id, (path, _, uploaded) in sorted(self.documents.items())
+                if path not in self.scan and uploaded < params[0] and not path.startswith('/')]
+
+    def wrapped_keys(self, params, cursor):
+        return [(digest, *self.blobs[digest]) for digest in params if digest in self.blobs]
+
+
+@pytest.fixture
+def tables(db, storage, keyring, monkeypatch):
+    monkeypatch.setitem(server.app.config, 'UPLOAD_FOLDER', storage.root)
+    return IntegrityTables(db)
+
+
+def store(key, content, data_key=None):
+    server.store_encrypted(io.BytesIO(content), key, data_key=data_key)
+
+
+def test_unmigrated_absolute_paths_are_neither_orphans_nor_dangling(tables):
+    yesterday = datetime.now() - timedelta(days=1)
+    data_key = new_data_key()
+    digest = 'ab' * 32
+    store(server.content_key(digest), b'blob', data_key)
+    tables.blobs[digest] = server.get_keyring().wrap(data_key)
+    store('lab.docx', b'legacy file')
+    store('report.pdf', b'legacy file under the current upload folder')
+    store('stray.bin', b'no document')
+    tables.documents = {
+        1: (server.content_key(digest), digest, yesterday),
+        # Stored in an upload folder that has since moved: relativize-paths keeps the file name
+        2: ('/srv/old/uploads/lab.docx', None, yesterday),
+        3: (f'{server.app.config["UPLOAD_FOLDER"]}/report.pdf', None, yesterday),
+        4: ('/srv/old/uploads/gone.docx', None, yesterday),
+    }
+
+    result = server.app.test_cli_runner().invoke(args=['scan-integrity', '--workers', '1'])
+
+    lines = result.output.splitlines()
+    assert [line for line in lines if line.startswith(('orphaned', 'dangling'))] == [
+        'orphaned: stray.bin',
+        'dangling: document 4: /srv/old/uploads/gone.docx',
+    ]
+    assert lines[-1] == '0 failed, 1 orphaned, 1 dangling'
+    assert result.exit_code == 1
+
+
+def test_relativize_paths_uses_the_same_keys(tables, db):
+    tables.documents = {2: ('/srv/old/uploads/lab.docx', None, datetime.now()),
+                        5: ('/srv/old/uploads/x.pdf', 'cd' * 32, datetime.now())}
+    db.on(r'^SELECT id, file_path, content_hash FROM documents$',
+          lambda params, cursor: [(doc_id, path, digest) for doc_id, (path, digest, _) in tables.documents.items()])
+
+    assert server.app.test_cli_runner().invoke(args=['relativize-paths']).exit_code == 0
+    assert [params for _, params in db.executed('^UPDATE documents SET file_path')] == [
+        ('lab.docx', 2), (server.content_key('cd' * 32), 5)]
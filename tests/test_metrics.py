@@ -0,0 +1,25 @@
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def metrics_enabled():
+    if server.request_metrics is None:
+        pytest.skip('DMS_METRICS=0')
+
+
+def test_metrics_are_hidden_without_a_scrape_token(client, monkeypatch):
+    monkeypatch.setitem(server.app.config, 'METRICS_TOKEN', None)
+
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_need_the_scrape_token(client, monkeypatch):
+    monkeypatch.setitem(server.app.config, 'METRICS_TOKEN', 'scrape-secret')
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b'dms_request_duration_seconds' in response.data
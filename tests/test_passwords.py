@@ -0,0 +1,66 @@
+import pytest
+
+import server
+from audit_log import AuditLogWriter
+from conftest import FakeConnection
+from passwords import PasswordHasher, hash_password, needs_rehash, verify_and_upgrade, verify_password
+from worker_pool import BoundedExecutor
+
+PASSWORD = 'correct horse battery staple'
+ARGON2_PARAMS = {'time_cost': 1, 'memory_cost': 8 * 1024, 'parallelism': 1}
+
+
+@pytest.mark.parametrize('scheme,options', [
+    ('bcrypt', {'bcrypt_rounds': 5}),
+    pytest.param('argon2', {'argon2_params': ARGON2_PARAMS}, marks=pytest.mark.skipif(
+        PasswordHasher is None, reason="needs the argon2-cffi package")),
+])
+def test_legacy_hash_is_upgraded(scheme, options):
+    legacy = hash_password(PASSWORD, 'bcrypt', bcrypt_rounds=4)
+
+    valid, new_hash = verify_and_upgrade(PASSWORD, legacy, scheme, **options)
+
+    assert valid
+    assert new_hash != legacy and verify_password(PASSWORD, new_hash)
+    assert not needs_rehash(new_hash, scheme, **options)
+    assert verify_and_upgrade(PASSWORD, new_hash, scheme, **options) == (True, None)
+
+
+def test_wrong_password_is_not_rehashed():
+    legacy = hash_password(PASSWORD, 'bcrypt', bcrypt_rounds=4)
+
+    assert verify_and_upgrade('wrong', legacy, 'bcrypt', bcrypt_rounds=5) == (False, None)
+
+
+@pytest.fixture
+def user(client, db, tmp_path, monkeypatch):
+    """User 1 with a bcrypt hash of cost 4, while the app hashes with cost 5."""
+    monkeypatch.setitem(server.app.config, 'PASSWORD_HASH_SCHEME', 'bcrypt')
+    monkeypatch.setitem(server.app.config, 'BCRYPT_ROUNDS', 5)
+    monkeypatch.setattr(server.get_password_pool, 'pool', BoundedExecutor('password', max_workers=1),
+                        raising=False)
+    writer = AuditLogWriter(lambda: FakeConnection(db), spill_path=str(tmp_path / 'activity_logs.spill'))
+    monkeypatch.setattr(server.get_audit_log, 'writer', writer, raising=False)
+    stored = hash_password(PASSWORD, 'bcrypt', bcrypt_rounds=4)
+    db.on(r'FROM users WHERE email = %s', lambda params, cursor: [(1, 'user@example.com', stored, True, False)])
+    yield stored
+    writer.close()
+    server.get_password_pool.pool.shutdown()
+
+
+def log_in(client, password):
+    return client.post('/login', json={'email': 'user@example.com', 'password': password, 'role': 'user'})
+
+
+def test_login_rewrites_a_legacy_hash(client, db, user):
+    assert log_in(client, PASSWORD).status_code == 200
+
+    [(query, (new_hash, user_id, old_hash))] = db.executed(r'^UPDATE users SET password')
+    assert (user_id, old_hash) == (1, user)
+    assert new_hash.startswith('$2b$05$') and verify_password(PASSWORD, new_hash)
+
+
+def test_failed_login_leaves_the_hash_alone(client, db, user):
+    assert log_in(client, 'wrong').status_code == 401
+
+    assert not db.executed(r'^UPDATE users SET password')
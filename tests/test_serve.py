@@ -0,0 +1,51 @@
+import http.client
+import threading
+import time
+
+import serve
+import server
+from auth_tokens import mint_access_token
+
+ADMIN = {'id': 1, 'email': 'admin@example.com', 'is_admin': True}
+
+
+def test_graceful_stop_ends_open_activity_streams(client, db, monkeypatch):
+    monkeypatch.delattr(server.get_activity_feed, 'poller', raising=False)
+    monkeypatch.setitem(server.app.config, 'ACTIVITY_STREAM_POLL_INTERVAL', 3600)
+    # Keep-alives would fail against a closed connection and end a stream that outlived the test
+    monkeypatch.setitem(server.app.config, 'ACTIVITY_STREAM_KEEPALIVE', 0.5)
+    sock = serve.listen('127.0.0.1', 0, 16)
+    worker = serve.WorkerServer('127.0.0.1', sock.getsockname()[1], server.app,
+                                handler=serve.WorkerRequestHandler, fd=sock.fileno(), threads=4)
+    sock.close()
+
+    def run():
+        # As run_worker does: server_close() joins the request threads still running
+        try:
+            worker.serve_forever()
+        finally:
+            worker.server_close()
+
+    serving = threading.Thread(target=run, daemon=True)
+    serving.start()
+    token = mint_access_token(server.app.config['SECRET_KEY'], ADMIN, 900)
+    connection = http.client.HTTPConnection('127.0.0.1', worker.server_address[1], timeout=10)
+    connection.request('GET', '/admin/activity/stream', headers={'Authorization': f'Bearer {token}'})
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.readline() == b'retry: 3000\n'
+
+    # What the worker's SIGTERM handler runs on a reload or shutdown
+    started = time.monotonic()
+    threading.Thread(target=serve.shut_down, args=(worker, server.app), daemon=True).start()
+    serving.join(timeout=5)
+    stopped = not serving.is_alive()
+    if not stopped:
+        response.close()
+        connection.close()
+        serving.join()
+
+    assert stopped and time.monotonic() - started < 5
+    # The stream ended cleanly rather than being cut off
+    assert response.read().endswith(b'\n')
+    connection.close()
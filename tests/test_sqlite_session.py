@@ -0,0 +1,64 @@
+import sqlite3
+import time
+
+import pytest
+
+from sqlite_session import SQLiteSessionInterface
+
+
+@pytest.fixture
+def interfaces(tmp_path):
+    """Two interfaces on one session file, as two worker processes would have."""
+    path = str(tmp_path / 'sessions.sqlite3')
+    return (SQLiteSessionInterface(path, sweep_interval=0), SQLiteSessionInterface(path, sweep_interval=0))
+
+
+def test_write_elsewhere_invalidates_only_that_session(interfaces):
+    first, second = interfaces
+    expires = time.time() + 3600
+    for sid in ('a', 'b', 'c'):
+        first.store(sid, {'user': sid}, expires)
+        second.load(sid)
+
+    first.store('a', {'user': 'a', 'theme': 'dark'}, expires)
+    first.delete('b')
+
+    assert second.load('a')[0] == {'user': 'a', 'theme': 'dark'}
+    assert second.load('b') is None
+    misses = second.stats()['misses']
+    assert second.load('c')[0] == {'user': 'c'}
+    assert second.stats()['misses'] == misses
+    assert second.stats()['invalidations'] == 2
+
+
+def test_own_writes_stay_cached(interfaces):
+    first, second = interfaces
+    first.store('a', {'user': 'a'}, time.time() + 3600)
+    second.store('b', {'user': 'b'}, time.time() + 3600)
+
+    first.load('a')
+    stats = first.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (1, 0, 0)
+
+
+def test_deleted_sessions_are_swept(interfaces):
+    first, _ = interfaces
+    first.store('a', {'user': 'a'}, time.time() + 3600)
+    first.delete('a')
+
+    assert first.sweep() == 1
+
+
+def test_session_file_without_write_numbers_is_upgraded(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL) "
+                       "WITHOUT ROWID")
+    connection.execute("INSERT INTO sessions VALUES ('a', '{\"user\": \"a\"}', ?)", (time.time() + 3600,))
+    connection.commit()
+    connection.close()
+
+    interface = SQLiteSessionInterface(path, sweep_interval=0)
+    assert interface.load('a')[0] == {'user': 'a'}
+    interface.store('a', {'user': 'a', 'theme': 'dark'}, time.time() + 3600)
+    assert interface.load('a')[0] == {'user': 'a', 'theme': 'dark'}
@@ -0,0 +1,170 @@
+import io
+import os
+
+import pytest
+
+pytest.importorskip('boto3')
+from botocore.exceptions import ClientError  # noqa: E402
+
+from chunked_crypto import encrypt_stream, iter_decrypt  # noqa: E402
+from storage import S3Storage, S3Writer  # noqa: E402
+
+KEY = bytes(range(32))
+
+
+class StubS3Client:
+    """Keeps objects in memory and records every call, like the subset of the S3 API the storage uses."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def called(self, name):
+        return [kwargs for call, kwargs in self.calls if call == name]
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append(('put_object', {'Key': Key}))
+        self.objects[Key] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f'upload-{len(self.uploads) + 1}'
+        self.calls.append(('create_multipart_upload', {'Key': Key}))
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append(('upload_part', {'PartNumber': PartNumber, 'Body': Body}))
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append(('complete_multipart_upload', {'Parts': MultipartUpload['Parts']}))
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append(('abort_multipart_upload', {'UploadId': UploadId}))
+        del self.uploads[UploadId]
+
+    def head_object(self, Bucket, Key):
+        self.calls.append(('head_object', {'Key': Key}))
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(self.objects[Key]), 'ETag': '"0123abcd"'}
+
+    def get_object(self, Bucket, Key, Range):
+        self.calls.append(('get_object', {'Key': Key, 'Range': Range}))
+        start = int(Range.removeprefix('bytes=').rstrip('-'))
+        return {'Body': io.BytesIO(self.objects[Key][start:])}
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append(('delete_object', {'Key': Key}))
+        self.objects.pop(Key, None)
+
+
+@pytest.fixture
+def client():
+    return StubS3Client()
+
+
+@pytest.fixture
+def storage(client):
+    storage = S3Storage('bucket', prefix='dms', region='us-east-1', access_key='test', secret_key='test')
+    storage.client = client
+    # Far below S3's minimum, so a few bytes make a multipart upload
+    storage.part_size = 10
+    return storage
+
+
+def test_small_object_is_sent_with_one_put(client):
+    writer = S3Writer(client, 'bucket', 'key', part_size=10)
+    writer.write(b'short')
+    writer.commit()
+
+    assert [call for call, kwargs in client.calls] == ['put_object']
+    assert client.objects['key'] == b'short'
+
+
+def test_multipart_upload_sends_the_patched_head_last(client):
+    writer = S3Writer(client, 'bucket', 'key', part_size=10)
+    for piece in [b'0123456', b'789abcdefghij', b'klmnopqrstuvwxyz']:
+        writer.write(piece)
+    # Only whole parts after the head are sent while writing
+    assert [(kwargs['PartNumber'], len(kwargs['Body'])) for kwargs in client.called('upload_part')] == [
+        (2, 10), (3, 10)]
+
+    writer.seek(2)
+    writer.write(b'--')
+    writer.seek(0, os.SEEK_END)
+    writer.write(b'!')
+    writer.commit()
+
+    assert [kwargs['PartNumber'] for kwargs in client.called('upload_part')] == [2, 3, 4, 1]
+    assert client.called('complete_multipart_upload')[0]['Parts'] == [
+        {'PartNumber': number, 'ETag': f'"etag-{number}"'} for number in (1, 2, 3, 4)]
+    assert client.objects['key'] == b'01--456789abcdefghijklmnopqrstuvwxyz!'
+
+
+def test_writer_only_seeks_within_the_head(client):
+    writer = S3Writer(client, 'bucket', 'key', part_size=10)
+    writer.write(b'x' * 25)
+
+    with pytest.raises(io.UnsupportedOperation):
+        writer.seek(12)
+    writer.seek(8)
+    with pytest.raises(io.UnsupportedOperation):
+        writer.write(b'abc')
+
+
+def test_failed_write_aborts_the_upload(storage, client):
+    with pytest.raises(RuntimeError):
+        with storage.writer('blob') as f:
+            f.write(b'x' * 25)
+            raise RuntimeError("encryption failed")
+
+    assert len(client.called('abort_multipart_upload')) == 1
+    assert not client.called('complete_multipart_upload')
+    assert not client.uploads and not client.objects
+
+
+def test_encrypted_blob_round_trips(storage, client):
+    plaintext = os.urandom(3000)
+    # The header is patched once the content is written, so it must fit in the first part
+    storage.part_size = 1000
+    with storage.writer('blobs/ab') as f:
+        encrypt_stream(io.BytesIO(plaintext), f, KEY, chunk_size=1024)
+
+    assert 'dms/blobs/ab' in client.objects
+    fp, info = storage.open('blobs/ab')
+    assert info.size == len(client.objects['dms/blobs/ab'])
+    assert b''.join(iter_decrypt(fp, KEY)) == plaintext
+
+
+def test_reads_are_ranged_gets_from_the_current_offset(storage, client):
+    client.objects['dms/doc'] = bytes(range(100))
+    fp, info = storage.open('doc')
+
+    assert (info.size, info.version) == (100, '0123abcd')
+    fp.seek(40)
+    assert fp.read(5) + fp.read(5) == bytes(range(40, 50))
+    fp.seek(90)
+    assert fp.read() == bytes(range(90, 100))
+    assert fp.read() == b''
+    assert [kwargs['Range'] for kwargs in client.called('get_object')] == ['bytes=40-', 'bytes=90-']
+
+
+def test_exists_and_delete(storage, client):
+    client.objects['dms/doc'] = b'data'
+
+    assert storage.exists('doc')
+    storage.delete('doc')
+    assert not storage.exists('doc')
+    with pytest.raises(FileNotFoundError):
+        storage.open('doc')
+    assert client.called('delete_object') == [{'Key': 'dms/doc'}]
+
+
+def test_keys_outside_the_prefix_are_rejected(storage):
+    with pytest.raises(ValueError):
+        storage.exists('../other')
@@ -0,0 +1,64 @@
+import io
+import threading
+
+import pytest
+
+import server
+from conftest import log_in
+from worker_pool import BoundedExecutor, PoolSaturated
+
+
+@pytest.fixture
+def gate():
+    gate = threading.Event()
+    yield gate
+    gate.set()
+
+
+def busy_pool(gate, **options):
+    """A thread pool whose every worker and queue slot is taken by a job waiting on `gate`."""
+    pool = BoundedExecutor('test', **{'max_workers': 1, 'max_queue': 1, **options})
+    jobs = [pool.submit(gate.wait) for _ in range(pool.max_workers + pool.max_queue)]
+    return pool, jobs
+
+
+def test_full_pool_rejects_work(gate):
+    pool, jobs = busy_pool(gate, retry_after=7)
+
+    with pytest.raises(PoolSaturated) as error:
+        pool.submit(int)
+    assert error.value.retry_after == 7
+    with pytest.raises(PoolSaturated):
+        pool.check_capacity()
+    assert pool.stats()['rejected'] == 2
+
+    gate.set()
+    assert [job.result() for job in jobs] == [True, True]
+    assert pool.submit(int, '3').result() == 3
+    assert pool.stats()['completed'] == 3
+    pool.shutdown()
+
+
+def test_waiting_submit_gets_the_freed_slot(gate):
+    pool, jobs = busy_pool(gate)
+    threading.Timer(0.05, gate.set).start()
+
+    assert pool.run(int, '4') == 4
+    assert pool.stats()['wait_seconds_total'] > 0
+    pool.shutdown()
+
+
+def test_batch_upload_gets_503_while_the_upload_pool_is_full(client, document_tables, gate, monkeypatch):
+    pool, _ = busy_pool(gate, retry_after=5)
+    monkeypatch.setattr(server.get_upload_pool, 'pool', pool, raising=False)
+    log_in(client)
+
+    response = client.post('/upload_documents', data={'files': [(io.BytesIO(b'text'), 'a.txt')]},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert response.get_json()['message'] == "The test pool is busy, retry in 5 seconds"
+    assert not document_tables.documents
+    gate.set()
+    pool.shutdown()
@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    """Raised when a pool has no room for more work; retry after ``retry_after`` seconds."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"The {name} pool is busy, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+def _timed(fn, args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class BoundedExecutor:
+    """Thread or process pool with a bounded backlog and per-job timing.
+
+    At most ``max_workers + max_queue`` jobs are admitted at once. ``submit``
+    blocks for a free slot when ``wait`` is true and raises PoolSaturated
+    otherwise. Jobs sent to a process pool must be picklable top-level
+    functions.
+    """
+
+    def __init__(self, name, max_workers=None, max_queue=64, kind='thread', retry_after=1):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.name = name
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.kind = kind
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_workers + max_queue)
+        self._executor = None
+        self._pid = None
+
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._max_job_seconds = 0.0
+        self._wait_seconds = 0.0
+
+    def _get_executor(self):
+        # Executors (and their worker threads/processes) do not survive fork(),
+        # so each worker process of the web server starts its own.
+        if self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._pid != os.getpid():
+                if self._pid is not None:
+                    self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+                    self._pending = 0
+                if self.kind == 'process':
+                    # Never fork a multi-threaded server process
+                    self._executor = ProcessPoolExecutor(
+                        self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+        return self._executor
+
+    def check_capacity(self):
+        """Raise PoolSaturated if every worker and queue slot is taken."""
+        if self._pid == os.getpid() and self._pending >= self.max_workers + self.max_queue:
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturated(self.name, self.retry_after)
+
+    def submit(self, fn, *args, wait=False):
+        """Schedule ``fn(*args)`` and return a Future for its result."""
+        executor = self._get_executor()
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=wait):
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturated(self.name, self.retry_after)
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+            self._wait_seconds += waited
+
+        outer = Future()
+        slots = self._slots
+
+        def done(inner):
+            slots.release()
+            error = None if inner.cancelled() else inner.exception()
+            with self._lock:
+                self._pending -= 1
+                if inner.cancelled():
+                    return
+                if error is None:
+                    result, seconds = inner.result()
+                    self._completed += 1
+                    self._busy_seconds += seconds
+                    self._max_job_seconds = max(self._max_job_seconds, seconds)
+                else:
+                    self._failed += 1
+            try:
+                if error is None:
+                    outer.set_result(result)
+                else:
+                    outer.set_exception(error)
+            except InvalidStateError:
+                pass  # the caller cancelled while the job was finishing
+
+        try:
+            inner = executor.submit(_timed, fn, args)
+        except Exception:
+            slots.release()
+            with self._lock:
+                self._pending -= 1
+            raise
+        # Cancelling the returned future drops the job if it has not started yet
+        outer.add_done_callback(lambda f: f.cancelled() and inner.cancel())
+        inner.add_done_callback(done)
+        return outer
+
+    def run(self, fn, *args):
+        """Run ``fn(*args)`` on the pool, waiting for a slot, and return its result."""
+        return self.submit(fn, *args, wait=True).result()
+
+    def shutdown(self):
+        if self._pid == os.getpid() and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pid = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'pending': self._pending,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'busy_seconds_total': round(self._busy_seconds, 6),
+                'job_seconds_max': round(self._max_job_seconds, 6),
+                'job_seconds_avg': round(self._busy_seconds / self._completed, 6) if self._completed else 0.0,
+                'wait_seconds_total': round(self._wait_seconds, 6),
+            }
@@ -0,0 +1,59 @@
+"""ZIP archives produced as a stream of bytes, without seeking or temporary files.
+
+zipfile writes to an unseekable file by putting each entry's CRC and sizes
+in a data descriptor after its data. The sink below collects what zipfile
+writes, and ``iter_zip`` hands it on after every chunk, so memory stays at
+about one chunk however large the archive grows.
+"""
+import io
+import zipfile
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer that zipfile writes the archive into."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries, compression=zipfile.ZIP_STORED):
+    """Yield the bytes of a ZIP archive holding ``entries``.
+
+    ``entries`` yields ``(name, size, date_time, chunks)``, where ``size`` is
+    the expected uncompressed size (it decides whether the entry needs
+    ZIP64 fields) and ``chunks`` is an iterable of bytes. Entries are read
+    lazily, one at a time.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=compression, allowZip64=True) as zf:
+        for name, size, date_time, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.compress_type = compression
+            info.file_size = size
+            with zf.open(info, 'w') as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    # The central directory
+    yield sink.drain()